@@ -4,11 +4,16 @@ Supports both OpenAI and Ollama (open-source) providers
 """
 
 import os
-import asyncio
+import json
 import httpx
-from typing import Dict, Any, Optional, Literal
+from typing import AsyncIterator, Dict, Any, Optional, Literal
 from enum import Enum
 
+from llm_client import KeepAlivePolicy, create_http_client, generation_stats
+from completion_cache import CompletionCache, completion_cache, completion_cache_key
+from metrics import LLM_UPSTREAM_ERRORS, StreamTimer, upstream_error_type
+from model_registry import ModelRegistry, ModelRegistryError
+
 
 class LLMProvider(str, Enum):
     """Supported LLM providers"""
@@ -21,28 +26,55 @@ class LLMClient:
     """
     Unified LLM client that supports both OpenAI and Ollama.
     Automatically falls back to Ollama if OpenAI is not configured.
+    
+    Both providers are called natively async. Ollama requests go through one
+    pooled httpx.AsyncClient, which can be shared with OllamaClient; OpenAI
+    requests use AsyncOpenAI on its own pooled client.
     """
     
-    def __init__(self, provider: str = "auto"):
+    def __init__(
+        self,
+        provider: str = "auto",
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[CompletionCache] = None,
+    ):
         """
         Initialize LLM client.
         
         Args:
             provider: "openai", "ollama", or "auto" (default)
+            http_client: Shared HTTP client for Ollama requests (optional).
+                A client passed in here is owned by the caller.
+            cache: Completion cache (optional, defaults to the shared process cache)
         """
         self.provider_type = provider
         self.openai_client = None
         self.ollama_url = os.getenv("OLLAMA_URL", "http://ollama:11434")
         self.ollama_model = os.getenv("OLLAMA_MODEL", "llama2")
         self.vision_model = os.getenv("OLLAMA_VISION_MODEL", "llava")
+        self.keep_alive = KeepAlivePolicy.from_env()
+        self.openai_model = os.getenv("OPENAI_MODEL", "gpt-4")
+        self._http_client = http_client
+        self._owns_http_client = http_client is None
+        self.completion_cache = cache or completion_cache
+        # Cached /api/tags catalog with per-model metadata
+        self.registry = ModelRegistry(self)
+        
+        # Per-operation timeouts (seconds)
+        connect_timeout = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5"))
+        self.generation_timeout = httpx.Timeout(
+            float(os.getenv("OLLAMA_GENERATION_TIMEOUT", "300")), connect=connect_timeout
+        )
+        self.metadata_timeout = httpx.Timeout(
+            float(os.getenv("OLLAMA_METADATA_TIMEOUT", "5")), connect=connect_timeout
+        )
         
         # Determine which provider to use
         if provider == "auto":
             openai_key = os.getenv("OPENAI_API_KEY")
             if openai_key:
                 try:
-                    from openai import OpenAI
-                    self.openai_client = OpenAI(api_key=openai_key)
+                    self.openai_client = self._create_openai_client(openai_key)
                     self.provider_type = "openai"
                     print("Using OpenAI provider")
                 except Exception as e:
@@ -58,8 +90,34 @@ class LLMClient:
             openai_key = os.getenv("OPENAI_API_KEY")
             if not openai_key:
                 raise ValueError("OPENAI_API_KEY required when using OpenAI provider")
-            from openai import OpenAI
-            self.openai_client = OpenAI(api_key=openai_key)
+            self.openai_client = self._create_openai_client(openai_key)
+    
+    @staticmethod
+    def _create_openai_client(api_key: str):
+        """Create an AsyncOpenAI client on a dedicated connection pool"""
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=api_key, http_client=create_http_client())
+    
+    @property
+    def default_model(self) -> str:
+        """Default chat model of the active provider"""
+        return self.openai_model if self.provider_type == "openai" else self.ollama_model
+    
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Shared Ollama connection pool, created on first use"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = create_http_client()
+            self._owns_http_client = True
+        return self._http_client
+    
+    async def aclose(self):
+        """Close the OpenAI client and the Ollama connection pool if this client owns it"""
+        if self.openai_client is not None:
+            await self.openai_client.close()
+        if self._http_client is not None and self._owns_http_client:
+            await self._http_client.aclose()
+        self._http_client = None
     
     async def check_model_available(self, model: Optional[str] = None) -> bool:
         """
@@ -69,30 +127,24 @@ class LLMClient:
             model: Model name (optional, uses default)
             
         Returns:
-            True if model is available, False otherwise
+            True if model is available, False if it isn't pulled or Ollama
+            can't be reached (and no cached model list is usable)
         """
         if self.provider_type != "ollama":
             return True  # Not applicable for OpenAI
         
-        model = model or self.ollama_model
-        
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.ollama_url}/api/tags")
-                if response.status_code == 200:
-                    models = response.json().get("models", [])
-                    model_names = [m.get("name", "") for m in models]
-                    return model in model_names
-                return False
-        except:
-            return False
+            return await self.registry.get(model or self.ollama_model) is not None
+        except ModelRegistryError:
+            return False  # Logged by the registry
     
     async def chat_completion(
         self,
         messages: list,
         model: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 500
+        max_tokens: int = 500,
+        cache: Optional[bool] = None,
     ) -> str:
         """
         Get chat completion from LLM.
@@ -102,10 +154,34 @@ class LLMClient:
             model: Model name (optional, uses default for provider)
             temperature: Sampling temperature
             max_tokens: Maximum tokens to generate
+            cache: Serve from / store in the completion cache
+                (default: only when temperature is 0)
             
         Returns:
             Generated text response
         """
+        if cache is None:
+            cache = temperature == 0
+        if not cache:
+            return await self._chat_completion(messages, model, temperature, max_tokens)
+        
+        cache_model = model or self.default_model
+        key = completion_cache_key(self.provider_type, cache_model, messages, temperature, max_tokens)
+        return await self.completion_cache.get_or_compute(
+            key,
+            lambda: self._chat_completion(messages, model, temperature, max_tokens),
+            provider=self.provider_type,
+            model=cache_model,
+        )
+    
+    async def _chat_completion(
+        self,
+        messages: list,
+        model: Optional[str],
+        temperature: float,
+        max_tokens: int
+    ) -> str:
+        """Uncached chat completion for the configured provider"""
         if self.provider_type == "openai":
             return await self._openai_chat(messages, model, temperature, max_tokens)
         else:
@@ -122,23 +198,141 @@ class LLMClient:
         if not self.openai_client:
             raise ValueError("OpenAI client not initialized")
         
-        model = model or "gpt-4"
-        loop = asyncio.get_event_loop()
+        response = await self.openai_client.chat.completions.create(
+            model=model or self.openai_model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        
+        if not response or not response.choices:
+            raise ValueError("OpenAI API returned empty response")
         
-        def make_call():
-            return self.openai_client.chat.completions.create(
+        return (response.choices[0].message.content or "").strip()
+    
+    async def stream_chat(
+        self,
+        messages: list,
+        model: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        stats: Optional[Dict[str, Any]] = None,
+        route_key: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream chat completion from the configured provider.
+        
+        Same contract as OllamaClient.stream_chat, so either client can back
+        the SSE endpoint. Closing the iterator aborts the upstream request.
+        
+        Args:
+            messages: List of message dicts with 'role' and 'content'
+            model: Model name (optional, uses default for provider)
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+            stats: Filled with Ollama's timing stats once generation completes;
+                left empty for OpenAI (optional)
+            route_key: Accepted for compatibility with OllamaClient; this
+                client talks to a single host (optional)
+            
+        Yields:
+            Text chunks as they arrive
+        """
+        if self.provider_type == "openai":
+            stream = self._openai_stream(messages, model, temperature, max_tokens)
+        else:
+            stream = self._ollama_stream(messages, model, temperature, max_tokens, stats)
+        async for chunk in stream:
+            yield chunk
+    
+    async def _openai_stream(
+        self,
+        messages: list,
+        model: Optional[str],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> AsyncIterator[str]:
+        """OpenAI streaming chat completion"""
+        if not self.openai_client:
+            raise ValueError("OpenAI client not initialized")
+        
+        model = model or self.openai_model
+        timer = StreamTimer("openai", model)
+        try:
+            stream = await self.openai_client.chat.completions.create(
                 model=model,
                 messages=messages,
                 temperature=temperature,
-                max_tokens=max_tokens
+                stream=True,
+                **({"max_tokens": max_tokens} if max_tokens else {})
             )
+        except Exception as e:
+            LLM_UPSTREAM_ERRORS.inc(provider="openai", type=upstream_error_type(e))
+            raise
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    timer.token()
+                    yield chunk.choices[0].delta.content
+            timer.finish()
+        except Exception as e:
+            LLM_UPSTREAM_ERRORS.inc(provider="openai", type=upstream_error_type(e))
+            raise
+        finally:
+            await stream.close()
+    
+    async def _ollama_stream(
+        self,
+        messages: list,
+        model: Optional[str],
+        temperature: float,
+        max_tokens: Optional[int],
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """Ollama streaming chat completion via /api/chat"""
+        model = model or self.ollama_model
         
-        response = await loop.run_in_executor(None, make_call)
-        
-        if not response or not response.choices:
-            raise ValueError("OpenAI API returned empty response")
-        
-        return response.choices[0].message.content.strip()
+        try:
+            async with self.http_client.stream(
+                "POST",
+                f"{self.ollama_url}/api/chat",
+                json={
+                    "model": model,
+                    "messages": messages,
+                    "stream": True,
+                    "keep_alive": self.keep_alive.for_model(model),
+                    "options": {
+                        "temperature": temperature,
+                        **({"num_predict": max_tokens} if max_tokens else {})
+                    }
+                },
+                timeout=self.generation_timeout,
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    content = data.get("message", {}).get("content")
+                    if content:
+                        yield content
+                    if data.get("done", False):
+                        if stats is not None:
+                            stats.update(generation_stats(data, model))
+                        break
+                        
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                raise ValueError(
+                    f"Ollama model '{model}' not found. "
+                    f"Please pull it first: docker exec sigmachain-ollama ollama pull {model}"
+                )
+            raise ValueError(f"Ollama API error ({e.response.status_code}): {str(e)}")
+        except httpx.RequestError as e:
+            raise ValueError(f"Failed to connect to Ollama at {self.ollama_url}: {str(e)}")
     
     async def _ollama_chat(
         self,
@@ -165,65 +359,69 @@ class LLMClient:
         
         prompt = "\n\n".join(prompt_parts)
         
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            try:
-                # First, try /api/generate (more compatible)
-                response = await client.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": model,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": temperature,
-                            "num_predict": max_tokens
-                        }
+        client = self.http_client
+        try:
+            # First, try /api/generate (more compatible)
+            response = await client.post(
+                f"{self.ollama_url}/api/generate",
+                json={
+                    "model": model,
+                    "prompt": prompt,
+                    "stream": False,
+                    "keep_alive": self.keep_alive.for_model(model),
+                    "options": {
+                        "temperature": temperature,
+                        "num_predict": max_tokens
                     }
-                )
-                response.raise_for_status()
-                data = response.json()
-                result = data.get("response", "").strip()
-                
-                if result:
-                    return result
-                
-                # If empty, try /api/chat as fallback
-                ollama_messages = []
-                for msg in messages:
-                    role = msg.get("role", "user")
-                    content = msg.get("content", "")
-                    if role in ["system", "user", "assistant"]:
-                        ollama_messages.append({
-                            "role": role,
-                            "content": content
-                        })
-                
-                response = await client.post(
-                    f"{self.ollama_url}/api/chat",
-                    json={
-                        "model": model,
-                        "messages": ollama_messages,
-                        "stream": False,
-                        "options": {
-                            "temperature": temperature,
-                            "num_predict": max_tokens
-                        }
+                },
+                timeout=self.generation_timeout,
+            )
+            response.raise_for_status()
+            data = response.json()
+            result = data.get("response", "").strip()
+            
+            if result:
+                return result
+            
+            # If empty, try /api/chat as fallback
+            ollama_messages = []
+            for msg in messages:
+                role = msg.get("role", "user")
+                content = msg.get("content", "")
+                if role in ["system", "user", "assistant"]:
+                    ollama_messages.append({
+                        "role": role,
+                        "content": content
+                    })
+            
+            response = await client.post(
+                f"{self.ollama_url}/api/chat",
+                json={
+                    "model": model,
+                    "messages": ollama_messages,
+                    "stream": False,
+                    "keep_alive": self.keep_alive.for_model(model),
+                    "options": {
+                        "temperature": temperature,
+                        "num_predict": max_tokens
                     }
-                )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("message", {}).get("content", "").strip()
+                },
+                timeout=self.generation_timeout,
+            )
+            response.raise_for_status()
+            data = response.json()
+            return data.get("message", {}).get("content", "").strip()
                 
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    # Model might not be loaded
-                    raise ValueError(
-                        f"Ollama model '{model}' not found. "
-                        f"Please pull it first: docker exec sigmachain-ollama ollama pull {model}"
-                    )
-                raise ValueError(f"Ollama API error ({e.response.status_code}): {str(e)}")
-            except httpx.RequestError as e:
-                raise ValueError(f"Failed to connect to Ollama at {self.ollama_url}: {str(e)}")
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                # Model might not be loaded
+                raise ValueError(
+                    f"Ollama model '{model}' not found. "
+                    f"Please pull it first: docker exec sigmachain-ollama ollama pull {model}"
+                )
+            raise ValueError(f"Ollama API error ({e.response.status_code}): {str(e)}")
+        except httpx.RequestError as e:
+            raise ValueError(f"Failed to connect to Ollama at {self.ollama_url}: {str(e)}")
     
     async def vision_completion(
         self,
@@ -260,38 +458,32 @@ class LLMClient:
         if not self.openai_client:
             raise ValueError("OpenAI client not initialized")
         
-        model = model or "gpt-4o"
-        loop = asyncio.get_event_loop()
-        
-        def make_call():
-            return self.openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": text_prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/{image_format};base64,{image_base64}"
-                                }
+        response = await self.openai_client.chat.completions.create(
+            model=model or "gpt-4o",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": text_prompt
+                        },
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/{image_format};base64,{image_base64}"
                             }
-                        ]
-                    }
-                ],
-                max_tokens=1000
-            )
-        
-        response = await loop.run_in_executor(None, make_call)
+                        }
+                    ]
+                }
+            ],
+            max_tokens=1000
+        )
         
         if not response or not response.choices:
             raise ValueError("OpenAI API returned empty response")
         
-        return response.choices[0].message.content.strip()
+        return (response.choices[0].message.content or "").strip()
     
     async def _ollama_vision(
         self,
@@ -303,51 +495,55 @@ class LLMClient:
         """Ollama vision completion (using llava model)"""
         model = model or self.vision_model
         
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            try:
-                # Try /api/generate first (more compatible)
-                response = await client.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": model,
-                        "prompt": text_prompt,
-                        "images": [image_base64],
-                        "stream": False
-                    }
-                )
-                response.raise_for_status()
-                data = response.json()
-                result = data.get("response", "").strip()
-                
-                if result:
-                    return result
+        client = self.http_client
+        try:
+            # Try /api/generate first (more compatible)
+            response = await client.post(
+                f"{self.ollama_url}/api/generate",
+                json={
+                    "model": model,
+                    "prompt": text_prompt,
+                    "images": [image_base64],
+                    "stream": False,
+                    "keep_alive": self.keep_alive.for_model(model),
+                },
+                timeout=self.generation_timeout,
+            )
+            response.raise_for_status()
+            data = response.json()
+            result = data.get("response", "").strip()
+            
+            if result:
+                return result
+            
+            # Fallback to /api/chat
+            response = await client.post(
+                f"{self.ollama_url}/api/chat",
+                json={
+                    "model": model,
+                    "messages": [
+                        {
+                            "role": "user",
+                            "content": text_prompt,
+                            "images": [image_base64]
+                        }
+                    ],
+                    "stream": False,
+                    "keep_alive": self.keep_alive.for_model(model),
+                },
+                timeout=self.generation_timeout,
+            )
+            response.raise_for_status()
+            data = response.json()
+            return data.get("message", {}).get("content", "").strip()
                 
-                # Fallback to /api/chat
-                response = await client.post(
-                    f"{self.ollama_url}/api/chat",
-                    json={
-                        "model": model,
-                        "messages": [
-                            {
-                                "role": "user",
-                                "content": text_prompt,
-                                "images": [image_base64]
-                            }
-                        ],
-                        "stream": False
-                    }
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                raise ValueError(
+                    f"Ollama vision model '{model}' not found. "
+                    f"Please pull it first: docker exec sigmachain-ollama ollama pull {model}"
                 )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("message", {}).get("content", "").strip()
-                
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    raise ValueError(
-                        f"Ollama vision model '{model}' not found. "
-                        f"Please pull it first: docker exec sigmachain-ollama ollama pull {model}"
-                    )
-                raise ValueError(f"Ollama API error ({e.response.status_code}): {str(e)}")
-            except httpx.RequestError as e:
-                raise ValueError(f"Failed to connect to Ollama at {self.ollama_url}: {str(e)}")
+            raise ValueError(f"Ollama API error ({e.response.status_code}): {str(e)}")
+        except httpx.RequestError as e:
+            raise ValueError(f"Failed to connect to Ollama at {self.ollama_url}: {str(e)}")
 
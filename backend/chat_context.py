@@ -0,0 +1,121 @@
+"""
+Context window assembly for chat completions
+"""
+
+import os
+from typing import Dict, List, Optional, Sequence, Any
+
+# Rough heuristic for English text with Llama-style tokenizers
+CHARS_PER_TOKEN = 4
+# Role markers and separators the chat template adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+RETRIEVED_PREFIX = "Possibly relevant messages from earlier conversations:"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens a message will take in the prompt.
+
+    This deliberately avoids running a tokenizer: it only needs to be close
+    enough to keep prompts inside the budget, and it runs on every turn.
+    """
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextBuilder:
+    """
+    Builds the message list sent to the LLM for a chat turn.
+
+    The system prompt and the latest user turn are always included. Older
+    messages are added newest-first until either the message limit or the
+    token budget is reached, so the cost of a turn stays flat as a thread
+    grows. Messages retrieved from older conversations get a separate, smaller
+    budget so they never crowd out the recent history. When the model's
+    context window is known, the budget is capped to fit it with room left
+    for the reply, so Ollama never truncates the start of the prompt.
+    """
+
+    def __init__(
+        self,
+        max_messages: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        system_prompt: Optional[str] = None,
+        max_retrieved_tokens: Optional[int] = None,
+        response_tokens: Optional[int] = None,
+    ):
+        """
+        Initialize context builder.
+
+        Args:
+            max_messages: Maximum history messages to include (CHAT_CONTEXT_MAX_MESSAGES, default 50)
+            max_tokens: Prompt token budget (CHAT_CONTEXT_MAX_TOKENS, default 4096)
+            system_prompt: System prompt sent first on every turn (CHAT_SYSTEM_PROMPT, optional)
+            max_retrieved_tokens: Budget for retrieved messages (CHAT_CONTEXT_RETRIEVED_TOKENS, default 512)
+            response_tokens: Part of the model's context window kept free for the
+                reply (CHAT_CONTEXT_RESPONSE_TOKENS, default 1024)
+        """
+        self.max_messages = max_messages or int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", "50"))
+        self.max_tokens = max_tokens or int(os.getenv("CHAT_CONTEXT_MAX_TOKENS", "4096"))
+        self.system_prompt = system_prompt if system_prompt is not None else os.getenv("CHAT_SYSTEM_PROMPT", "")
+        self.max_retrieved_tokens = max_retrieved_tokens or int(os.getenv("CHAT_CONTEXT_RETRIEVED_TOKENS", "512"))
+        self.response_tokens = response_tokens or int(os.getenv("CHAT_CONTEXT_RESPONSE_TOKENS", "1024"))
+
+    def build(
+        self,
+        history: Sequence[Any],
+        content: str,
+        summary: Optional[str] = None,
+        retrieved: Optional[Sequence[Any]] = None,
+        context_length: Optional[int] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Assemble the prompt messages for a turn.
+
+        Args:
+            history: Previous messages, oldest first, with 'role' and 'content' attributes
+            content: The new user message
+            summary: Rolling summary of the messages before history (optional)
+            retrieved: Relevant older messages, most relevant first, with 'role'
+                and 'content' attributes (optional)
+            context_length: The model's context window in tokens, if known
+
+        Returns:
+            List of message dicts with 'role' and 'content'
+        """
+        head: List[Dict[str, str]] = []
+        if self.system_prompt:
+            head.append({"role": "system", "content": self.system_prompt})
+        if summary:
+            head.append({"role": "system", "content": f"{SUMMARY_PREFIX}\n{summary}"})
+        if retrieved:
+            lines = []
+            budget = self.max_retrieved_tokens
+            for msg in retrieved:
+                line = f"{msg.role.capitalize()}: {msg.content}"
+                cost = estimate_tokens(line)
+                if cost > budget:
+                    break
+                budget -= cost
+                lines.append(line)
+            if lines:
+                head.append({"role": "system", "content": "\n".join([RETRIEVED_PREFIX] + lines)})
+        latest = {"role": "user", "content": content}
+
+        max_tokens = self.max_tokens
+        if context_length:
+            max_tokens = min(max_tokens, context_length - self.response_tokens)
+        budget = max_tokens - estimate_tokens(content)
+        budget -= sum(estimate_tokens(msg["content"]) for msg in head)
+
+        selected: List[Dict[str, str]] = []
+        for msg in reversed(history[-self.max_messages:]):
+            cost = estimate_tokens(msg.content)
+            if cost > budget:
+                break
+            budget -= cost
+            selected.append({"role": msg.role, "content": msg.content})
+        selected.reverse()
+
+        return head + selected + [latest]
@@ -0,0 +1,278 @@
+"""
+Bulk export and import of chat threads as JSON Lines
+"""
+
+import os
+import json
+import uuid
+import logging
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+from uuid import UUID
+
+from database.base import AsyncSessionLocal
+from database.service import ChatService
+
+logger = logging.getLogger(__name__)
+
+# Roles accepted on import, matching the message endpoint
+MESSAGE_ROLES = ("user", "assistant")
+
+# Invalid lines reported back by line number; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+# Lengths of the chat_threads columns
+MAX_THREAD_ID_LENGTH = 255
+MAX_TITLE_LENGTH = 500
+
+
+def _thread_record(thread) -> Dict[str, Any]:
+    return {
+        "type": "thread",
+        "thread_id": thread.thread_id,
+        "title": thread.title,
+        "created_at": thread.created_at.isoformat(),
+        "updated_at": thread.updated_at.isoformat() if thread.updated_at else None,
+    }
+
+
+def _message_record(message, thread_id: str) -> Dict[str, Any]:
+    return {
+        "type": "message",
+        "thread_id": thread_id,
+        "id": str(message.id),
+        "role": message.role,
+        "content": message.content,
+        "metadata": message.message_metadata,
+        "created_at": message.created_at.isoformat(),
+    }
+
+
+async def export_user_jsonl(user_id: UUID, batch_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Stream a user's threads and messages as JSON Lines.
+
+    All thread records come first, then every message, grouped by thread and
+    oldest first within each thread. Rows are read through server-side
+    cursors and encoded a batch at a time, so memory use does not depend on
+    the size of the export.
+
+    Args:
+        user_id: Owner of the exported threads
+        batch_size: Rows fetched and encoded per chunk (EXPORT_BATCH_SIZE, default 1000)
+    """
+    batch_size = batch_size or int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+    async with AsyncSessionLocal() as session:
+        threads = await ChatService.stream_chat_threads(session, user_id, batch_size=batch_size)
+        async for partition in threads.partitions():
+            yield "".join(json.dumps(_thread_record(thread)) + "\n" for thread in partition).encode()
+
+        messages = await ChatService.stream_chat_messages(session, user_id, batch_size=batch_size)
+        async for partition in messages.partitions():
+            yield "".join(
+                json.dumps(_message_record(message, thread_id)) + "\n" for message, thread_id in partition
+            ).encode()
+
+
+class JsonlImporter:
+    """
+    Imports threads and messages from JSON Lines in the export format.
+
+    Lines are parsed as they arrive and written in batches: each batch
+    creates any new threads with one multi-row INSERT, then adds its
+    messages with one counter UPDATE and one multi-row INSERT, and commits.
+    Threads that already exist are appended to. Messages get new ids and
+    keep their created_at, so ordering is preserved. A message line for a
+    thread without a thread line creates the thread with its thread_id as
+    the title; a thread line arriving later still sets its title and
+    timestamps. Invalid lines are skipped and reported; so are lines over
+    max_line_bytes, which are dropped as they arrive instead of buffered.
+    """
+
+    def __init__(self, user_id: UUID, batch_size: Optional[int] = None, max_line_bytes: Optional[int] = None):
+        """
+        Initialize importer.
+
+        Args:
+            user_id: Owner of the imported threads
+            batch_size: Messages per INSERT and transaction (IMPORT_BATCH_SIZE, default 1000)
+            max_line_bytes: Longest line accepted (IMPORT_MAX_LINE_BYTES, default 16 MiB)
+        """
+        self.user_id = user_id
+        self.batch_size = batch_size or int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+        self.max_line_bytes = max_line_bytes or int(os.getenv("IMPORT_MAX_LINE_BYTES", str(16 * 1024 * 1024)))
+        # thread_id -> ChatThread.id for threads already resolved
+        self._thread_pks: Dict[str, UUID] = {}
+        # Thread lines not yet written
+        self._pending_threads: Dict[str, Dict[str, Any]] = {}
+        # Threads created from a message line, whose thread line hasn't been seen
+        self._placeholders: Set[str] = set()
+        # Threads created by this import, and late thread lines to apply to them
+        self._created: Set[str] = set()
+        self._thread_updates: Dict[str, Dict[str, Any]] = {}
+        # Messages not yet written, with their thread_id
+        self._pending_messages: List[Dict[str, Any]] = []
+        self.thread_pks: Set[UUID] = set()
+        self.lines = 0
+        self.threads_seen = 0
+        self.messages_imported = 0
+        self.error_count = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    async def import_stream(self, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        Import an uploaded JSONL body.
+
+        Returns:
+            Counts of processed lines, threads and messages, plus the first invalid lines
+        """
+        buffer = b""
+        # Set while dropping the rest of an over-long line
+        skipping = False
+        async for chunk in chunks:
+            buffer += chunk
+            lines = buffer.split(b"\n")
+            buffer = lines.pop()
+            for line in lines:
+                if skipping:
+                    skipping = False
+                    continue
+                await self._add_line(line)
+            if len(buffer) > self.max_line_bytes:
+                if not skipping:
+                    self.lines += 1
+                    self._add_error(f"line exceeds {self.max_line_bytes} bytes")
+                    skipping = True
+                buffer = b""
+        if buffer and not skipping:
+            await self._add_line(buffer)
+        await self._flush()
+        return {
+            "lines": self.lines,
+            "threads": self.threads_seen,
+            "messages_imported": self.messages_imported,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+    async def _add_line(self, line: bytes):
+        line = line.strip()
+        if not line:
+            return
+        self.lines += 1
+        if len(line) > self.max_line_bytes:
+            self._add_error(f"line exceeds {self.max_line_bytes} bytes")
+            return
+        try:
+            record = json.loads(line)
+            kind = record.get("type")
+            if kind == "thread":
+                self._add_thread(record)
+            elif kind == "message":
+                self._add_message(record)
+            else:
+                raise ValueError(f"unknown record type {kind!r}")
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            self._add_error(str(e))
+            return
+        if len(self._pending_messages) >= self.batch_size:
+            await self._flush()
+
+    def _add_error(self, error: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": self.lines, "error": error})
+
+    def _add_thread(self, record: Dict[str, Any]):
+        thread_id = _thread_id(record)
+        title = record.get("title")
+        if title is not None and (not isinstance(title, str) or len(title) > MAX_TITLE_LENGTH):
+            raise ValueError(f"title must be a string of at most {MAX_TITLE_LENGTH} characters")
+        values = {
+            "title": title,
+            "created_at": _parse_datetime(record.get("created_at")),
+            "updated_at": _parse_datetime(record.get("updated_at")),
+        }
+        if thread_id in self._placeholders:
+            # Its messages came first and created a placeholder
+            self._placeholders.discard(thread_id)
+            if thread_id in self._pending_threads:
+                values["created_at"] = values["created_at"] or self._pending_threads[thread_id].get("created_at")
+                self._pending_threads[thread_id] = values
+            elif thread_id in self._created:
+                self._thread_updates[thread_id] = values
+            return
+        if thread_id in self._thread_pks or thread_id in self._pending_threads:
+            return
+        self.threads_seen += 1
+        self._pending_threads[thread_id] = values
+
+    def _add_message(self, record: Dict[str, Any]):
+        thread_id = _thread_id(record)
+        role = record.get("role")
+        if role not in MESSAGE_ROLES:
+            raise ValueError("role must be 'user' or 'assistant'")
+        content = record.get("content")
+        if not isinstance(content, str):
+            raise ValueError("content must be a string")
+        metadata = record.get("metadata") or {}
+        if not isinstance(metadata, dict):
+            raise ValueError("metadata must be an object")
+        created_at = _parse_datetime(record.get("created_at")) or datetime.utcnow()
+        if thread_id not in self._thread_pks and thread_id not in self._pending_threads:
+            self.threads_seen += 1
+            self._placeholders.add(thread_id)
+            self._pending_threads[thread_id] = {"created_at": created_at}
+        self._pending_messages.append({
+            "thread": thread_id,
+            "id": uuid.uuid4(),
+            "role": role,
+            "content": content,
+            "message_metadata": metadata,
+            "created_at": created_at,
+        })
+
+    async def _flush(self):
+        if not self._pending_threads and not self._pending_messages and not self._thread_updates:
+            return
+        async with AsyncSessionLocal() as session:
+            if self._pending_threads:
+                resolved = await ChatService.ensure_chat_threads(
+                    session, self.user_id, self._pending_threads, created=self._created
+                )
+                self._thread_pks.update(resolved)
+                self.thread_pks.update(resolved.values())
+            if self._thread_updates:
+                await ChatService.update_imported_threads(session, {
+                    self._thread_pks[thread_id]: values for thread_id, values in self._thread_updates.items()
+                })
+            rows = []
+            for message in self._pending_messages:
+                row = dict(message)
+                row["thread_id"] = self._thread_pks[row.pop("thread")]
+                rows.append(row)
+            if rows:
+                self.messages_imported += await ChatService.create_messages_bulk(session, rows)
+            await session.commit()
+        self._pending_threads = {}
+        self._pending_messages = []
+        self._thread_updates = {}
+
+
+def _thread_id(record: Dict[str, Any]) -> str:
+    thread_id = record["thread_id"]
+    if not isinstance(thread_id, str) or not thread_id or len(thread_id) > MAX_THREAD_ID_LENGTH:
+        raise ValueError(f"thread_id must be a non-empty string of at most {MAX_THREAD_ID_LENGTH} characters")
+    return thread_id
+
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"invalid timestamp {value!r}")
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        # Timestamps are stored as naive UTC
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
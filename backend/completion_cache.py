@@ -0,0 +1,279 @@
+"""
+Response cache for deterministic LLM completions
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def completion_cache_key(
+    provider: str,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    max_tokens: Optional[int],
+) -> str:
+    """Hash of everything that determines a completion"""
+    payload = json.dumps(
+        [provider, model, messages, temperature, max_tokens],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class CacheBackend(ABC):
+    """Persistent second-level store for CompletionCache"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """Stored completion for key, or None if missing or expired"""
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ttl: float, provider: str, model: str):
+        """Store a completion for ttl seconds, replacing any previous entry"""
+
+    @abstractmethod
+    async def purge_expired(self) -> int:
+        """Delete expired entries; returns the number of entries removed"""
+
+
+class PostgresCacheBackend(CacheBackend):
+    """Stores completions in the llm_completion_cache table"""
+
+    async def get(self, key: str) -> Optional[str]:
+        from sqlalchemy import select
+        from database.base import AsyncSessionLocal
+        from database.models import CompletionCacheEntry
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(CompletionCacheEntry.response).where(
+                    CompletionCacheEntry.key == key,
+                    CompletionCacheEntry.expires_at > datetime.utcnow(),
+                )
+            )
+            return result.scalar_one_or_none()
+
+    async def set(self, key: str, value: str, ttl: float, provider: str, model: str):
+        from sqlalchemy.dialects.postgresql import insert
+        from database.base import AsyncSessionLocal
+        from database.models import CompletionCacheEntry
+
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+        query = insert(CompletionCacheEntry).values(
+            key=key,
+            provider=provider,
+            model=model,
+            response=value,
+            created_at=now,
+            expires_at=expires_at,
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[CompletionCacheEntry.key],
+            set_={"response": value, "created_at": now, "expires_at": expires_at},
+        )
+        async with AsyncSessionLocal() as session:
+            await session.execute(query)
+            await session.commit()
+
+    async def purge_expired(self) -> int:
+        """Delete expired entries; returns the number of rows removed"""
+        from sqlalchemy import delete
+        from database.base import AsyncSessionLocal
+        from database.models import CompletionCacheEntry
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                delete(CompletionCacheEntry).where(CompletionCacheEntry.expires_at <= datetime.utcnow())
+            )
+            await session.commit()
+            return result.rowcount
+
+
+class CompletionCache:
+    """
+    Two-level cache of LLM completions.
+
+    The first level is an in-process LRU bounded by total size in bytes, with
+    a TTL per entry. An optional persistent backend is consulted on a local
+    miss and written through on every store, so entries survive restarts and
+    are shared between workers. Once started, expired backend entries are
+    deleted every purge_interval seconds, which bounds the backend's size.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        ttl: Optional[float] = None,
+        backend: Optional[CacheBackend] = None,
+        purge_interval: Optional[float] = None,
+    ):
+        """
+        Initialize completion cache.
+
+        Args:
+            max_bytes: Size cap for the in-process LRU (LLM_CACHE_MAX_BYTES, default 16 MiB)
+            ttl: Entry lifetime in seconds (LLM_CACHE_TTL, default 3600)
+            backend: Persistent backend (optional)
+            purge_interval: Seconds between purges of expired backend entries
+                (LLM_CACHE_PURGE_INTERVAL, default 600)
+        """
+        self.max_bytes = max_bytes or int(os.getenv("LLM_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+        self.ttl = ttl or float(os.getenv("LLM_CACHE_TTL", "3600"))
+        self.backend = backend
+        self.purge_interval = purge_interval or float(os.getenv("LLM_CACHE_PURGE_INTERVAL", "600"))
+        self._task: Optional[asyncio.Task] = None
+        # key -> (value, expires_at, size)
+        self._entries: "OrderedDict[str, Tuple[str, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.backend_errors = 0
+        self.purged = 0
+
+    @classmethod
+    def from_env(cls) -> "CompletionCache":
+        """Build a cache using LLM_CACHE_BACKEND ("memory" or "postgres", default memory)"""
+        backend = None
+        if os.getenv("LLM_CACHE_BACKEND", "memory").lower() == "postgres":
+            backend = PostgresCacheBackend()
+        return cls(backend=backend)
+
+    def start(self):
+        """Start purging expired backend entries in the background"""
+        if self._task is None and self.backend is not None:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self):
+        """Stop purging"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await self.purge_expired()
+            await asyncio.sleep(self.purge_interval)
+
+    async def purge_expired(self) -> int:
+        """Delete expired backend entries; returns the number removed"""
+        if self.backend is None:
+            return 0
+        try:
+            removed = await self.backend.purge_expired()
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"Completion cache backend purge failed: {e}")
+            return 0
+        self.purged += removed
+        if removed:
+            logger.info(f"Purged {removed} expired completion cache entries")
+        return removed
+
+    async def get(self, key: str) -> Optional[str]:
+        """Look up a completion, trying the in-process LRU first"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, expires_at, _ = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._remove(key)
+            self.expirations += 1
+
+        if self.backend is not None:
+            try:
+                value = await self.backend.get(key)
+            except Exception as e:
+                self.backend_errors += 1
+                logger.warning(f"Completion cache backend read failed: {e}")
+                value = None
+            if value is not None:
+                self.backend_hits += 1
+                self._store(key, value)
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str, provider: str = "", model: str = ""):
+        """Store a completion in the LRU and the persistent backend"""
+        self._store(key, value)
+        if self.backend is not None:
+            try:
+                await self.backend.set(key, value, self.ttl, provider, model)
+            except Exception as e:
+                self.backend_errors += 1
+                logger.warning(f"Completion cache backend write failed: {e}")
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[str]],
+        provider: str = "",
+        model: str = "",
+    ) -> str:
+        """Return the cached completion for key, or compute and cache it"""
+        value = await self.get(key)
+        if value is not None:
+            return value
+        value = await compute()
+        if value:
+            await self.set(key, value, provider, model)
+        return value
+
+    def _store(self, key: str, value: str):
+        size = len(key) + len(value.encode())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.monotonic() + self.ttl, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current size"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "backend_hits": self.backend_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "backend_errors": self.backend_errors,
+            "purged": self.purged,
+            "backend": type(self.backend).__name__ if self.backend else None,
+        }
+
+
+# Shared by all LLM clients in the process
+completion_cache = CompletionCache.from_env()
@@ -3,6 +3,6 @@ Database module for SigmaChain
 """
 
 from .base import Base, get_db, init_db, AsyncSessionLocal
-from .models import User, ChatThread, ChatMessage
+from .models import User, ChatThread, ChatMessage, CompletionCacheEntry, MessageEmbedding
 
-__all__ = ["Base", "get_db", "init_db", "AsyncSessionLocal", "User", "ChatThread", "ChatMessage"]
+__all__ = ["Base", "get_db", "init_db", "AsyncSessionLocal", "User", "ChatThread", "ChatMessage", "CompletionCacheEntry", "MessageEmbedding"]
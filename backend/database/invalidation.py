@@ -0,0 +1,187 @@
+"""
+Cross-process cache invalidation over Postgres LISTEN/NOTIFY
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = os.getenv("INVALIDATION_CHANNEL", "sigmachain_invalidate")
+
+# Identifies this process, so it can ignore its own notifications
+ORIGIN = uuid.uuid4().hex
+
+# NOTIFY payloads must stay under 8000 bytes
+_MAX_PAYLOAD = 7000
+
+
+def invalidation_enabled() -> bool:
+    return os.getenv("INVALIDATION_BUS_ENABLED", "true").lower() == "true"
+
+
+def publish_invalidation(session: Any, kind: str, key: Any):
+    """
+    Record that cached state for (kind, key) is stale.
+
+    Keys are collected on the session and sent as a single NOTIFY when the
+    transaction commits. Postgres delivers notifications only on commit, so
+    other processes never drop cache entries for changes that rolled back.
+    """
+    sync_session = getattr(session, "sync_session", session)
+    sync_session.info.setdefault("invalidations", set()).add((kind, str(key)))
+
+
+def _payloads(keys: Set[Tuple[str, str]]) -> List[str]:
+    by_kind: Dict[str, List[str]] = defaultdict(list)
+    for kind, key in keys:
+        by_kind[kind].append(key)
+    payloads = []
+    for kind, values in by_kind.items():
+        chunk: List[str] = []
+        size = 0
+        for value in values:
+            if chunk and size + len(value) > _MAX_PAYLOAD:
+                payloads.append(json.dumps({"origin": ORIGIN, "kind": kind, "keys": chunk}))
+                chunk, size = [], 0
+            chunk.append(value)
+            size += len(value) + 3
+        payloads.append(json.dumps({"origin": ORIGIN, "kind": kind, "keys": chunk}))
+    return payloads
+
+
+@event.listens_for(Session, "before_commit")
+def _send_invalidations(session: Session):
+    keys = session.info.pop("invalidations", None)
+    if not keys or not invalidation_enabled():
+        return
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    for payload in _payloads(keys):
+        session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session):
+    session.info.pop("invalidations", None)
+
+
+class InvalidationListener:
+    """
+    Receives invalidations published by other processes.
+
+    Holds one dedicated connection that LISTENs on the channel and calls the
+    callbacks registered for each kind with the invalidated keys. While the
+    connection is down notifications are lost, so after reconnecting the
+    reset callbacks run to drop everything that might be stale.
+    """
+
+    def __init__(self, database_url: str, reconnect_delay: Optional[float] = None):
+        """
+        Initialize invalidation listener.
+
+        Args:
+            database_url: SQLAlchemy URL of the Postgres database
+            reconnect_delay: Seconds between reconnect attempts (INVALIDATION_RECONNECT_DELAY, default 2)
+        """
+        self.database_url = database_url
+        self.reconnect_delay = reconnect_delay or float(os.getenv("INVALIDATION_RECONNECT_DELAY", "2"))
+        self._handlers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+        self._reset_handlers: List[Callable[[], None]] = []
+        self._task: Optional[asyncio.Task] = None
+        self._connection = None
+        self.received = 0
+        self.reconnects = 0
+
+    @property
+    def enabled(self) -> bool:
+        return invalidation_enabled() and make_url(self.database_url).get_backend_name() == "postgresql"
+
+    def subscribe(self, kind: str, callback: Callable[[str], None]):
+        """Call callback(key) for every invalidated key of this kind"""
+        self._handlers[kind].append(callback)
+
+    def on_reset(self, callback: Callable[[], None]):
+        """Call callback() when notifications may have been missed"""
+        self._reset_handlers.append(callback)
+
+    def start(self):
+        """Start listening in the background"""
+        if self._task is None and self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self):
+        """Stop listening"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        import asyncpg
+
+        dsn = make_url(self.database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        connected_before = False
+        while True:
+            closed = asyncio.Event()
+            try:
+                self._connection = await asyncpg.connect(dsn)
+                self._connection.add_termination_listener(lambda _: closed.set())
+                await self._connection.add_listener(CHANNEL, self._on_notification)
+                if connected_before:
+                    self.reconnects += 1
+                    self._reset()
+                connected_before = True
+                logger.info(f"Listening for cache invalidations on '{CHANNEL}'")
+                await closed.wait()
+                logger.warning("Invalidation listener connection lost")
+            except asyncio.CancelledError:
+                if self._connection is not None:
+                    await self._connection.close()
+                raise
+            except Exception as e:
+                logger.warning(f"Invalidation listener failed to connect: {e}")
+            await asyncio.sleep(self.reconnect_delay)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed invalidation: {payload}")
+            return
+        if message.get("origin") == ORIGIN:
+            return
+        self.received += 1
+        for callback in self._handlers.get(message.get("kind"), []):
+            for key in message.get("keys", []):
+                try:
+                    callback(key)
+                except Exception as e:
+                    logger.error(f"Invalidation handler failed for {message.get('kind')} {key}: {e}")
+
+    def _reset(self):
+        for callback in self._reset_handlers:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Invalidation reset handler failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Listener state and counters"""
+        return {
+            "enabled": self.enabled,
+            "listening": self._task is not None and self._connection is not None and not self._connection.is_closed(),
+            "channel": CHANNEL,
+            "received_total": self.received,
+            "reconnects_total": self.reconnects,
+        }
@@ -2,8 +2,7 @@
 Database models for users and chat
 """
 
-from sqlalchemy import Column, String, Text, DateTime, JSON, ForeignKey, UniqueConstraint
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, String, Text, Integer, DateTime, JSON, LargeBinary, ForeignKey, Index, UniqueConstraint, Uuid
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import uuid
@@ -16,7 +15,7 @@ class User(Base):
     """
     __tablename__ = "users"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     username = Column(String(255), unique=True, nullable=False, index=True)
     email = Column(String(255), unique=True, nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
@@ -35,13 +34,22 @@ class ChatThread(Base):
     """
     __tablename__ = "chat_threads"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    user_id = Column(Uuid, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     thread_id = Column(String(255), nullable=False, index=True)  # Human-readable ID, unique per user
     title = Column(String(500), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
+    # Denormalized count, maintained by ChatService on message insert/delete
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")
+    
+    # Rolling summary of older messages; covers everything up to and including
+    # the message identified by summary_message_id / summary_message_created_at
+    summary = Column(Text, nullable=True)
+    summary_message_id = Column(Uuid, nullable=True)
+    summary_message_created_at = Column(DateTime, nullable=True)
+    
     # Unique constraint: thread_id must be unique per user
     __table_args__ = (UniqueConstraint('user_id', 'thread_id', name='uq_user_thread'),)
     
@@ -59,8 +67,8 @@ class ChatMessage(Base):
     """
     __tablename__ = "chat_messages"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    thread_id = Column(UUID(as_uuid=True), ForeignKey("chat_threads.id", ondelete="CASCADE"), nullable=False, index=True)
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
+    thread_id = Column(Uuid, ForeignKey("chat_threads.id", ondelete="CASCADE"), nullable=False, index=True)
     
     # Message content
     role = Column(String(50), nullable=False)  # "user" or "assistant"
@@ -72,8 +80,55 @@ class ChatMessage(Base):
     # Timing
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     
+    # Serves "latest N messages of a thread" and keyset pagination
+    __table_args__ = (Index("ix_chat_messages_thread_created", "thread_id", "created_at", "id"),)
+    
     # Relationships
     thread = relationship("ChatThread", back_populates="messages")
 
     def __repr__(self):
         return f"<ChatMessage(role={self.role}, content_length={len(self.content) if self.content else 0})>"
+
+
+class CompletionCacheEntry(Base):
+    """
+    Persistent cache of deterministic LLM completions.
+    """
+    __tablename__ = "llm_completion_cache"
+
+    key = Column(String(64), primary_key=True)  # SHA-256 of the request
+    provider = Column(String(50), nullable=False)
+    model = Column(String(255), nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<CompletionCacheEntry(provider={self.provider}, model={self.model}, key={self.key})>"
+
+
+class MessageEmbedding(Base):
+    """
+    Stores embedding vectors of chat messages for semantic retrieval.
+    """
+    __tablename__ = "chat_message_embeddings"
+
+    message_id = Column(Uuid, ForeignKey("chat_messages.id", ondelete="CASCADE"), primary_key=True)
+    user_id = Column(Uuid, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    
+    # Position of the embedded message
+    message_created_at = Column(DateTime, nullable=False)
+    
+    # When the embedding was stored, for incremental loading by the retriever
+    indexed_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    
+    model = Column(String(255), nullable=False)
+    dimensions = Column(Integer, nullable=False)
+    vector = Column(LargeBinary, nullable=False)  # float32, native byte order
+    
+    __table_args__ = (
+        Index("ix_chat_message_embeddings_user_indexed_at", "user_id", "indexed_at"),
+    )
+
+    def __repr__(self):
+        return f"<MessageEmbedding(message_id={self.message_id}, model={self.model}, dimensions={self.dimensions})>"
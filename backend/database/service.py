@@ -2,16 +2,23 @@
 Database service layer for user and chat operations
 """
 
-from typing import List, Optional, Dict, Any
-from uuid import UUID
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
+import base64
+from typing import List, Optional, Dict, Any, Set, Tuple
+from uuid import UUID, uuid4
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncResult, AsyncScalarResult
+from sqlalchemy import Float, and_, select, insert, update, delete, case, desc, func, literal, literal_column, text, tuple_
+from sqlalchemy.dialects.postgresql import REGCONFIG, TSVECTOR
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import selectinload
 from datetime import datetime
 
-from .models import User, ChatThread, ChatMessage
+from .base import SEARCH_CONFIG
+from .models import User, ChatThread, ChatMessage, MessageEmbedding
+from .invalidation import publish_invalidation
+from metrics import DB_METHOD_SECONDS, timed_methods
 
 
+@timed_methods(DB_METHOD_SECONDS)
 class UserService:
     """Service for user database operations"""
 
@@ -28,6 +35,7 @@ class UserService:
         )
         session.add(user)
         await session.flush()
+        publish_invalidation(session, "user", user.id)
         return user
 
     @staticmethod
@@ -61,6 +69,75 @@ class UserService:
         return result.scalar_one_or_none()
 
 
+# Length of the last-message preview returned with thread summaries
+MESSAGE_PREVIEW_LENGTH = 200
+
+
+def _after_position(position: Tuple[datetime, UUID]):
+    """Filter for messages ordered after a (created_at, id) position"""
+    return tuple_(ChatMessage.created_at, ChatMessage.id) > tuple_(*position)
+
+
+def _before_position(position: Tuple[datetime, UUID]):
+    """Filter for messages ordered before a (created_at, id) position"""
+    return tuple_(ChatMessage.created_at, ChatMessage.id) < tuple_(*position)
+
+
+# Postgres-only generated column; see POSTGRES_SCHEMA_UPGRADES
+_content_tsv = literal_column("chat_messages.content_tsv", TSVECTOR)
+
+# Options for ts_headline snippets in search results
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5"
+
+# Time buckets accepted by get_generation_stats
+GENERATION_STATS_BUCKETS = ("hour", "day")
+
+# Written out rather than bound, so Postgres can match it to the partial
+# index ix_chat_messages_generation_created_at
+_has_generation = text("(chat_messages.message_metadata -> 'generation') IS NOT NULL")
+
+
+def _generation_field(name: str):
+    """A field of the Ollama timing stats stored in message_metadata['generation']"""
+    return ChatMessage.message_metadata[("generation", name)]
+
+
+def _sorted_values(rows: List[Row], name: str) -> List[float]:
+    return sorted(value for value in (getattr(row, name) for row in rows) if value is not None)
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    """Linearly interpolated percentile of sorted values, as Postgres percentile_cont"""
+    if not values:
+        return None
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def encode_message_cursor(message: ChatMessage) -> str:
+    """Encode a message's (created_at, id) position as an opaque pagination cursor"""
+    raw = f"{message.created_at.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_message_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """
+    Decode a cursor produced by encode_message_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, message_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(message_id)
+    except Exception:
+        raise ValueError(f"Invalid message cursor: {cursor}")
+
+
+@timed_methods(DB_METHOD_SECONDS)
 class ChatService:
     """Service for chat operations"""
 
@@ -114,6 +191,46 @@ class ChatService:
         result = await session.execute(query)
         return list(result.scalars().all())
 
+    @staticmethod
+    async def list_chat_thread_summaries(
+        session: AsyncSession,
+        user_id: UUID,
+        limit: int = 50,
+    ) -> List[Row]:
+        """
+        List chat threads for a user together with a preview of their last message.
+
+        Runs as a single query: message counts come from the denormalized
+        ChatThread.message_count column and the last message is joined through
+        a correlated subquery, so no per-thread message scans are needed.
+
+        Returns:
+            Rows of (ChatThread, last_role, last_preview, last_message_at);
+            the last_* columns are None for threads without messages
+        """
+        last_message_id = (
+            select(ChatMessage.id)
+            .where(ChatMessage.thread_id == ChatThread.id)
+            .order_by(desc(ChatMessage.created_at), desc(ChatMessage.id))
+            .limit(1)
+            .correlate(ChatThread)
+            .scalar_subquery()
+        )
+        query = (
+            select(
+                ChatThread,
+                ChatMessage.role.label("last_role"),
+                func.substr(ChatMessage.content, 1, MESSAGE_PREVIEW_LENGTH).label("last_preview"),
+                ChatMessage.created_at.label("last_message_at"),
+            )
+            .outerjoin(ChatMessage, ChatMessage.id == last_message_id)
+            .where(ChatThread.user_id == user_id)
+            .order_by(desc(ChatThread.updated_at))
+            .limit(limit)
+        )
+        result = await session.execute(query)
+        return list(result.all())
+
     @staticmethod
     async def update_chat_thread_title(
         session: AsyncSession,
@@ -121,14 +238,18 @@ class ChatService:
         thread_id: str,
         title: str,
     ) -> Optional[ChatThread]:
-        """Update chat thread title"""
-        thread = await ChatService.get_chat_thread(session, user_id, thread_id, include_messages=False)
-        if not thread:
-            return None
-        
-        thread.title = title
-        thread.updated_at = datetime.utcnow()
-        await session.flush()
+        """Update chat thread title with a single UPDATE ... RETURNING"""
+        query = (
+            update(ChatThread)
+            .where(ChatThread.user_id == user_id, ChatThread.thread_id == thread_id)
+            .values(title=title, updated_at=datetime.utcnow())
+            .returning(ChatThread)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        result = await session.execute(query)
+        thread = result.scalar_one_or_none()
+        if thread is not None:
+            publish_invalidation(session, "thread", thread.id)
         return thread
 
     @staticmethod
@@ -137,15 +258,45 @@ class ChatService:
         user_id: UUID,
         thread_id: str,
     ) -> bool:
-        """Delete a chat thread (cascade deletes messages)"""
-        thread = await ChatService.get_chat_thread(session, user_id, thread_id, include_messages=False)
-        if not thread:
+        """Delete a chat thread; its messages go with it through ON DELETE CASCADE"""
+        query = (
+            delete(ChatThread)
+            .where(ChatThread.user_id == user_id, ChatThread.thread_id == thread_id)
+            .returning(ChatThread.id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(query)
+        thread_pk = result.scalar_one_or_none()
+        if thread_pk is None:
             return False
-        
-        await session.delete(thread)
-        await session.flush()
+        publish_invalidation(session, "thread", thread_pk)
         return True
 
+    @staticmethod
+    async def _adjust_message_count(
+        session: AsyncSession,
+        delta: int,
+        *criteria,
+    ) -> Optional[UUID]:
+        """
+        Add delta to the message count of the thread matching criteria.
+
+        The same UPDATE bumps updated_at and, through RETURNING, resolves the
+        thread's primary key, so no separate lookup is needed.
+        """
+        query = (
+            update(ChatThread)
+            .where(*criteria)
+            .values(message_count=ChatThread.message_count + delta, updated_at=datetime.utcnow())
+            .returning(ChatThread.id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(query)
+        thread_pk = result.scalar_one_or_none()
+        if thread_pk is not None:
+            publish_invalidation(session, "thread", thread_pk)
+        return thread_pk
+
     @staticmethod
     async def create_chat_message(
         session: AsyncSession,
@@ -156,24 +307,345 @@ class ChatService:
         metadata: Optional[Dict[str, Any]] = None,
     ) -> Optional[ChatMessage]:
         """Create a new chat message in a thread"""
-        thread = await ChatService.get_chat_thread(session, user_id, thread_id, include_messages=False)
-        if not thread:
+        thread_pk = await ChatService._adjust_message_count(
+            session, 1, ChatThread.user_id == user_id, ChatThread.thread_id == thread_id
+        )
+        if thread_pk is None:
             return None
-        
+        return await ChatService._insert_message(session, thread_pk, role, content, metadata)
+
+    @staticmethod
+    async def create_thread_message(
+        session: AsyncSession,
+        thread_pk: UUID,
+        role: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> ChatMessage:
+        """
+        Create a new chat message in a thread that has already been resolved.
+
+        Args:
+            thread_pk: ChatThread.id (primary key, not the human-readable thread_id)
+        """
+        await ChatService._adjust_message_count(session, 1, ChatThread.id == thread_pk)
+        return await ChatService._insert_message(session, thread_pk, role, content, metadata)
+
+    @staticmethod
+    async def _insert_message(
+        session: AsyncSession,
+        thread_pk: UUID,
+        role: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]],
+    ) -> ChatMessage:
         message = ChatMessage(
-            thread_id=thread.id,
+            thread_id=thread_pk,
             role=role,
             content=content,
             message_metadata=metadata or {},
         )
         session.add(message)
-        
-        # Update thread's updated_at timestamp
-        thread.updated_at = datetime.utcnow()
-        
         await session.flush()
         return message
 
+    @staticmethod
+    async def create_messages_bulk(
+        session: AsyncSession,
+        rows: List[Dict[str, Any]],
+    ) -> int:
+        """
+        Insert messages for any number of threads in two statements.
+
+        One UPDATE bumps message_count of every affected thread and moves its
+        updated_at forward to the newest message (never backwards, so older
+        history imported into a thread doesn't reorder the thread list),
+        locking those rows and returning the ones that still exist;
+        one multi-row INSERT then adds the messages of those threads.
+        Messages of threads that no longer exist are skipped.
+
+        Args:
+            rows: ChatMessage column values, including id and created_at
+
+        Returns:
+            Number of messages inserted
+        """
+        counts: Dict[UUID, int] = {}
+        latest: Dict[UUID, datetime] = {}
+        for row in rows:
+            thread_pk = row["thread_id"]
+            counts[thread_pk] = counts.get(thread_pk, 0) + 1
+            latest[thread_pk] = max(latest.get(thread_pk, row["created_at"]), row["created_at"])
+
+        incoming = case(latest, value=ChatThread.id)
+        query = (
+            update(ChatThread)
+            .where(ChatThread.id.in_(sorted(counts, key=str)))
+            .values(
+                message_count=ChatThread.message_count + case(counts, value=ChatThread.id),
+                # Portable GREATEST(updated_at, incoming)
+                updated_at=case((ChatThread.updated_at >= incoming, ChatThread.updated_at), else_=incoming),
+            )
+            .returning(ChatThread.id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(query)
+        existing = set(result.scalars().all())
+        for thread_pk in existing:
+            publish_invalidation(session, "thread", thread_pk)
+
+        rows = [row for row in rows if row["thread_id"] in existing]
+        if rows:
+            await session.execute(insert(ChatMessage), rows)
+        return len(rows)
+
+    @staticmethod
+    async def delete_chat_message(
+        session: AsyncSession,
+        user_id: UUID,
+        thread_id: str,
+        message_id: UUID,
+    ) -> bool:
+        """Delete a single message from a chat thread"""
+        owning_thread = (
+            select(ChatThread.id)
+            .where(ChatThread.user_id == user_id, ChatThread.thread_id == thread_id)
+            .scalar_subquery()
+        )
+        query = (
+            delete(ChatMessage)
+            .where(ChatMessage.id == message_id, ChatMessage.thread_id == owning_thread)
+            .returning(ChatMessage.thread_id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(query)
+        thread_pk = result.scalar_one_or_none()
+        if thread_pk is None:
+            return False
+        
+        await ChatService._adjust_message_count(session, -1, ChatThread.id == thread_pk)
+        return True
+
+    @staticmethod
+    async def ensure_chat_threads(
+        session: AsyncSession,
+        user_id: UUID,
+        threads: Dict[str, Dict[str, Any]],
+        created: Optional[Set[str]] = None,
+    ) -> Dict[str, UUID]:
+        """
+        Resolve threads by thread_id, creating the missing ones in one multi-row INSERT.
+
+        Args:
+            threads: thread_id -> ChatThread column values for threads that
+                may need creating (title and optionally created_at/updated_at)
+            created: If given, the thread_ids of the threads created are added to it
+
+        Returns:
+            thread_id -> ChatThread.id for every requested thread
+        """
+        query = select(ChatThread.thread_id, ChatThread.id).where(
+            ChatThread.user_id == user_id,
+            ChatThread.thread_id.in_(list(threads)),
+        )
+        result = await session.execute(query)
+        resolved = {thread_id: thread_pk for thread_id, thread_pk in result.all()}
+
+        rows = []
+        now = datetime.utcnow()
+        for thread_id, values in threads.items():
+            if thread_id in resolved:
+                continue
+            row = {
+                "id": uuid4(),
+                "user_id": user_id,
+                "thread_id": thread_id,
+                "title": values.get("title") or thread_id,
+                "created_at": values.get("created_at") or now,
+                "updated_at": values.get("updated_at") or values.get("created_at") or now,
+                "message_count": 0,
+            }
+            rows.append(row)
+            resolved[thread_id] = row["id"]
+            if created is not None:
+                created.add(thread_id)
+        if rows:
+            await session.execute(insert(ChatThread), rows)
+        return resolved
+
+    @staticmethod
+    async def update_imported_threads(
+        session: AsyncSession,
+        threads: Dict[UUID, Dict[str, Any]],
+    ):
+        """
+        Set the title and timestamps of threads an import created before their thread line arrived.
+
+        Args:
+            threads: ChatThread.id -> title and optionally created_at/updated_at;
+                updated_at only moves forward
+        """
+        for thread_pk, values in threads.items():
+            changes: Dict[str, Any] = {"updated_at": ChatThread.updated_at}
+            if values.get("title"):
+                changes["title"] = values["title"]
+            if values.get("created_at"):
+                changes["created_at"] = values["created_at"]
+            updated_at = values.get("updated_at") or values.get("created_at")
+            if updated_at:
+                changes["updated_at"] = case(
+                    (ChatThread.updated_at >= updated_at, ChatThread.updated_at), else_=updated_at
+                )
+            query = (
+                update(ChatThread)
+                .where(ChatThread.id == thread_pk)
+                .values(**changes)
+                .execution_options(synchronize_session=False)
+            )
+            await session.execute(query)
+            publish_invalidation(session, "thread", thread_pk)
+
+    @staticmethod
+    async def stream_chat_threads(
+        session: AsyncSession,
+        user_id: UUID,
+        batch_size: int = 1000,
+    ) -> AsyncScalarResult:
+        """Stream all threads of a user, oldest first, through a server-side cursor"""
+        query = (
+            select(ChatThread)
+            .where(ChatThread.user_id == user_id)
+            .order_by(ChatThread.created_at, ChatThread.id)
+            .execution_options(yield_per=batch_size)
+        )
+        return await session.stream_scalars(query)
+
+    @staticmethod
+    async def stream_chat_messages(
+        session: AsyncSession,
+        user_id: UUID,
+        batch_size: int = 1000,
+    ) -> AsyncResult:
+        """
+        Stream all messages of a user through a server-side cursor.
+
+        Rows are (ChatMessage, thread_id) ordered by thread, then by
+        (created_at, id) within each thread.
+        """
+        query = (
+            select(ChatMessage, ChatThread.thread_id)
+            .join(ChatThread, ChatMessage.thread_id == ChatThread.id)
+            .where(ChatThread.user_id == user_id)
+            .order_by(ChatMessage.thread_id, ChatMessage.created_at, ChatMessage.id)
+            .execution_options(yield_per=batch_size)
+        )
+        return await session.stream(query)
+
+    @staticmethod
+    async def get_chat_thread_by_pk(
+        session: AsyncSession,
+        thread_pk: UUID,
+    ) -> Optional[ChatThread]:
+        """Get chat thread by its primary key"""
+        query = select(ChatThread).where(ChatThread.id == thread_pk)
+        result = await session.execute(query)
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    async def get_recent_messages(
+        session: AsyncSession,
+        thread_pk: UUID,
+        limit: int,
+        after: Optional[Tuple[datetime, UUID]] = None,
+    ) -> List[ChatMessage]:
+        """
+        Get the most recent messages of a thread, oldest first.
+
+        Args:
+            thread_pk: ChatThread.id (primary key, not the human-readable thread_id)
+            limit: Maximum number of messages to return
+            after: Only include messages after this (created_at, id) position
+        """
+        query = (
+            select(ChatMessage)
+            .where(ChatMessage.thread_id == thread_pk)
+            .order_by(desc(ChatMessage.created_at), desc(ChatMessage.id))
+            .limit(limit)
+        )
+        if after:
+            query = query.where(_after_position(after))
+        result = await session.execute(query)
+        messages = list(result.scalars().all())
+        messages.reverse()
+        return messages
+
+    @staticmethod
+    async def get_messages_after(
+        session: AsyncSession,
+        thread_pk: UUID,
+        after: Optional[Tuple[datetime, UUID]],
+        limit: int,
+    ) -> List[ChatMessage]:
+        """Get the oldest messages of a thread after a (created_at, id) position"""
+        query = (
+            select(ChatMessage)
+            .where(ChatMessage.thread_id == thread_pk)
+            .order_by(ChatMessage.created_at, ChatMessage.id)
+            .limit(limit)
+        )
+        if after:
+            query = query.where(_after_position(after))
+        result = await session.execute(query)
+        return list(result.scalars().all())
+
+    @staticmethod
+    async def count_messages_after(
+        session: AsyncSession,
+        thread_pk: UUID,
+        after: Optional[Tuple[datetime, UUID]],
+    ) -> int:
+        """Count the messages of a thread after a (created_at, id) position"""
+        query = select(func.count()).select_from(ChatMessage).where(ChatMessage.thread_id == thread_pk)
+        if after:
+            query = query.where(_after_position(after))
+        result = await session.execute(query)
+        return result.scalar_one()
+
+    @staticmethod
+    async def update_thread_summary(
+        session: AsyncSession,
+        thread_pk: UUID,
+        summary: str,
+        last_message: ChatMessage,
+        previous_message_id: Optional[UUID],
+    ) -> bool:
+        """
+        Store a new rolling summary for a thread.
+
+        The update only applies if the summary still covers previous_message_id,
+        so concurrent summarizers cannot overwrite a newer summary.
+        """
+        query = (
+            update(ChatThread)
+            .where(
+                ChatThread.id == thread_pk,
+                ChatThread.summary_message_id.is_not_distinct_from(previous_message_id),
+            )
+            .values(
+                summary=summary,
+                summary_message_id=last_message.id,
+                summary_message_created_at=last_message.created_at,
+                # Summaries are not user activity; keep the thread's position in the list
+                updated_at=ChatThread.updated_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        result = await session.execute(query)
+        if result.rowcount == 0:
+            return False
+        publish_invalidation(session, "thread", thread_pk)
+        return True
+
     @staticmethod
     async def get_chat_messages(
         session: AsyncSession,
@@ -182,18 +654,401 @@ class ChatService:
         limit: Optional[int] = None,
     ) -> List[ChatMessage]:
         """Get all messages for a chat thread"""
-        thread = await ChatService.get_chat_thread(session, user_id, thread_id, include_messages=False)
-        if not thread:
-            return []
-        
+        messages, _ = await ChatService.get_chat_messages_page(session, user_id, thread_id, limit=limit)
+        return messages
+
+    @staticmethod
+    async def get_chat_messages_page(
+        session: AsyncSession,
+        user_id: UUID,
+        thread_id: str,
+        limit: Optional[int] = None,
+        before: Optional[Tuple[datetime, UUID]] = None,
+        after: Optional[Tuple[datetime, UUID]] = None,
+        latest: bool = False,
+    ) -> Tuple[List[ChatMessage], bool]:
+        """
+        Get a page of messages for a chat thread using keyset pagination.
+
+        Messages are ordered by (created_at, id) and always returned oldest
+        first. Pages are located by position rather than OFFSET, so loading
+        the end of a huge thread costs the same as loading its start. The
+        thread is resolved by a join in the same query.
+
+        Args:
+            limit: Page size (None returns everything in range)
+            before: Return the page immediately before this (created_at, id) position
+            after: Return the page immediately after this (created_at, id) position
+            latest: Without a cursor, return the newest page instead of the oldest
+
+        Returns:
+            (messages, has_more) where has_more tells whether further messages
+            exist in the paging direction; ([], False) if the thread does not exist
+        """
         query = (
             select(ChatMessage)
-            .where(ChatMessage.thread_id == thread.id)
-            .order_by(ChatMessage.created_at)
+            .join(ChatThread, ChatMessage.thread_id == ChatThread.id)
+            .where(ChatThread.user_id == user_id, ChatThread.thread_id == thread_id)
         )
-        if limit:
-            query = query.limit(limit)
+        return await ChatService._get_messages_page(session, query, limit, before, after, latest)
+
+    @staticmethod
+    async def get_thread_messages_page(
+        session: AsyncSession,
+        thread_pk: UUID,
+        limit: Optional[int] = None,
+        before: Optional[Tuple[datetime, UUID]] = None,
+        after: Optional[Tuple[datetime, UUID]] = None,
+        latest: bool = False,
+    ) -> Tuple[List[ChatMessage], bool]:
+        """Like get_chat_messages_page, for a thread that has already been resolved"""
+        query = select(ChatMessage).where(ChatMessage.thread_id == thread_pk)
+        return await ChatService._get_messages_page(session, query, limit, before, after, latest)
+
+    @staticmethod
+    async def _get_messages_page(
+        session: AsyncSession,
+        query,
+        limit: Optional[int],
+        before: Optional[Tuple[datetime, UUID]],
+        after: Optional[Tuple[datetime, UUID]],
+        latest: bool,
+    ) -> Tuple[List[ChatMessage], bool]:
+        backwards = before is not None or (latest and after is None)
+        if before:
+            query = query.where(_before_position(before))
+        if after:
+            query = query.where(_after_position(after))
+        if backwards:
+            query = query.order_by(desc(ChatMessage.created_at), desc(ChatMessage.id))
+        else:
+            query = query.order_by(ChatMessage.created_at, ChatMessage.id)
+        if limit is not None:
+            # Fetch one extra row to learn whether another page exists
+            query = query.limit(limit + 1)
         
         result = await session.execute(query)
-        return list(result.scalars().all())
+        messages = list(result.scalars().all())
+        has_more = limit is not None and len(messages) > limit
+        if has_more:
+            messages = messages[:limit]
+        if backwards:
+            messages.reverse()
+        return messages, has_more
+
+    @staticmethod
+    async def search_messages(
+        session: AsyncSession,
+        user_id: UUID,
+        query_text: str,
+        limit: int = 20,
+        offset: int = 0,
+        thread_id: Optional[str] = None,
+    ) -> Tuple[List[Row], bool]:
+        """
+        Full-text search over a user's messages, best matches first.
 
+        On Postgres the query is parsed with websearch_to_tsquery (quotes,
+        OR and -negation work as in web search engines), matched against the
+        GIN-indexed content_tsv column and ranked with ts_rank_cd. Snippets
+        are built with ts_headline, only for the rows on the returned page.
+        Other databases fall back to a substring match ordered by recency.
+
+        Args:
+            query_text: Search terms
+            limit: Page size
+            offset: Number of results to skip
+            thread_id: Restrict the search to one thread (optional)
+
+        Returns:
+            (rows, has_more); rows have message_id, thread_id, thread_title,
+            role, created_at, rank and snippet
+        """
+        if session.get_bind().dialect.name != "postgresql":
+            return await ChatService._search_messages_fallback(
+                session, user_id, query_text, limit, offset, thread_id
+            )
+
+        config = literal(SEARCH_CONFIG, REGCONFIG)
+        tsquery = func.websearch_to_tsquery(config, query_text)
+        rank = func.ts_rank_cd(_content_tsv, tsquery)
+        matches = (
+            select(
+                ChatMessage.id.label("message_id"),
+                ChatThread.thread_id.label("thread_id"),
+                ChatThread.title.label("thread_title"),
+                ChatMessage.role.label("role"),
+                ChatMessage.created_at.label("created_at"),
+                ChatMessage.content.label("content"),
+                rank.label("rank"),
+            )
+            .join(ChatThread, ChatMessage.thread_id == ChatThread.id)
+            .where(ChatThread.user_id == user_id, _content_tsv.op("@@")(tsquery))
+        )
+        if thread_id is not None:
+            matches = matches.where(ChatThread.thread_id == thread_id)
+        page = (
+            matches.order_by(desc("rank"), desc(ChatMessage.created_at), ChatMessage.id)
+            .limit(limit + 1)
+            .offset(offset)
+            .subquery()
+        )
+        query = select(
+            page.c.message_id,
+            page.c.thread_id,
+            page.c.thread_title,
+            page.c.role,
+            page.c.created_at,
+            page.c.rank,
+            func.ts_headline(config, page.c.content, tsquery, SEARCH_HEADLINE_OPTIONS).label("snippet"),
+        ).order_by(desc(page.c.rank), desc(page.c.created_at), page.c.message_id)
+        result = await session.execute(query)
+        rows = list(result.all())
+        return rows[:limit], len(rows) > limit
+
+    @staticmethod
+    async def _search_messages_fallback(
+        session: AsyncSession,
+        user_id: UUID,
+        query_text: str,
+        limit: int,
+        offset: int,
+        thread_id: Optional[str],
+    ) -> Tuple[List[Row], bool]:
+        query = (
+            select(
+                ChatMessage.id.label("message_id"),
+                ChatThread.thread_id.label("thread_id"),
+                ChatThread.title.label("thread_title"),
+                ChatMessage.role.label("role"),
+                ChatMessage.created_at.label("created_at"),
+                literal(0.0).label("rank"),
+                func.substr(ChatMessage.content, 1, MESSAGE_PREVIEW_LENGTH).label("snippet"),
+            )
+            .join(ChatThread, ChatMessage.thread_id == ChatThread.id)
+            .where(ChatThread.user_id == user_id, ChatMessage.content.icontains(query_text, autoescape=True))
+            .order_by(desc(ChatMessage.created_at), ChatMessage.id)
+            .limit(limit + 1)
+            .offset(offset)
+        )
+        if thread_id is not None:
+            query = query.where(ChatThread.thread_id == thread_id)
+        result = await session.execute(query)
+        rows = list(result.all())
+        return rows[:limit], len(rows) > limit
+
+    @staticmethod
+    async def get_generation_stats(
+        session: AsyncSession,
+        since: datetime,
+        bucket: str = "hour",
+        model: Optional[str] = None,
+        reload_threshold_ms: float = 1000,
+    ) -> List[Dict[str, Any]]:
+        """
+        Percentiles of the generation stats of assistant messages, per model and time bucket.
+
+        On Postgres the percentiles are computed in the database with
+        percentile_cont over a partial index on created_at; other databases
+        aggregate in Python.
+
+        Args:
+            since: Only messages created at or after this time
+            bucket: "hour" or "day"
+            model: Restrict to one model (optional)
+            reload_threshold_ms: Load time above which a response counts as a model reload
+
+        Returns:
+            One dict per (model, bucket), ordered by model then time, with the
+            response count, p50/p95 tokens/sec, prompt tokens and prompt eval
+            time, p95 load time and the number of reloads
+        """
+        if bucket not in GENERATION_STATS_BUCKETS:
+            raise ValueError(f"bucket must be one of {', '.join(GENERATION_STATS_BUCKETS)}")
+        postgres = session.get_bind().dialect.name == "postgresql"
+        eval_duration = _generation_field("eval_duration").as_float()
+        rows = (
+            select(
+                _generation_field("model").as_string().label("model"),
+                (
+                    # The unit is from GENERATION_STATS_BUCKETS, never user input
+                    func.date_trunc(literal_column(f"'{bucket}'"), ChatMessage.created_at)
+                    if postgres else ChatMessage.created_at
+                ).label("bucket"),
+                (_generation_field("eval_count").as_float() * 1e9 / func.nullif(eval_duration, 0, type_=Float))
+                .label("tokens_per_second"),
+                _generation_field("prompt_eval_count").as_float().label("prompt_tokens"),
+                (_generation_field("prompt_eval_duration").as_float() / 1e6).label("prompt_eval_ms"),
+                (_generation_field("load_duration").as_float() / 1e6).label("load_ms"),
+            )
+            .where(
+                _has_generation if postgres else eval_duration.isnot(None),
+                ChatMessage.created_at >= since,
+            )
+        )
+        if model is not None:
+            rows = rows.where(_generation_field("model").as_string() == model)
+
+        if not postgres:
+            return ChatService._aggregate_generation_stats(
+                (await session.execute(rows)).all(), bucket, reload_threshold_ms
+            )
+
+        rows = rows.subquery()
+        query = (
+            select(
+                rows.c.model,
+                rows.c.bucket,
+                func.count().label("responses"),
+                func.percentile_cont(0.5).within_group(rows.c.tokens_per_second).label("tokens_per_second_p50"),
+                func.percentile_cont(0.95).within_group(rows.c.tokens_per_second).label("tokens_per_second_p95"),
+                func.percentile_cont(0.5).within_group(rows.c.prompt_tokens).label("prompt_tokens_p50"),
+                func.percentile_cont(0.95).within_group(rows.c.prompt_tokens).label("prompt_tokens_p95"),
+                func.percentile_cont(0.5).within_group(rows.c.prompt_eval_ms).label("prompt_eval_ms_p50"),
+                func.percentile_cont(0.95).within_group(rows.c.prompt_eval_ms).label("prompt_eval_ms_p95"),
+                func.percentile_cont(0.95).within_group(rows.c.load_ms).label("load_ms_p95"),
+                func.count().filter(rows.c.load_ms >= reload_threshold_ms).label("reloads"),
+            )
+            .group_by(rows.c.model, rows.c.bucket)
+            .order_by(rows.c.model, rows.c.bucket)
+        )
+        result = await session.execute(query)
+        return [dict(row._mapping) for row in result.all()]
+
+    @staticmethod
+    def _aggregate_generation_stats(rows: List[Row], bucket: str, reload_threshold_ms: float) -> List[Dict[str, Any]]:
+        groups: Dict[Tuple[str, datetime], List[Row]] = {}
+        for row in rows:
+            start = row.bucket.replace(minute=0, second=0, microsecond=0)
+            if bucket == "day":
+                start = start.replace(hour=0)
+            groups.setdefault((row.model, start), []).append(row)
+
+        stats = []
+        for (model, start), group in sorted(groups.items(), key=lambda item: (item[0][0] or "", item[0][1])):
+            tokens_per_second = _sorted_values(group, "tokens_per_second")
+            prompt_tokens = _sorted_values(group, "prompt_tokens")
+            prompt_eval_ms = _sorted_values(group, "prompt_eval_ms")
+            load_ms = _sorted_values(group, "load_ms")
+            stats.append({
+                "model": model,
+                "bucket": start,
+                "responses": len(group),
+                "tokens_per_second_p50": _percentile(tokens_per_second, 0.5),
+                "tokens_per_second_p95": _percentile(tokens_per_second, 0.95),
+                "prompt_tokens_p50": _percentile(prompt_tokens, 0.5),
+                "prompt_tokens_p95": _percentile(prompt_tokens, 0.95),
+                "prompt_eval_ms_p50": _percentile(prompt_eval_ms, 0.5),
+                "prompt_eval_ms_p95": _percentile(prompt_eval_ms, 0.95),
+                "load_ms_p95": _percentile(load_ms, 0.95),
+                "reloads": sum(1 for value in load_ms if value >= reload_threshold_ms),
+            })
+        return stats
+
+
+@timed_methods(DB_METHOD_SECONDS)
+class EmbeddingService:
+    """Service for message embedding operations"""
+
+    @staticmethod
+    async def get_messages_to_embed(
+        session: AsyncSession,
+        model: str,
+        limit: int,
+    ) -> List[Row]:
+        """
+        Get the oldest messages that have no embedding from model yet.
+
+        An anti-join rather than a resume position, so messages imported with
+        old timestamps or committed late are still picked up. Embeddings from
+        another model don't count, so changing the embedding model re-indexes
+        every message.
+
+        Returns:
+            Rows of (id, user_id, content, created_at)
+        """
+        query = (
+            select(ChatMessage.id, ChatThread.user_id, ChatMessage.content, ChatMessage.created_at)
+            .join(ChatThread, ChatMessage.thread_id == ChatThread.id)
+            .outerjoin(
+                MessageEmbedding,
+                and_(MessageEmbedding.message_id == ChatMessage.id, MessageEmbedding.model == model),
+            )
+            .where(MessageEmbedding.message_id.is_(None))
+            .order_by(ChatMessage.created_at, ChatMessage.id)
+            .limit(limit)
+        )
+        result = await session.execute(query)
+        return list(result.all())
+
+    @staticmethod
+    async def store_embeddings(
+        session: AsyncSession,
+        rows: List[Dict[str, Any]],
+    ):
+        """
+        Insert embeddings in one multi-row INSERT.
+
+        A message's embedding from another model is replaced; one from the
+        same model, stored meanwhile by another worker, is kept.
+        """
+        if not rows:
+            return
+        dialect = session.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            await session.execute(insert(MessageEmbedding), rows)
+            return
+        query = dialect_insert(MessageEmbedding)
+        query = query.on_conflict_do_update(
+            index_elements=[MessageEmbedding.message_id],
+            set_={column: query.excluded[column] for column in rows[0] if column != "message_id"},
+            where=MessageEmbedding.model != query.excluded.model,
+        )
+        await session.execute(query, rows)
+
+    @staticmethod
+    async def get_user_embeddings(
+        session: AsyncSession,
+        user_id: UUID,
+        model: str,
+        indexed_since: Optional[datetime] = None,
+    ) -> List[Row]:
+        """
+        Get a user's embeddings, optionally only those stored at or after indexed_since.
+
+        Returns:
+            Rows of (message_id, indexed_at, vector) in the order they were stored
+        """
+        query = (
+            select(MessageEmbedding.message_id, MessageEmbedding.indexed_at, MessageEmbedding.vector)
+            .where(
+                MessageEmbedding.user_id == user_id,
+                MessageEmbedding.model == model,
+                # Messages the model rejected are stored without a vector
+                MessageEmbedding.dimensions > 0,
+            )
+            .order_by(MessageEmbedding.indexed_at, MessageEmbedding.message_id)
+        )
+        if indexed_since:
+            query = query.where(MessageEmbedding.indexed_at >= indexed_since)
+        result = await session.execute(query)
+        return list(result.all())
+
+    @staticmethod
+    async def get_user_messages(
+        session: AsyncSession,
+        user_id: UUID,
+        message_ids: List[UUID],
+    ) -> List[ChatMessage]:
+        """Get messages by id, limited to threads owned by the user"""
+        query = (
+            select(ChatMessage)
+            .join(ChatThread, ChatMessage.thread_id == ChatThread.id)
+            .where(ChatThread.user_id == user_id, ChatMessage.id.in_(message_ids))
+        )
+        result = await session.execute(query)
+        return list(result.scalars().all())
@@ -3,19 +3,219 @@ Ollama LLM client with streaming support
 """
 
 import os
+import json
+import asyncio
+import importlib.util
 import httpx
-from typing import AsyncIterator, Optional, List, Dict, Any
+from typing import AsyncIterator, Optional, List, Dict, Any, Union
+
+from completion_cache import CompletionCache, completion_cache, completion_cache_key
+from metrics import LLM_UPSTREAM_ERRORS, StreamTimer, upstream_error_type
+from model_registry import ModelRegistry, ModelRegistryError
+from upstream_pool import UpstreamHost, UpstreamPool, is_retriable
+
+# Timing fields of Ollama's final chunk; durations are in nanoseconds
+GENERATION_STAT_FIELDS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+)
+
+
+def generation_stats(data: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """Extract the timing stats from the final chunk of an Ollama stream"""
+    stats = {"model": data.get("model") or model}
+    for field in GENERATION_STAT_FIELDS:
+        if isinstance(data.get(field), int):
+            stats[field] = data[field]
+    return stats
+
+
+def _host_of(error: httpx.RequestError) -> str:
+    """Base URL of the host a failed request was sent to"""
+    url = error.request.url
+    return f"{url.scheme}://{url.netloc.decode()}"
+
+
+# HTTP/2 needs the optional "h2" package (pip install httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class KeepAlivePolicy:
+    """
+    How long Ollama keeps each model loaded after a request.
+    
+    Values use Ollama's keep_alive format: a duration such as "30m", a
+    number of seconds, or a negative number to keep the model loaded
+    indefinitely.
+    """
+    
+    def __init__(self, default: Union[str, int], per_model: Optional[Dict[str, Union[str, int]]] = None):
+        self.default = default
+        self.per_model = per_model or {}
+    
+    @classmethod
+    def from_env(cls) -> "KeepAlivePolicy":
+        """
+        Read the policy from the environment:
+            OLLAMA_KEEP_ALIVE: Default for all models (default 30m)
+            OLLAMA_MODEL_KEEP_ALIVE: Per-model overrides, e.g. "llama2=2h,llava=10m"
+        """
+        per_model = {}
+        for entry in os.getenv("OLLAMA_MODEL_KEEP_ALIVE", "").split(","):
+            if "=" in entry:
+                name, value = entry.split("=", 1)
+                per_model[name.strip()] = _parse_keep_alive(value)
+        return cls(_parse_keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", "30m")), per_model)
+    
+    def for_model(self, model: str) -> Union[str, int]:
+        return self.per_model.get(model, self.default)
+
+
+def _parse_keep_alive(value: str) -> Union[str, int]:
+    # Ollama reads bare numbers as seconds but rejects them as strings
+    value = value.strip()
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Create a long-lived, pooled HTTP client for talking to an LLM provider.
+    
+    Pool limits and keep-alive are read from the environment:
+        LLM_HTTP_MAX_CONNECTIONS: Maximum open connections (default 100)
+        LLM_HTTP_MAX_KEEPALIVE: Maximum idle keep-alive connections (default 20)
+        LLM_HTTP_KEEPALIVE_EXPIRY: Seconds an idle connection is kept (default 60)
+        LLM_HTTP_CONNECT_TIMEOUT: Connect timeout in seconds (default 5)
+        LLM_HTTP2: Enable HTTP/2 when h2 is installed (default true)
+    
+    Read/write timeouts are set per operation by the callers.
+    """
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60")),
+    )
+    connect_timeout = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5"))
+    http2 = HTTP2_AVAILABLE and os.getenv("LLM_HTTP2", "true").lower() == "true"
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=httpx.Timeout(300.0, connect=connect_timeout),
+        http2=http2,
+    )
 
 
 class OllamaClient:
     """
     Client for interacting with Ollama LLM API with streaming support.
+    
+    All requests share one pooled httpx.AsyncClient. Call start() on
+    application startup and aclose() on shutdown; if start() was not called,
+    the pool is created lazily on first use.
+    
+    Requests are spread over the hosts of an UpstreamPool (OLLAMA_URLS).
+    A request that fails on its host before any output was produced is
+    retried on the next host; the hosts are assumed to serve the same models.
     """
     
-    def __init__(self):
-        """Initialize Ollama client"""
-        self.ollama_url = os.getenv("OLLAMA_URL", "http://localhost:11434")
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache: Optional[CompletionCache] = None,
+    ):
+        """
+        Initialize Ollama client.
+        
+        Args:
+            http_client: Shared HTTP client to use (optional). A client passed
+                in here is owned by the caller and not closed by aclose().
+            cache: Completion cache (optional, defaults to the shared process cache)
+        """
+        self.pool = UpstreamPool()
         self.default_model = os.getenv("OLLAMA_MODEL", "llama2")
+        self.embed_model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+        self.keep_alive = KeepAlivePolicy.from_env()
+        self._http_client = http_client
+        self._owns_http_client = http_client is None
+        self.completion_cache = cache or completion_cache
+        # Cached /api/tags catalog with per-model metadata
+        self.registry = ModelRegistry(self)
+        
+        # Per-operation timeouts (seconds)
+        connect_timeout = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "5"))
+        self.generation_timeout = httpx.Timeout(
+            float(os.getenv("OLLAMA_GENERATION_TIMEOUT", "300")), connect=connect_timeout
+        )
+        self.metadata_timeout = httpx.Timeout(
+            float(os.getenv("OLLAMA_METADATA_TIMEOUT", "5")), connect=connect_timeout
+        )
+    
+    @property
+    def ollama_url(self) -> str:
+        """Base URL for requests that aren't routed: the least busy available host"""
+        return self.pool.preferred().url
+    
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Shared connection pool, created on first use"""
+        if self._http_client is None or self._http_client.is_closed:
+            self._http_client = create_http_client()
+            self._owns_http_client = True
+        return self._http_client
+    
+    def start(self):
+        """Create the connection pool and start host health checks ahead of the first request"""
+        self.pool.start(self._check_host)
+        return self.http_client
+    
+    async def aclose(self):
+        """Stop health checks and close the connection pool if this client owns it"""
+        await self.pool.aclose()
+        if self._http_client is not None and self._owns_http_client:
+            await self._http_client.aclose()
+        self._http_client = None
+    
+    async def _check_host(self, url: str):
+        response = await self.http_client.get(f"{url}/api/version", timeout=self.metadata_timeout)
+        response.raise_for_status()
+    
+    async def _request(
+        self,
+        host: UpstreamHost,
+        method: str,
+        path: str,
+        timeout: httpx.Timeout,
+        body: Optional[Dict[str, Any]] = None,
+    ) -> httpx.Response:
+        """One request to one host, tracked by the upstream pool"""
+        self.pool.begin(host)
+        try:
+            response = await self.http_client.request(method, f"{host.url}{path}", json=body, timeout=timeout)
+            response.raise_for_status()
+        except BaseException as e:
+            self.pool.end(host, e)
+            raise
+        self.pool.end(host)
+        return response
+    
+    async def _post(
+        self,
+        path: str,
+        body: Dict[str, Any],
+        timeout: httpx.Timeout,
+        route_key: Optional[str] = None,
+    ) -> httpx.Response:
+        """POST to the routed host, failing over to the next host on host errors and missing models"""
+        hosts = self.pool.candidates(route_key)
+        for attempt, host in enumerate(hosts):
+            try:
+                return await self._request(host, "POST", path, timeout, body)
+            except (httpx.HTTPStatusError, httpx.RequestError) as e:
+                if attempt == len(hosts) - 1 or not is_retriable(e):
+                    raise
     
     async def stream_chat(
         self,
@@ -23,36 +223,52 @@ class OllamaClient:
         model: Optional[str] = None,
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
+        stats: Optional[Dict[str, Any]] = None,
+        route_key: Optional[str] = None,
     ) -> AsyncIterator[str]:
         """
         Stream chat completion from Ollama.
         
+        If the host fails before the first chunk, the request moves to the
+        next host; once chunks were yielded, errors are raised as usual.
+        
         Args:
             messages: List of message dicts with 'role' and 'content'
             model: Model name (optional, uses default)
             temperature: Sampling temperature
             max_tokens: Maximum tokens to generate
+            stats: Filled with the model and Ollama's timing stats
+                (GENERATION_STAT_FIELDS) once generation completes (optional)
+            route_key: Routes requests with the same key, e.g. the chat thread,
+                to the same host so its KV cache is reused (optional)
             
         Yields:
             Text chunks as they arrive from Ollama
         """
         model = model or self.default_model
+        timer = StreamTimer("ollama", model)
+        body = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+            "keep_alive": self.keep_alive.for_model(model),
+            "options": {
+                "temperature": temperature,
+                **({"num_predict": max_tokens} if max_tokens else {})
+            }
+        }
         
-        async with httpx.AsyncClient(timeout=300.0) as client:
+        hosts = self.pool.candidates(route_key)
+        for attempt, host in enumerate(hosts):
+            streaming = False
+            self.pool.begin(host)
             try:
                 # Use /api/chat endpoint for proper message handling
-                async with client.stream(
+                async with self.http_client.stream(
                     "POST",
-                    f"{self.ollama_url}/api/chat",
-                    json={
-                        "model": model,
-                        "messages": messages,
-                        "stream": True,
-                        "options": {
-                            "temperature": temperature,
-                            **({"num_predict": max_tokens} if max_tokens else {})
-                        }
-                    }
+                    f"{host.url}/api/chat",
+                    json=body,
+                    timeout=self.generation_timeout,
                 ) as response:
                     response.raise_for_status()
                     
@@ -61,23 +277,31 @@ class OllamaClient:
                             continue
                         
                         try:
-                            import json
                             data = json.loads(line)
-                            
-                            # Extract content from response
-                            if "message" in data and "content" in data["message"]:
-                                content = data["message"]["content"]
-                                if content:
-                                    yield content
-                            
-                            # Check if done
-                            if data.get("done", False):
-                                break
                         except json.JSONDecodeError:
                             # Skip invalid JSON lines
                             continue
+                        
+                        # Extract content from response
+                        if "message" in data and "content" in data["message"]:
+                            content = data["message"]["content"]
+                            if content:
+                                streaming = True
+                                timer.token()
+                                yield content
+                        
+                        # Check if done
+                        if data.get("done", False):
+                            timer.finish()
+                            if stats is not None:
+                                stats.update(generation_stats(data, model))
+                            break
                             
             except httpx.HTTPStatusError as e:
+                self.pool.end(host, e)
+                if not streaming and attempt < len(hosts) - 1 and is_retriable(e):
+                    continue
+                LLM_UPSTREAM_ERRORS.inc(provider="ollama", type=upstream_error_type(e))
                 if e.response.status_code == 404:
                     raise ValueError(
                         f"Ollama model '{model}' not found. "
@@ -85,7 +309,17 @@ class OllamaClient:
                     )
                 raise ValueError(f"Ollama API error ({e.response.status_code}): {str(e)}")
             except httpx.RequestError as e:
-                raise ValueError(f"Failed to connect to Ollama at {self.ollama_url}: {str(e)}")
+                self.pool.end(host, e)
+                if not streaming and attempt < len(hosts) - 1:
+                    continue
+                LLM_UPSTREAM_ERRORS.inc(provider="ollama", type=upstream_error_type(e))
+                raise ValueError(f"Failed to connect to Ollama at {host.url}: {str(e)}")
+            except BaseException:
+                # Cancelled or closed by the caller
+                self.pool.end(host)
+                raise
+            self.pool.end(host)
+            return
     
     async def chat_completion(
         self,
@@ -93,6 +327,7 @@ class OllamaClient:
         model: Optional[str] = None,
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
+        cache: Optional[bool] = None,
     ) -> str:
         """
         Get non-streaming chat completion from Ollama.
@@ -102,39 +337,157 @@ class OllamaClient:
             model: Model name (optional, uses default)
             temperature: Sampling temperature
             max_tokens: Maximum tokens to generate
+            cache: Serve from / store in the completion cache
+                (default: only when temperature is 0)
             
         Returns:
             Complete response text
         """
         model = model or self.default_model
+        if cache is None:
+            cache = temperature == 0
+        if not cache:
+            return await self._chat_completion(messages, model, temperature, max_tokens)
         
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            try:
-                response = await client.post(
-                    f"{self.ollama_url}/api/chat",
-                    json={
-                        "model": model,
-                        "messages": messages,
-                        "stream": False,
-                        "options": {
-                            "temperature": temperature,
-                            **({"num_predict": max_tokens} if max_tokens else {})
-                        }
+        key = completion_cache_key("ollama", model, messages, temperature, max_tokens)
+        return await self.completion_cache.get_or_compute(
+            key,
+            lambda: self._chat_completion(messages, model, temperature, max_tokens),
+            provider="ollama",
+            model=model,
+        )
+    
+    async def _chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+    ) -> str:
+        """Uncached non-streaming chat completion"""
+        try:
+            response = await self._post(
+                "/api/chat",
+                {
+                    "model": model,
+                    "messages": messages,
+                    "stream": False,
+                    "keep_alive": self.keep_alive.for_model(model),
+                    "options": {
+                        "temperature": temperature,
+                        **({"num_predict": max_tokens} if max_tokens else {})
                     }
+                },
+                self.generation_timeout,
+            )
+            data = response.json()
+            return data.get("message", {}).get("content", "").strip()
+            
+        except httpx.HTTPStatusError as e:
+            LLM_UPSTREAM_ERRORS.inc(provider="ollama", type=upstream_error_type(e))
+            if e.response.status_code == 404:
+                raise ValueError(
+                    f"Ollama model '{model}' not found. "
+                    f"Please pull it first: ollama pull {model}"
+                )
+            raise ValueError(f"Ollama API error ({e.response.status_code}): {str(e)}")
+        except httpx.RequestError as e:
+            LLM_UPSTREAM_ERRORS.inc(provider="ollama", type=upstream_error_type(e))
+            raise ValueError(f"Failed to connect to Ollama at {_host_of(e)}: {str(e)}")
+    
+    async def embed(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """
+        Embed a batch of texts with one request to Ollama's embed endpoint.
+        
+        Args:
+            texts: Texts to embed
+            model: Embedding model (optional, uses OLLAMA_EMBED_MODEL)
+            
+        Returns:
+            One vector per text, in order
+        """
+        model = model or self.embed_model
+        try:
+            response = await self._post(
+                "/api/embed",
+                {"model": model, "input": texts, "keep_alive": self.keep_alive.for_model(model)},
+                self.generation_timeout,
+            )
+            embeddings = response.json().get("embeddings", [])
+        except httpx.HTTPStatusError as e:
+            LLM_UPSTREAM_ERRORS.inc(provider="ollama", type=upstream_error_type(e))
+            if e.response.status_code == 404:
+                raise ValueError(
+                    f"Ollama model '{model}' not found. "
+                    f"Please pull it first: ollama pull {model}"
                 )
-                response.raise_for_status()
-                data = response.json()
-                return data.get("message", {}).get("content", "").strip()
-                
+            raise ValueError(f"Ollama API error ({e.response.status_code}): {str(e)}")
+        except httpx.RequestError as e:
+            LLM_UPSTREAM_ERRORS.inc(provider="ollama", type=upstream_error_type(e))
+            raise ValueError(f"Failed to connect to Ollama at {_host_of(e)}: {str(e)}")
+        
+        if len(embeddings) != len(texts):
+            raise ValueError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} inputs")
+        return embeddings
+    
+    async def load_model(self, model: str):
+        """
+        Load a model into memory on every available host, or extend its
+        keep-alive, without generating.
+        
+        Chat models are loaded with an empty /api/chat request; the embedding
+        model, which /api/chat rejects, with a one-word /api/embed request.
+        
+        Raises:
+            ValueError: If the model is not pulled or unreachable on any of the hosts
+        """
+        if model == self.embed_model:
+            path, body = "/api/embed", {"model": model, "input": ["warm-up"]}
+        else:
+            path, body = "/api/chat", {"model": model, "messages": []}
+        body["keep_alive"] = self.keep_alive.for_model(model)
+        
+        async def load(host: UpstreamHost):
+            try:
+                await self._request(host, "POST", path, self.generation_timeout, body)
             except httpx.HTTPStatusError as e:
+                LLM_UPSTREAM_ERRORS.inc(provider="ollama", type=upstream_error_type(e))
                 if e.response.status_code == 404:
                     raise ValueError(
-                        f"Ollama model '{model}' not found. "
+                        f"Ollama model '{model}' not found on {host.url}. "
                         f"Please pull it first: ollama pull {model}"
                     )
-                raise ValueError(f"Ollama API error ({e.response.status_code}): {str(e)}")
+                raise ValueError(f"Ollama API error ({e.response.status_code}) on {host.url}: {str(e)}")
+            except httpx.RequestError as e:
+                LLM_UPSTREAM_ERRORS.inc(provider="ollama", type=upstream_error_type(e))
+                raise ValueError(f"Failed to connect to Ollama at {host.url}: {str(e)}")
+        
+        # Loads take seconds each, so the hosts load in parallel
+        results = await asyncio.gather(*(load(host) for host in self.pool.available()), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise ValueError("; ".join(str(error) for error in errors))
+    
+    async def running_models(self) -> List[Dict[str, Any]]:
+        """
+        Models currently loaded on the available Ollama hosts (/api/ps).
+        
+        Returns:
+            One dict per model and host with name, host, size_vram and expires_at
+        
+        Raises:
+            ValueError: If a host is unreachable or returns an error
+        """
+        models = []
+        for host in self.pool.available():
+            try:
+                response = await self._request(host, "GET", "/api/ps", self.metadata_timeout)
+            except httpx.HTTPStatusError as e:
+                raise ValueError(f"Ollama API error ({e.response.status_code}) on {host.url}: {str(e)}")
             except httpx.RequestError as e:
-                raise ValueError(f"Failed to connect to Ollama at {self.ollama_url}: {str(e)}")
+                raise ValueError(f"Failed to connect to Ollama at {host.url}: {str(e)}")
+            models.extend({**entry, "host": host.url} for entry in response.json().get("models", []))
+        return models
     
     async def check_model_available(self, model: Optional[str] = None) -> bool:
         """
@@ -144,18 +497,11 @@ class OllamaClient:
             model: Model name (optional, uses default)
             
         Returns:
-            True if model is available, False otherwise
+            True if model is available, False if it isn't pulled or Ollama
+            can't be reached (and no cached model list is usable)
         """
-        model = model or self.default_model
-        
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.get(f"{self.ollama_url}/api/tags")
-                if response.status_code == 200:
-                    models = response.json().get("models", [])
-                    model_names = [m.get("name", "") for m in models]
-                    return model in model_names
-                return False
-        except:
-            return False
+            return await self.registry.get(model or self.default_model) is not None
+        except ModelRegistryError:
+            return False  # Logged by the registry
 
@@ -4,19 +4,36 @@ FastAPI backend for the chat bot application.
 
 import os
 import logging
+from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTasks
 from pydantic import BaseModel
 from dotenv import load_dotenv
 from sqlalchemy.ext.asyncio import AsyncSession
 from uuid import UUID
-import json
 
-from database.base import get_db, init_db, AsyncSessionLocal
-from database.service import UserService, ChatService
+from database.base import get_db, init_db, pool_status, DATABASE_URL
+from database.invalidation import InvalidationListener
+from database.service import (
+    UserService, ChatService, GENERATION_STATS_BUCKETS, encode_message_cursor, decode_message_cursor
+)
 from llm_client import OllamaClient
+from model_manager import ModelManager
+from model_registry import ModelRegistryError
+from agents.llm_provider import LLMClient
+from completion_cache import completion_cache
+from chat_context import ContextBuilder
+from summarizer import ConversationSummarizer
+from scheduler import AdmissionController, AdmissionRejected, Slot
+from message_writer import MessageWriter
+from thread_cache import ThreadCache
+from chat_transfer import JsonlImporter, export_user_jsonl
+from retrieval import EmbeddingIndexer, SemanticRetriever
+from metrics import MetricsMiddleware, SSE_ACTIVE_STREAMS, registry
+from sse import coalesce_chunks, encode_content_frame, encode_event, run_detached, DONE_FRAME
 
 # Configure logging
 logging.basicConfig(
@@ -32,6 +49,42 @@ load_dotenv()
 # Initialize Ollama client
 ollama_client = OllamaClient()
 
+# Preloads the configured models and keeps them resident between requests
+model_manager = ModelManager(ollama_client)
+
+# Client that streams chat responses: Ollama by default, or OpenAI
+# (native async) with CHAT_PROVIDER=openai
+if os.getenv("CHAT_PROVIDER", "ollama").lower() == "openai":
+    chat_llm = LLMClient(provider="openai")
+else:
+    chat_llm = ollama_client
+
+# Assembles the bounded prompt history for each chat turn
+context_builder = ContextBuilder()
+
+# Recent context of active threads, so follow-up turns skip the history query
+thread_cache = ThreadCache(max_messages=context_builder.max_messages)
+
+# Folds older turns into a per-thread rolling summary
+summarizer = ConversationSummarizer(ollama_client, cache=thread_cache)
+
+# Per-model concurrency limits and fair queueing in front of Ollama; the
+# limits are per host, so capacity grows with the Ollama hosts in the pool
+admission = AdmissionController(hosts=len(ollama_client.pool.hosts) if chat_llm is ollama_client else 1)
+
+# Persists streamed chat messages in batches, off the response path
+message_writer = MessageWriter(cache=thread_cache)
+
+# Embeds messages in the background and pulls relevant older turns into
+# the prompt (EMBEDDINGS_ENABLED=true)
+retriever = SemanticRetriever(ollama_client)
+embedding_indexer = EmbeddingIndexer(ollama_client)
+
+# Drops cache entries changed by other workers (Postgres LISTEN/NOTIFY)
+invalidation_listener = InvalidationListener(DATABASE_URL)
+invalidation_listener.subscribe("thread", lambda key: thread_cache.invalidate_pk(UUID(key)))
+invalidation_listener.on_reset(thread_cache.clear)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -39,8 +92,23 @@ async def lifespan(app: FastAPI):
     # Startup: Initialize database
     await init_db()
     logger.info("Database initialized")
+    completion_cache.start()
+    # Open the shared Ollama connection pool
+    ollama_client.start()
+    await model_manager.start()
+    message_writer.start()
+    invalidation_listener.start()
+    embedding_indexer.start()
     yield
-    # Shutdown (if needed)
+    # Shutdown: write queued messages, then close pooled connections
+    await embedding_indexer.aclose()
+    await completion_cache.aclose()
+    await model_manager.aclose()
+    await message_writer.close()
+    await invalidation_listener.aclose()
+    await ollama_client.aclose()
+    if chat_llm is not ollama_client:
+        await chat_llm.aclose()
 
 
 app = FastAPI(
@@ -59,6 +127,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so latency covers everything up to the last byte sent
+app.add_middleware(MetricsMiddleware)
+
 
 # ==================== Request/Response Models ====================
 
@@ -182,36 +253,69 @@ async def list_chat_threads(
     db: AsyncSession = Depends(get_db)
 ):
     """List all chat threads for a user"""
-    threads = await ChatService.list_chat_threads(db, user_id, limit=limit)
+    summaries = await ChatService.list_chat_thread_summaries(db, user_id, limit=limit)
     
     result = []
-    for thread in threads:
-        # Get message count
-        messages = await ChatService.get_chat_messages(db, user_id, thread.thread_id)
+    for thread, last_role, last_preview, last_message_at in summaries:
         result.append({
             "id": str(thread.id),
             "thread_id": thread.thread_id,
             "title": thread.title,
             "created_at": thread.created_at.isoformat(),
             "updated_at": thread.updated_at.isoformat(),
-            "message_count": len(messages),
+            "message_count": thread.message_count,
+            "last_message": {
+                "role": last_role,
+                "preview": last_preview,
+                "created_at": last_message_at.isoformat(),
+            } if last_message_at else None,
         })
     
     return {"threads": result}
 
 
+def parse_message_cursor(cursor: str | None):
+    """Decode an optional pagination cursor, rejecting malformed ones with 400"""
+    if cursor is None:
+        return None
+    try:
+        return decode_message_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/api/chat/threads/{thread_id}")
 async def get_chat_thread(
     thread_id: str,
     user_id: UUID,  # TODO: Get from auth/session
+    message_limit: int | None = Query(None, ge=1, le=500),
+    before: str | None = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get a specific chat thread with messages"""
-    thread = await ChatService.get_chat_thread(db, user_id, thread_id, include_messages=True)
+    """
+    Get a specific chat thread with messages.
+    
+    Without message_limit/before every message is returned. With them, only
+    the newest page (or the page before the `before` cursor) is returned;
+    use `before_cursor` from the response to load older messages.
+    """
+    paginated = message_limit is not None or before is not None
+    await message_writer.wait_for(user_id, thread_id)
+    thread = await ChatService.get_chat_thread(db, user_id, thread_id, include_messages=not paginated)
     
     if not thread:
         raise HTTPException(status_code=404, detail="Chat thread not found")
     
+    if paginated:
+        page, has_more = await ChatService.get_thread_messages_page(
+            db, thread.id,
+            limit=message_limit,
+            before=parse_message_cursor(before),
+            latest=True,
+        )
+    else:
+        page, has_more = thread.messages, False
+    
     messages = [
         {
             "id": str(msg.id),
@@ -220,7 +324,7 @@ async def get_chat_thread(
             "metadata": msg.message_metadata,
             "created_at": msg.created_at.isoformat(),
         }
-        for msg in thread.messages
+        for msg in page
     ]
     
     return {
@@ -230,7 +334,9 @@ async def get_chat_thread(
         "created_at": thread.created_at.isoformat(),
         "updated_at": thread.updated_at.isoformat(),
         "messages": messages,
-        "message_count": len(messages),
+        "message_count": thread.message_count,
+        "has_more": has_more,
+        "before_cursor": encode_message_cursor(page[0]) if page else None,
     }
 
 
@@ -253,6 +359,7 @@ async def update_chat_thread(
         raise HTTPException(status_code=404, detail="Chat thread not found")
     
     await db.commit()
+    thread_cache.invalidate(user_id, thread_id)
     
     return {
         "id": str(thread.id),
@@ -275,6 +382,7 @@ async def delete_chat_thread(
         raise HTTPException(status_code=404, detail="Chat thread not found")
     
     await db.commit()
+    thread_cache.invalidate(user_id, thread_id)
     
     return {"message": f"Chat thread '{thread_id}' deleted successfully"}
 
@@ -303,6 +411,7 @@ async def create_chat_message(
         raise HTTPException(status_code=404, detail="Chat thread not found")
     
     await db.commit()
+    thread_cache.append(user_id, thread_id, message)
     
     return {
         "id": str(message.id),
@@ -314,15 +423,51 @@ async def create_chat_message(
     }
 
 
+@app.delete("/api/chat/threads/{thread_id}/messages/{message_id}")
+async def delete_chat_message(
+    thread_id: str,
+    message_id: UUID,
+    user_id: UUID,  # TODO: Get from auth/session
+    db: AsyncSession = Depends(get_db)
+):
+    """Delete a message from a chat thread"""
+    deleted = await ChatService.delete_chat_message(db, user_id, thread_id, message_id)
+    
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Chat message not found")
+    
+    await db.commit()
+    thread_cache.invalidate(user_id, thread_id)
+    
+    return {"message": f"Chat message '{message_id}' deleted successfully"}
+
+
 @app.get("/api/chat/threads/{thread_id}/messages")
 async def get_chat_messages(
     thread_id: str,
     user_id: UUID,  # TODO: Get from auth/session
-    limit: int | None = None,
+    limit: int = Query(50, ge=1, le=500),
+    before: str | None = None,
+    after: str | None = None,
+    latest: bool = False,
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all messages for a chat thread"""
-    messages = await ChatService.get_chat_messages(db, user_id, thread_id, limit=limit)
+    """
+    Get messages for a chat thread.
+    
+    Returns at most `limit` messages (default 50, up to 500). Supports
+    keyset pagination: pass `before_cursor` from a response as `before` to
+    page backwards, or `after_cursor` as `after` to page forwards. Set
+    `latest=true` to start from the newest messages.
+    """
+    await message_writer.wait_for(user_id, thread_id)
+    messages, has_more = await ChatService.get_chat_messages_page(
+        db, user_id, thread_id,
+        limit=limit,
+        before=parse_message_cursor(before),
+        after=parse_message_cursor(after),
+        latest=latest,
+    )
     
     return {
         "thread_id": thread_id,
@@ -337,77 +482,259 @@ async def get_chat_messages(
             for msg in messages
         ],
         "count": len(messages),
+        "has_more": has_more,
+        "before_cursor": encode_message_cursor(messages[0]) if messages else None,
+        "after_cursor": encode_message_cursor(messages[-1]) if messages else None,
     }
 
 
+@app.get("/api/chat/search")
+async def search_chat_messages(
+    q: str,
+    user_id: UUID,  # TODO: Get from auth/session
+    thread_id: str | None = None,
+    limit: int = 20,
+    offset: int = 0,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Full-text search over a user's messages.
+    
+    Supports web-search syntax ("quoted phrases", OR, -excluded). Results are
+    ranked by relevance and carry a snippet with matches wrapped in <mark>.
+    Page with `offset`; `next_offset` is null on the last page.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Search query must not be empty")
+    limit = max(1, min(limit, 100))
+    offset = max(offset, 0)
+    
+    rows, has_more = await ChatService.search_messages(
+        db, user_id, q, limit=limit, offset=offset, thread_id=thread_id
+    )
+    
+    return {
+        "query": q,
+        "results": [
+            {
+                "message_id": str(row.message_id),
+                "thread_id": row.thread_id,
+                "thread_title": row.thread_title,
+                "role": row.role,
+                "created_at": row.created_at.isoformat(),
+                "rank": row.rank,
+                "snippet": row.snippet,
+            }
+            for row in rows
+        ],
+        "count": len(rows),
+        "has_more": has_more,
+        "next_offset": offset + len(rows) if has_more else None,
+    }
+
+
+@app.get("/api/chat/export")
+async def export_chat_data(
+    user_id: UUID,  # TODO: Get from auth/session
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Export all threads and messages of a user as JSON Lines.
+    
+    The response is streamed from server-side cursors: one record per line,
+    every {"type": "thread"} record first, then the {"type": "message"}
+    records grouped by thread.
+    """
+    user = await UserService.get_user(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    return StreamingResponse(
+        export_user_jsonl(user_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="sigmachain-{user.username}.jsonl"'},
+    )
+
+
+@app.post("/api/chat/import")
+async def import_chat_data(
+    http_request: Request,
+    user_id: UUID,  # TODO: Get from auth/session
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Import threads and messages from a JSON Lines body in the export format.
+    
+    The body is parsed as it is received and written in batched multi-row
+    INSERTs. Existing threads with the same thread_id are appended to.
+    Invalid lines are skipped; the response reports how many there were
+    and the first few with their line numbers.
+    """
+    user = await UserService.get_user(db, user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    await db.commit()
+    
+    importer = JsonlImporter(user_id)
+    try:
+        return await importer.import_stream(http_request.stream())
+    finally:
+        # Batches committed before a failure are kept
+        for thread_pk in importer.thread_pks:
+            thread_cache.invalidate_pk(thread_pk)
+
+
 @app.post("/api/chat/threads/{thread_id}/stream")
 async def stream_chat_response(
     thread_id: str,
     request: ChatMessageRequest,
+    http_request: Request,
     user_id: UUID,  # TODO: Get from auth/session
     db: AsyncSession = Depends(get_db)
 ):
     """
     Stream chat response from LLM.
     Uses Server-Sent Events (SSE) for streaming.
+    
+    If the client disconnects mid-stream, the upstream generation is aborted
+    and the partial response is saved with metadata truncated=true.
+    
+    Generations are admitted through the per-model scheduler. When the model
+    is saturated the request waits in a fair queue; if the queue is full or
+    the wait is too long, it fails fast with 429/503 and a Retry-After header.
     """
-    # Get thread and verify it exists
-    thread = await ChatService.get_chat_thread(db, user_id, thread_id, include_messages=True)
-    if not thread:
-        raise HTTPException(status_code=404, detail="Chat thread not found")
+    # Wait for a generation slot before touching the database, so queued
+    # requests don't hold pooled connections
+    try:
+        slot = await admission.acquire(chat_llm.default_model, str(user_id))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"Model is busy ({e.reason}), retry later",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    try:
+        return await _stream_chat_response(thread_id, request, http_request, user_id, db, slot)
+    except BaseException:
+        slot.release()
+        raise
+
+
+async def _stream_chat_response(
+    thread_id: str,
+    request: ChatMessageRequest,
+    http_request: Request,
+    user_id: UUID,
+    db: AsyncSession,
+    slot: Slot,
+):
+    # Active threads are served from the cache without touching the database
+    context = thread_cache.get(user_id, thread_id)
+    if context is None:
+        # The previous turn's messages may still be queued for writing
+        await message_writer.wait_for(user_id, thread_id)
+        token = thread_cache.begin_load(user_id, thread_id)
+        
+        # Get thread and verify it exists
+        thread = await ChatService.get_chat_thread(db, user_id, thread_id, include_messages=False)
+        if not thread:
+            thread_cache.invalidate(user_id, thread_id)
+            raise HTTPException(status_code=404, detail="Chat thread not found")
+        thread_cache.resolve_load(token, thread.id)
+        
+        # Load only the recent history that can fit in the context window;
+        # anything covered by the thread summary is sent as the summary instead
+        summary_boundary = None
+        if thread.summary_message_id:
+            summary_boundary = (thread.summary_message_created_at, thread.summary_message_id)
+        history = await ChatService.get_recent_messages(
+            db, thread.id, limit=context_builder.max_messages, after=summary_boundary
+        )
+        context = thread_cache.put(user_id, thread_id, thread, history, token)
+        
+        # End the read transaction so no connection is held while streaming
+        await db.commit()
     
-    # Save user message
-    user_message = await ChatService.create_chat_message(
-        session=db,
-        user_id=user_id,
-        thread_id=thread_id,
-        role="user",
-        content=request.content,
-        metadata={},
+    # Copy the cached messages; queuing the new message appends to them
+    history = list(context.messages)
+    
+    # Older turns related to this message, beyond the recent history
+    retrieved = await retriever.retrieve(user_id, request.content, exclude={msg.id for msg in history})
+    
+    # Cached metadata only, no request to Ollama; the model manager keeps it fresh
+    model_info = ollama_client.registry.peek(ollama_client.default_model) if chat_llm is ollama_client else None
+    
+    # Build token-budgeted message history for LLM, within the model's context window
+    messages = context_builder.build(
+        history,
+        request.content,
+        summary=context.summary,
+        retrieved=retrieved,
+        context_length=model_info.context_length if model_info else None,
     )
-    await db.commit()
     
-    # Build message history for LLM
-    messages = []
-    for msg in thread.messages:
-        messages.append({
-            "role": msg.role,
-            "content": msg.content
-        })
+    # Save user message in the background
+    message_writer.enqueue(user_id, thread_id, context.thread_pk, "user", request.content)
     
-    # Add the new user message
-    messages.append({
-        "role": "user",
-        "content": request.content
-    })
+    def save_assistant_message(content: str, metadata: dict):
+        message_writer.enqueue(user_id, thread_id, context.thread_pk, "assistant", content, metadata)
     
     # Stream response from Ollama
     async def generate_response():
-        full_response = ""
+        # Tokens are coalesced into fewer frames; the response text is
+        # accumulated as a list and joined once at the end
+        parts = []
+        # Cleared once the stream ends normally or with an upstream error
+        interrupted = True
+        # Ollama's timing stats, filled in when generation completes
+        generation = {}
+        # Closing this stream closes the upstream connection, which stops generation
+        # Routed by thread, so follow-up turns reuse the host's cached prompt prefix
+        stream = coalesce_chunks(
+            chat_llm.stream_chat(messages=messages, stats=generation, route_key=str(context.thread_pk))
+        )
+        SSE_ACTIVE_STREAMS.inc()
         try:
-            async for chunk in ollama_client.stream_chat(messages=messages):
-                full_response += chunk
+            async for chunk in stream:
+                parts.append(chunk)
+                if await http_request.is_disconnected():
+                    break
                 # Send chunk as SSE
-                yield f"data: {json.dumps({'content': chunk, 'done': False})}\n\n"
-            
-            # Save assistant message to database
-            async with AsyncSessionLocal() as save_session:
-                await ChatService.create_chat_message(
-                    session=save_session,
-                    user_id=user_id,
-                    thread_id=thread_id,
-                    role="assistant",
-                    content=full_response,
-                    metadata={},
-                )
-                await save_session.commit()
-            
-            # Send final done message
-            yield f"data: {json.dumps({'content': '', 'done': True})}\n\n"
+                yield encode_content_frame(chunk)
+            else:
+                interrupted = False
+                # Queue the assistant message; the done frame doesn't wait for the write
+                save_assistant_message("".join(parts), {"generation": generation} if generation else {})
+                # Send final done message
+                yield DONE_FRAME
             
         except Exception as e:
+            interrupted = False
             logger.error(f"Error streaming chat response: {e}")
-            yield f"data: {json.dumps({'error': str(e), 'done': True})}\n\n"
+            yield encode_event({"error": str(e), "done": True})
+        finally:
+            SSE_ACTIVE_STREAMS.dec()
+            slot.release()
+            # The client went away, noticed either by the check above or by
+            # the server cancelling this generator
+            if interrupted:
+                # Queue the partial response before any await: when the server
+                # cancelled this generator, every await here raises again
+                if parts:
+                    logger.info(f"Client disconnected from thread '{thread_id}', saving partial response")
+                    save_assistant_message(
+                        "".join(parts),
+                        {"truncated": True, "finish_reason": "client_disconnected"},
+                    )
+                await run_detached(stream.aclose())
+    
+    # Run after the stream finishes; releasing the slot again is a no-op
+    # unless the generator never started
+    background = BackgroundTasks()
+    background.add_task(slot.release)
+    # Background tasks run in order: summarize once this turn is written
+    background.add_task(message_writer.wait_for, user_id, thread_id)
+    background.add_task(summarizer.maybe_summarize, context.thread_pk)
     
     return StreamingResponse(
         generate_response(),
@@ -415,7 +742,8 @@ async def stream_chat_response(
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
-        }
+        },
+        background=background,
     )
 
 
@@ -426,10 +754,116 @@ async def get_settings():
     """Get application settings"""
     return {
         "ollama_url": ollama_client.ollama_url,
+        "ollama_urls": [host.url for host in ollama_client.pool.hosts],
         "default_model": ollama_client.default_model,
+        "chat_provider": "openai" if chat_llm is not ollama_client else "ollama",
+        "chat_model": chat_llm.default_model,
+        "keep_alive": ollama_client.keep_alive.default,
+        "models": model_manager.stats()["models"],
+    }
+
+
+@app.get("/api/system/admission")
+async def get_admission_stats():
+    """Per-model concurrency, queue depth and wait-time metrics"""
+    return {"models": admission.stats()}
+
+
+@app.get("/api/system/db-pool")
+async def get_db_pool_stats():
+    """Database connection pool saturation and checkout wait metrics"""
+    return pool_status()
+
+
+@app.get("/api/system/message-writer")
+async def get_message_writer_stats():
+    """Write-behind message queue depth and batch counters"""
+    return message_writer.stats()
+
+
+@app.get("/api/system/thread-cache")
+async def get_thread_cache_stats():
+    """Hot-thread context cache hit/miss/eviction counters"""
+    return thread_cache.stats()
+
+
+@app.get("/api/system/invalidation")
+async def get_invalidation_stats():
+    """Cross-worker cache invalidation listener state"""
+    return invalidation_listener.stats()
+
+
+@app.get("/api/system/embeddings")
+async def get_embedding_stats():
+    """Embedding indexer progress and semantic retrieval counters"""
+    return {"indexer": embedding_indexer.stats(), "retriever": retriever.stats()}
+
+
+@app.get("/api/system/upstreams")
+async def get_upstream_stats():
+    """Per-host load, health check and circuit breaker state of the Ollama pool"""
+    return ollama_client.pool.stats()
+
+
+@app.get("/api/system/models")
+async def get_models():
+    """
+    Pulled Ollama models with size, quantization and context length.
+    
+    Served from the model registry cache; 503 only when Ollama can't be
+    reached and there is no usable cached copy.
+    """
+    try:
+        await ollama_client.registry.models()
+    except ModelRegistryError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"models": ollama_client.registry.catalog(), "registry": ollama_client.registry.stats()}
+
+
+@app.get("/api/system/generation-stats")
+async def get_generation_stats(
+    hours: int = 24,
+    bucket: str = "hour",
+    model: str | None = None,
+    reload_threshold_ms: float = 1000,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    p50/p95 generation speed and prompt cost per model over time.
+    
+    Computed from the Ollama timing stats stored with each assistant message.
+    Falling tokens/sec with rising load times points at model reloads;
+    growing prompt tokens and prompt eval time point at context bloat.
+    """
+    hours = max(1, min(hours, 24 * 90))
+    if bucket not in GENERATION_STATS_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket must be one of: {', '.join(GENERATION_STATS_BUCKETS)}")
+    stats = await ChatService.get_generation_stats(
+        db,
+        since=datetime.utcnow() - timedelta(hours=hours),
+        bucket=bucket,
+        model=model,
+        reload_threshold_ms=reload_threshold_ms,
+    )
+    return {
+        "bucket": bucket,
+        "reload_threshold_ms": reload_threshold_ms,
+        "stats": [{**row, "bucket": row["bucket"].isoformat()} for row in stats],
     }
 
 
+@app.get("/api/system/completion-cache")
+async def get_completion_cache_stats():
+    """Completion cache hit/miss/eviction counters"""
+    return completion_cache.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request, LLM, database and streaming metrics in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/health")
 async def health():
     """Health check"""
@@ -0,0 +1,212 @@
+"""
+Write-behind persistence of chat messages
+"""
+
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy.exc import DBAPIError, IntegrityError, InterfaceError, OperationalError
+
+from database.base import AsyncSessionLocal
+from database.service import ChatService
+from thread_cache import CachedMessage, ThreadCache
+
+logger = logging.getLogger(__name__)
+
+# (user_id, thread_id) as used in the API routes
+ThreadKey = Tuple[UUID, str]
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether a failed batch is worth retrying"""
+    if isinstance(error, (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, IntegrityError):
+        # A thread was deleted between the row lock and the insert; the retry
+        # drops its messages
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class _PendingMessage:
+    __slots__ = ("key", "row")
+
+    def __init__(self, key: ThreadKey, row: Dict[str, Any]):
+        self.key = key
+        self.row = row
+
+
+class MessageWriter:
+    """
+    Persists chat messages in the background.
+
+    enqueue() assigns the message its id and timestamp and returns at once;
+    a single background task drains the queue and writes everything that has
+    accumulated as one multi-row INSERT plus one counter UPDATE. At low load
+    each message is written as soon as it arrives; under load batches grow
+    while the previous write is in flight.
+
+    Readers that need to see a thread's latest messages call wait_for(),
+    which returns immediately unless writes for that thread are queued.
+    """
+
+    def __init__(
+        self,
+        max_batch: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        retry_delay: Optional[float] = None,
+        cache: Optional[ThreadCache] = None,
+    ):
+        """
+        Initialize message writer.
+
+        Args:
+            max_batch: Maximum messages per INSERT (MESSAGE_WRITE_BATCH, default 100)
+            max_retries: Retries of a batch after a transient error (MESSAGE_WRITE_RETRIES, default 3)
+            retry_delay: Initial retry backoff in seconds, doubled per attempt
+                (MESSAGE_WRITE_RETRY_DELAY, default 0.5)
+            cache: Thread cache updated write-through on enqueue (optional)
+        """
+        self.max_batch = max_batch or int(os.getenv("MESSAGE_WRITE_BATCH", "100"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("MESSAGE_WRITE_RETRIES", "3"))
+        self.retry_delay = retry_delay or float(os.getenv("MESSAGE_WRITE_RETRY_DELAY", "0.5"))
+        self.cache = cache
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Dict[ThreadKey, int] = {}
+        self._written: Optional[asyncio.Condition] = None
+        # Metrics
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.retries = 0
+        self.max_batch_seen = 0
+
+    def start(self):
+        """Start the background writer task"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._written = asyncio.Condition()
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Write everything still queued, then stop the background task"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    def enqueue(
+        self,
+        user_id: UUID,
+        thread_id: str,
+        thread_pk: UUID,
+        role: str,
+        content: str,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> UUID:
+        """
+        Queue a message for insertion.
+
+        The message's position in the thread is fixed here, not when it is
+        written, so ordering matches the order of enqueue() calls.
+
+        Returns:
+            The id the message will be stored under
+        """
+        self.start()
+        key = (user_id, thread_id)
+        row = {
+            "id": uuid.uuid4(),
+            "thread_id": thread_pk,
+            "role": role,
+            "content": content,
+            "message_metadata": metadata or {},
+            "created_at": datetime.utcnow(),
+        }
+        self._pending[key] = self._pending.get(key, 0) + 1
+        self._queue.put_nowait(_PendingMessage(key, row))
+        self.enqueued += 1
+        if self.cache is not None:
+            self.cache.append(user_id, thread_id, CachedMessage(row["id"], role, content, row["created_at"]))
+        return row["id"]
+
+    async def wait_for(self, user_id: UUID, thread_id: str):
+        """Wait until queued messages of a thread have been written (or dropped)"""
+        key = (user_id, thread_id)
+        if key not in self._pending:
+            return
+        async with self._written:
+            await self._written.wait_for(lambda: key not in self._pending)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            batch: List[_PendingMessage] = []
+            while True:
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.max_batch or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            if batch:
+                await self._write(batch)
+
+    async def _write(self, batch: List[_PendingMessage]):
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with AsyncSessionLocal() as session:
+                        written = await ChatService.create_messages_bulk(session, [msg.row for msg in batch])
+                        await session.commit()
+                except Exception as e:
+                    if attempt < self.max_retries and _is_transient(e):
+                        self.retries += 1
+                        logger.warning(f"Message batch write failed, retrying: {e}")
+                        await asyncio.sleep(self.retry_delay * 2 ** attempt)
+                        continue
+                    self.dropped += len(batch)
+                    logger.error(f"Dropping {len(batch)} chat messages after write failure: {e}")
+                    if self.cache is not None:
+                        # Cached threads must not show messages that were never stored
+                        for key in {msg.key for msg in batch}:
+                            self.cache.invalidate(*key)
+                    return
+                self.batches += 1
+                self.written += written
+                # Messages of threads deleted while they were queued
+                self.dropped += len(batch) - written
+                self.max_batch_seen = max(self.max_batch_seen, len(batch))
+                return
+        finally:
+            for msg in batch:
+                remaining = self._pending[msg.key] - 1
+                if remaining:
+                    self._pending[msg.key] = remaining
+                else:
+                    del self._pending[msg.key]
+            async with self._written:
+                self._written.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and write counters"""
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "threads_pending": len(self._pending),
+            "enqueued_total": self.enqueued,
+            "written_total": self.written,
+            "dropped_total": self.dropped,
+            "batches_total": self.batches,
+            "retries_total": self.retries,
+            "max_batch": self.max_batch_seen,
+        }
@@ -0,0 +1,330 @@
+"""
+In-process metrics in the Prometheus text exposition format
+"""
+
+import time
+import functools
+import inspect
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Latency buckets in seconds, from sub-millisecond DB calls to long generations
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values in cumulative buckets.
+
+    observe() is a bisect plus three additions; buckets are only summed up
+    when rendering.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = [[0] * (len(self.buckets) + 1), 0.0]
+            self._values[key] = state
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route, until the last byte of the response",
+    ["method", "route", "status"],
+))
+LLM_TIME_TO_FIRST_TOKEN_SECONDS = registry.register(Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from sending a streaming request to receiving the first token",
+    ["provider", "model"],
+))
+LLM_TOKENS_PER_SECOND = registry.register(Histogram(
+    "llm_tokens_per_second",
+    "Streamed generation speed after the first token",
+    ["provider", "model"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500),
+))
+LLM_UPSTREAM_ERRORS = registry.register(Counter(
+    "llm_upstream_errors_total",
+    "Failed requests to LLM providers by error type",
+    ["provider", "type"],
+))
+DB_METHOD_SECONDS = registry.register(Histogram(
+    "db_method_duration_seconds",
+    "Duration of database service methods",
+    ["service", "method"],
+))
+OLLAMA_HOST_OUTSTANDING = registry.register(Gauge(
+    "ollama_host_outstanding_requests",
+    "Requests in flight per Ollama host",
+    ["host"],
+))
+OLLAMA_HOST_UP = registry.register(Gauge(
+    "ollama_host_up",
+    "1 if the Ollama host passes health checks and its circuit breaker is closed",
+    ["host"],
+))
+OLLAMA_HOST_ERRORS = registry.register(Counter(
+    "ollama_host_errors_total",
+    "Failed requests per Ollama host by error type, including ones retried on another host",
+    ["host", "type"],
+))
+LLM_ADMISSION_ACTIVE = registry.register(Gauge(
+    "llm_admission_active_requests",
+    "LLM generations holding a concurrency slot, per model",
+    ["model"],
+))
+LLM_ADMISSION_QUEUE_DEPTH = registry.register(Gauge(
+    "llm_admission_queue_depth",
+    "LLM requests waiting for a concurrency slot, per model",
+    ["model"],
+))
+LLM_ADMISSION_WAIT_SECONDS = registry.register(Histogram(
+    "llm_admission_wait_seconds",
+    "Time admitted LLM requests waited for a concurrency slot",
+    ["model"],
+))
+SSE_ACTIVE_STREAMS = registry.register(Gauge(
+    "sse_active_streams",
+    "Chat responses currently being streamed",
+))
+
+
+class StreamTimer:
+    """Measures time-to-first-token and generation speed of one streamed response"""
+
+    __slots__ = ("provider", "model", "started", "first_token_at", "tokens")
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.tokens = 0
+
+    def token(self):
+        """Record one streamed chunk; providers stream roughly one token per chunk"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            LLM_TIME_TO_FIRST_TOKEN_SECONDS.observe(
+                self.first_token_at - self.started, provider=self.provider, model=self.model
+            )
+        self.tokens += 1
+
+    def finish(self):
+        """Record generation speed once the stream has completed"""
+        if self.first_token_at is None or self.tokens < 2:
+            return
+        elapsed = time.perf_counter() - self.first_token_at
+        if elapsed > 0:
+            LLM_TOKENS_PER_SECOND.observe((self.tokens - 1) / elapsed, provider=self.provider, model=self.model)
+
+
+def upstream_error_type(error: BaseException) -> str:
+    """Short label for an upstream failure, e.g. 'timeout' or 'http_503'"""
+    import httpx
+
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code}"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, httpx.ConnectError):
+        return "connect"
+    if isinstance(error, httpx.RequestError):
+        return "transport"
+    return type(error).__name__
+
+
+def timed_methods(histogram: Histogram, service_label: Optional[str] = None) -> Callable[[type], type]:
+    """
+    Class decorator recording the duration of every public async static method.
+
+    Methods are labelled with the class name (or service_label) and the
+    method name.
+    """
+
+    def decorate(cls: type) -> type:
+        service = service_label or cls.__name__
+        for name, attr in list(vars(cls).items()):
+            if name.startswith("_") or not isinstance(attr, staticmethod):
+                continue
+            func = attr.__func__
+            if not inspect.iscoroutinefunction(func):
+                continue
+            setattr(cls, name, staticmethod(_timed(func, histogram, service, name)))
+        return cls
+
+    return decorate
+
+
+def _timed(func: Callable, histogram: Histogram, service: str, method: str) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started, service=service, method=method)
+
+    return wrapper
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each request by its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                # Unmatched paths share one label so arbitrary URLs can't grow the series
+                route=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
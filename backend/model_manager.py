@@ -0,0 +1,189 @@
+"""
+Preloading and keep-alive management of Ollama models
+"""
+
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from llm_client import OllamaClient
+
+logger = logging.getLogger(__name__)
+
+
+class _ModelState:
+    __slots__ = ("state", "error", "loaded_at", "load_seconds", "expires_at", "size_vram", "pings", "reloads")
+
+    def __init__(self):
+        self.state = "unknown"
+        self.error: Optional[str] = None
+        self.loaded_at: Optional[datetime] = None
+        self.load_seconds: Optional[float] = None
+        self.expires_at: Optional[str] = None
+        self.size_vram: Optional[int] = None
+        self.pings = 0
+        self.reloads = 0
+
+
+class ModelManager:
+    """
+    Keeps the configured Ollama models loaded on every Ollama host.
+
+    On startup each model is loaded with an empty request, so the first
+    user request doesn't pay the model load time. Every request carries the
+    model's keep_alive (see KeepAlivePolicy), and every ping_interval the
+    manager checks which models Ollama still has loaded (/api/ps) and pings
+    each configured model, which reloads it if it was evicted and restarts
+    its keep-alive timer. It also keeps the model registry warm, even with
+    preloading disabled, so request-time lookups (context lengths) never wait.
+    """
+
+    def __init__(
+        self,
+        llm: OllamaClient,
+        models: Optional[List[str]] = None,
+        ping_interval: Optional[float] = None,
+        startup_wait: Optional[float] = None,
+    ):
+        """
+        Initialize model manager.
+
+        Args:
+            llm: Client used to load and ping models
+            models: Models to keep loaded (OLLAMA_PRELOAD_MODELS, comma-separated; default
+                OLLAMA_MODEL and OLLAMA_VISION_MODEL, plus the embedding model when
+                EMBEDDINGS_ENABLED=true; empty disables preloading)
+            ping_interval: Seconds between pings (MODEL_PING_INTERVAL, default 240); keep
+                it below the shortest keep_alive
+            startup_wait: Seconds startup waits for the initial preload before serving
+                (MODEL_PRELOAD_WAIT, default 0: preload in the background)
+        """
+        self.llm = llm
+        if models is None:
+            configured = os.getenv("OLLAMA_PRELOAD_MODELS")
+            if configured is None:
+                models = [llm.default_model, os.getenv("OLLAMA_VISION_MODEL", "llava")]
+                if os.getenv("EMBEDDINGS_ENABLED", "false").lower() == "true":
+                    models.append(llm.embed_model)
+            else:
+                models = configured.split(",")
+        self.models = list(dict.fromkeys(name.strip() for name in models if name.strip()))
+        self.ping_interval = ping_interval or float(os.getenv("MODEL_PING_INTERVAL", "240"))
+        self.startup_wait = startup_wait if startup_wait is not None else float(os.getenv("MODEL_PRELOAD_WAIT", "0"))
+        self._states: Dict[str, _ModelState] = {name: _ModelState() for name in self.models}
+        self._preloaded = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start preloading and pinging in the background, waiting up to startup_wait for the preload"""
+        if self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+        if self.startup_wait > 0 and self.models:
+            try:
+                await asyncio.wait_for(self._preloaded.wait(), self.startup_wait)
+            except asyncio.TimeoutError:
+                logger.warning(f"Models still loading after {self.startup_wait:.0f}s, serving anyway")
+
+    async def aclose(self):
+        """Stop pinging"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        await self._refresh_registry()
+        # Loaded one at a time: Ollama loads models serially anyway, and a
+        # model that fails to load must not delay the others
+        for model in self.models:
+            await self._load(model)
+        self._preloaded.set()
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await self._refresh_registry()
+            if self.models:
+                await self._refresh()
+            for model in self.models:
+                await self._load(model, ping=True)
+
+    async def _load(self, model: str, ping: bool = False):
+        state = self._states[model]
+        if state.state != "loaded":
+            state.state = "loading"
+        started = time.perf_counter()
+        try:
+            await self.llm.load_model(model)
+        except ValueError as e:
+            if state.error != str(e):
+                logger.warning(f"Failed to load model '{model}': {e}")
+            state.state = "error"
+            state.error = str(e)
+            return
+        elapsed = time.perf_counter() - started
+        if ping:
+            state.pings += 1
+        else:
+            logger.info(f"Model '{model}' loaded in {elapsed:.1f}s")
+        if not ping or state.state != "loaded":
+            state.loaded_at = datetime.utcnow()
+            state.load_seconds = elapsed
+        state.state = "loaded"
+        state.error = None
+
+    async def _refresh_registry(self):
+        """Keep the model catalog warm, so lookups on the request path never wait for /api/tags"""
+        try:
+            await self.llm.registry.models()
+        except ValueError:
+            pass  # Reported by the registry
+
+    async def _refresh(self):
+        """Update load state from the models Ollama reports as loaded"""
+        hosts = len(self.llm.pool.available())
+        try:
+            entries = await self.llm.running_models()
+        except ValueError as e:
+            logger.warning(f"Could not list loaded models: {e}")
+            return
+        running: Dict[str, List[Dict[str, Any]]] = {}
+        for entry in entries:
+            running.setdefault(entry.get("name"), []).append(entry)
+        for model, state in self._states.items():
+            # /api/ps reports names with their tag, e.g. "llama2:latest"
+            loaded = running.get(model) or running.get(f"{model}:latest") or []
+            if len(loaded) < hosts:
+                if state.state == "loaded":
+                    # Evicted from a host despite the pings (memory pressure or a restart)
+                    state.state = "unloaded"
+                    state.reloads += 1
+            if loaded:
+                state.expires_at = min(entry.get("expires_at") or "" for entry in loaded) or None
+                state.size_vram = sum(entry.get("size_vram") or 0 for entry in loaded)
+            else:
+                state.expires_at = None
+                state.size_vram = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Load state of each managed model"""
+        return {
+            "ping_interval": self.ping_interval,
+            "models": {
+                model: {
+                    "state": state.state,
+                    "keep_alive": self.llm.keep_alive.for_model(model),
+                    "loaded_at": state.loaded_at.isoformat() if state.loaded_at else None,
+                    "load_seconds": state.load_seconds,
+                    "expires_at": state.expires_at,
+                    "size_vram": state.size_vram,
+                    "pings_total": state.pings,
+                    "reloads_total": state.reloads,
+                    "error": state.error,
+                }
+                for model, state in self._states.items()
+            },
+        }
@@ -0,0 +1,218 @@
+"""
+Cached catalog of the models available in Ollama
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from metrics import LLM_UPSTREAM_ERRORS, upstream_error_type
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistryError(ValueError):
+    """The model catalog could not be fetched and no cached copy is usable"""
+
+
+def normalize_model_name(name: str) -> str:
+    """Ollama lists untagged models with the implicit ":latest" tag"""
+    return name if ":" in name else f"{name}:latest"
+
+
+class ModelInfo:
+    """Metadata of one pulled model"""
+
+    __slots__ = ("name", "digest", "size", "family", "parameter_size", "quantization", "context_length", "modified_at")
+
+    def __init__(self, entry: Dict[str, Any]):
+        details = entry.get("details") or {}
+        self.name: str = entry.get("name") or entry.get("model", "")
+        self.digest: Optional[str] = entry.get("digest")
+        self.size: Optional[int] = entry.get("size")
+        self.family: Optional[str] = details.get("family")
+        self.parameter_size: Optional[str] = details.get("parameter_size")
+        self.quantization: Optional[str] = details.get("quantization_level")
+        self.modified_at: Optional[str] = entry.get("modified_at")
+        # Filled from /api/show, which /api/tags doesn't include
+        self.context_length: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.__slots__}
+
+
+def _context_length(show: Dict[str, Any]) -> Optional[int]:
+    """Context window from an /api/show response; a num_ctx parameter in the Modelfile overrides the architecture's"""
+    for line in (show.get("parameters") or "").splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[0] == "num_ctx" and parts[1].isdigit():
+            return int(parts[1])
+    for key, value in (show.get("model_info") or {}).items():
+        if key.endswith(".context_length") and isinstance(value, int):
+            return value
+    return None
+
+
+class ModelRegistry:
+    """
+    Ollama's model list (/api/tags) with per-model metadata, cached in memory.
+
+    Entries younger than ttl are served as they are. Older entries, up to
+    max_stale, are still served while one background request refreshes them
+    (stale-while-revalidate); beyond that, or before the first fetch, callers
+    wait for the refresh. Concurrent refreshes are coalesced into one request.
+    Context lengths come from /api/show, fetched once per model digest.
+
+    peek() answers from the cache without any I/O, for code on the request
+    path that must not wait on Ollama.
+    """
+
+    def __init__(self, client, ttl: Optional[float] = None, max_stale: Optional[float] = None):
+        """
+        Initialize model registry.
+
+        Args:
+            client: OllamaClient or LLMClient whose ollama_url, http_client and
+                metadata_timeout are used for the requests
+            ttl: Seconds the catalog is fresh (MODEL_REGISTRY_TTL, default 60)
+            max_stale: Seconds past ttl a stale catalog is still served while it
+                refreshes (MODEL_REGISTRY_MAX_STALE, default 3600)
+        """
+        self.client = client
+        self.ttl = ttl if ttl is not None else float(os.getenv("MODEL_REGISTRY_TTL", "60"))
+        self.max_stale = max_stale if max_stale is not None else float(os.getenv("MODEL_REGISTRY_MAX_STALE", "3600"))
+        self._models: Dict[str, ModelInfo] = {}
+        self._fetched_at: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.last_error: Optional[str] = None
+        self.refreshes = 0
+        self.failures = 0
+        self.stale_hits = 0
+
+    def _age(self) -> Optional[float]:
+        return None if self._fetched_at is None else time.monotonic() - self._fetched_at
+
+    async def models(self) -> Dict[str, ModelInfo]:
+        """
+        All pulled models by name.
+
+        Raises:
+            ModelRegistryError: If Ollama can't be reached and the cache is empty or too old
+        """
+        age = self._age()
+        if age is not None and age < self.ttl:
+            return self._models
+        if age is not None and age < self.ttl + self.max_stale:
+            self.stale_hits += 1
+            self._start_refresh()
+            return self._models
+        await asyncio.shield(self._start_refresh())
+        return self._models
+
+    async def get(self, model: str) -> Optional[ModelInfo]:
+        """
+        Metadata of a model, or None if it isn't pulled.
+
+        Raises:
+            ModelRegistryError: If Ollama can't be reached and the cache is empty or too old
+        """
+        return (await self.models()).get(normalize_model_name(model))
+
+    def peek(self, model: str) -> Optional[ModelInfo]:
+        """Cached metadata of a model, without refreshing; None if unknown"""
+        return self._models.get(normalize_model_name(model))
+
+    async def refresh(self) -> Dict[str, ModelInfo]:
+        """
+        Fetch the catalog now, waiting for a refresh already in flight.
+
+        Raises:
+            ModelRegistryError: If the catalog couldn't be fetched
+        """
+        await asyncio.shield(self._start_refresh())
+        if self.last_error is not None:
+            raise ModelRegistryError(self.last_error)
+        return self._models
+
+    def _start_refresh(self) -> asyncio.Task:
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+            # Failures of background refreshes are reported through last_error
+            self._refresh_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._refresh_task
+
+    async def _refresh(self):
+        self.refreshes += 1
+        try:
+            tags = await self._get_json("/api/tags")
+        except ModelRegistryError as e:
+            self.failures += 1
+            if self.last_error != str(e):
+                logger.warning(f"Failed to refresh model catalog: {e}")
+            self.last_error = str(e)
+            age = self._age()
+            if age is None or age >= self.ttl + self.max_stale:
+                raise
+            return
+        models = {}
+        for entry in tags.get("models", []):
+            info = ModelInfo(entry)
+            previous = self._models.get(info.name)
+            if previous is not None and previous.digest == info.digest:
+                info.context_length = previous.context_length
+            models[info.name] = info
+        await asyncio.gather(*(
+            self._fetch_context_length(info) for info in models.values() if info.context_length is None
+        ))
+        self._models = models
+        self._fetched_at = time.monotonic()
+        self.last_error = None
+
+    async def _fetch_context_length(self, info: ModelInfo):
+        try:
+            show = await self._get_json("/api/show", {"model": info.name})
+        except ModelRegistryError as e:
+            # The tag list is still usable; the context length is retried on the next refresh
+            logger.warning(f"Failed to read metadata of model '{info.name}': {e}")
+            return
+        info.context_length = _context_length(show)
+
+    async def _get_json(self, path: str, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        url = f"{self.client.ollama_url}{path}"
+        try:
+            if body is None:
+                response = await self.client.http_client.get(url, timeout=self.client.metadata_timeout)
+            else:
+                response = await self.client.http_client.post(url, json=body, timeout=self.client.metadata_timeout)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            LLM_UPSTREAM_ERRORS.inc(provider="ollama", type=upstream_error_type(e))
+            raise ModelRegistryError(f"Ollama API error ({e.response.status_code}) on {path}")
+        except httpx.RequestError as e:
+            LLM_UPSTREAM_ERRORS.inc(provider="ollama", type=upstream_error_type(e))
+            raise ModelRegistryError(f"Failed to connect to Ollama at {self.client.ollama_url}: {str(e)}")
+        except ValueError as e:
+            raise ModelRegistryError(f"Invalid response from Ollama on {path}: {str(e)}")
+
+    def catalog(self) -> List[Dict[str, Any]]:
+        """Cached metadata of all models"""
+        return [info.to_dict() for info in self._models.values()]
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache state and refresh counters"""
+        age = self._age()
+        return {
+            "models": len(self._models),
+            "age_seconds": round(age, 1) if age is not None else None,
+            "ttl": self.ttl,
+            "max_stale": self.max_stale,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "stale_hits": self.stale_hits,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,373 @@
+"""
+Semantic retrieval over past conversations using message embeddings
+"""
+
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+import httpx
+
+try:
+    import numpy as np
+except ImportError:  # Only needed when EMBEDDINGS_ENABLED=true
+    np = None
+
+from database.base import AsyncSessionLocal
+from database.service import EmbeddingService
+from llm_client import OllamaClient
+
+logger = logging.getLogger(__name__)
+
+# Longer messages are truncated before embedding
+MAX_EMBED_CHARS = 8000
+
+# Incremental loads re-read embeddings stored this long before the newest
+# one loaded, so rows committed late or stamped by a worker with a skewed
+# clock are not missed; rows already loaded are skipped by id
+INDEX_REFRESH_OVERLAP = timedelta(seconds=60)
+
+
+def embeddings_enabled() -> bool:
+    return os.getenv("EMBEDDINGS_ENABLED", "false").lower() == "true"
+
+
+def _is_input_error(error: Exception) -> bool:
+    """Whether Ollama rejected the request itself, rather than being unreachable or lacking the model"""
+    cause = error.__cause__ or error.__context__
+    if not isinstance(cause, httpx.HTTPStatusError):
+        return False
+    status = cause.response.status_code
+    return (400 <= status < 500 and status not in (404, 408, 429)) or status == 500
+
+
+def _normalize(vectors: "np.ndarray") -> "np.ndarray":
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorIndex:
+    """
+    Exact (brute-force) cosine similarity index over one user's messages.
+
+    Vectors are kept L2-normalized in one contiguous float32 matrix that
+    grows by doubling, so a search is a single matrix-vector product.
+    """
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self._matrix = np.empty((0, dimensions), dtype=np.float32)
+        self._ids: List[UUID] = []
+        self._id_set: Set[UUID] = set()
+        self._size = 0
+        # Newest indexed_at loaded
+        self.loaded_until: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, message_id: UUID) -> bool:
+        return message_id in self._id_set
+
+    @property
+    def nbytes(self) -> int:
+        return self._matrix.nbytes + 64 * len(self._ids)
+
+    def add(self, ids: List[UUID], vectors: "np.ndarray"):
+        """Append L2-normalized copies of vectors"""
+        needed = self._size + len(ids)
+        if needed > len(self._matrix):
+            grown = np.empty((max(needed, 2 * len(self._matrix), 64), self.dimensions), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+        self._matrix[self._size:needed] = _normalize(vectors.astype(np.float32, copy=False))
+        self._ids.extend(ids)
+        self._id_set.update(ids)
+        self._size = needed
+
+    def search(self, query: "np.ndarray", k: int, exclude: Set[UUID]) -> List[Tuple[UUID, float]]:
+        """Top-k (message_id, cosine similarity), best first"""
+        if not self._size:
+            return []
+        query = _normalize(query.astype(np.float32).reshape(1, -1))[0]
+        scores = self._matrix[:self._size] @ query
+        # Over-fetch so excluded ids don't leave the result short
+        count = min(k + len(exclude), self._size)
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top])]
+        results = []
+        for i in top:
+            message_id = self._ids[i]
+            if message_id in exclude:
+                continue
+            results.append((message_id, float(scores[i])))
+            if len(results) == k:
+                break
+        return results
+
+
+def _decode(rows: List[Any]) -> Tuple[List[UUID], "np.ndarray"]:
+    ids = [row.message_id for row in rows]
+    vectors = np.stack([np.frombuffer(row.vector, dtype=np.float32) for row in rows])
+    return ids, vectors
+
+
+class SemanticRetriever:
+    """
+    Finds earlier messages relevant to a new turn.
+
+    Each user's vectors are loaded from chat_message_embeddings on first use
+    and kept in an in-process VectorIndex; later lookups only fetch the rows
+    indexed since, so indexes stay current across workers. Indexes are
+    evicted least recently used first once their total size exceeds
+    max_bytes.
+    """
+
+    def __init__(
+        self,
+        llm: OllamaClient,
+        top_k: Optional[int] = None,
+        min_score: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        Initialize retriever.
+
+        Args:
+            llm: Client used to embed queries
+            top_k: Messages returned per lookup (RETRIEVAL_TOP_K, default 4)
+            min_score: Minimum cosine similarity (RETRIEVAL_MIN_SCORE, default 0.5)
+            max_bytes: Memory cap for loaded indexes (RETRIEVAL_INDEX_MAX_BYTES, default 256 MiB)
+        """
+        self.llm = llm
+        self.enabled = embeddings_enabled()
+        if self.enabled and np is None:
+            raise RuntimeError("EMBEDDINGS_ENABLED requires numpy: pip install numpy")
+        self.top_k = top_k or int(os.getenv("RETRIEVAL_TOP_K", "4"))
+        self.min_score = min_score if min_score is not None else float(os.getenv("RETRIEVAL_MIN_SCORE", "0.5"))
+        self.max_bytes = max_bytes or int(os.getenv("RETRIEVAL_INDEX_MAX_BYTES", str(256 * 1024 * 1024)))
+        self._indexes: "OrderedDict[UUID, VectorIndex]" = OrderedDict()
+        self._locks: Dict[UUID, asyncio.Lock] = {}
+        self.lookups = 0
+        self.errors = 0
+
+    async def retrieve(self, user_id: UUID, text: str, exclude: Set[UUID]) -> List[Any]:
+        """
+        Get the user's earlier messages most similar to text.
+
+        Errors are logged and yield no results, so retrieval never fails a turn.
+
+        Args:
+            user_id: Owner of the searched messages
+            text: The new user message
+            exclude: Message ids already in the prompt
+
+        Returns:
+            ChatMessage objects, most relevant first
+        """
+        if not self.enabled:
+            return []
+        self.lookups += 1
+        try:
+            query = np.asarray((await self.llm.embed([text[:MAX_EMBED_CHARS]]))[0], dtype=np.float32)
+            async with AsyncSessionLocal() as session:
+                index = await self._refresh(session, user_id)
+                if index is None or index.dimensions != len(query):
+                    return []
+                matches = [
+                    (message_id, score)
+                    for message_id, score in index.search(query, self.top_k, exclude)
+                    if score >= self.min_score
+                ]
+                if not matches:
+                    return []
+                messages = await EmbeddingService.get_user_messages(
+                    session, user_id, [message_id for message_id, _ in matches]
+                )
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Semantic retrieval failed for user {user_id}: {e}")
+            return []
+        by_id = {message.id: message for message in messages}
+        return [by_id[message_id] for message_id, _ in matches if message_id in by_id]
+
+    async def _refresh(self, session, user_id: UUID) -> Optional[VectorIndex]:
+        """Load the user's index, or bring a loaded one up to date"""
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            index = self._indexes.get(user_id)
+            since = None
+            if index is not None and index.loaded_until is not None:
+                since = index.loaded_until - INDEX_REFRESH_OVERLAP
+            rows = await EmbeddingService.get_user_embeddings(
+                session, user_id, self.llm.embed_model, indexed_since=since
+            )
+            new_rows = [row for row in rows if index is None or row.message_id not in index]
+            if new_rows:
+                ids, vectors = _decode(new_rows)
+                if index is None:
+                    index = VectorIndex(vectors.shape[1])
+                index.add(ids, vectors)
+            if rows and index is not None:
+                index.loaded_until = rows[-1].indexed_at
+            if index is not None:
+                self._indexes[user_id] = index
+                self._indexes.move_to_end(user_id)
+                self._evict()
+            return index
+
+    def _evict(self):
+        total = sum(index.nbytes for index in self._indexes.values())
+        while total > self.max_bytes and len(self._indexes) > 1:
+            user_id, index = self._indexes.popitem(last=False)
+            self._locks.pop(user_id, None)
+            total -= index.nbytes
+
+    def stats(self) -> Dict[str, Any]:
+        """Loaded indexes and lookup counters"""
+        return {
+            "enabled": self.enabled,
+            "users_loaded": len(self._indexes),
+            "vectors_loaded": sum(len(index) for index in self._indexes.values()),
+            "bytes": sum(index.nbytes for index in self._indexes.values()),
+            "max_bytes": self.max_bytes,
+            "lookups_total": self.lookups,
+            "errors_total": self.errors,
+        }
+
+
+class EmbeddingIndexer:
+    """
+    Background worker that embeds new messages in batches.
+
+    Each pass selects the oldest batch_size messages without an embedding,
+    returns the connection to the pool, embeds them with a single request
+    and stores them with one multi-row INSERT. Workers racing on the same
+    batch only duplicate the embed request: the first stored embedding wins.
+
+    A batch Ollama rejects is split in halves until the messages it can't
+    embed are isolated; those are stored without a vector, so they are not
+    selected again for this model and the messages after them still get
+    indexed. If no message of the batch can be embedded, the pass fails
+    and is retried, since that points at Ollama rather than the input.
+    """
+
+    def __init__(
+        self,
+        llm: OllamaClient,
+        batch_size: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+    ):
+        """
+        Initialize indexer.
+
+        Args:
+            llm: Client used to embed messages
+            batch_size: Messages per embed request (EMBEDDING_BATCH_SIZE, default 64)
+            poll_interval: Seconds between passes once caught up (EMBEDDING_POLL_INTERVAL, default 10)
+        """
+        self.llm = llm
+        self.enabled = embeddings_enabled()
+        self.batch_size = batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        self.poll_interval = poll_interval or float(os.getenv("EMBEDDING_POLL_INTERVAL", "10"))
+        self._task: Optional[asyncio.Task] = None
+        self.indexed = 0
+        self.skipped = 0
+        self.batches = 0
+        self.errors = 0
+
+    def start(self):
+        """Start indexing in the background"""
+        if self._task is None and self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self):
+        """Stop indexing"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                indexed = await self.index_batch()
+            except Exception as e:
+                self.errors += 1
+                logger.warning(f"Embedding batch failed: {e}")
+                indexed = 0
+            if indexed < self.batch_size:
+                await asyncio.sleep(self.poll_interval)
+
+    async def index_batch(self) -> int:
+        """Embed and store the next batch of messages; returns how many were processed"""
+        async with AsyncSessionLocal() as session:
+            messages = await EmbeddingService.get_messages_to_embed(
+                session, self.llm.embed_model, limit=self.batch_size
+            )
+        if not messages:
+            return 0
+
+        # No database connection is held during the embed requests
+        rejected: List[Tuple[Any, Exception]] = []
+        vectors = await self._embed(messages, rejected)
+        if len(rejected) == len(messages):
+            raise rejected[0][1]
+        for message, error in rejected:
+            logger.warning(f"Skipping message {message.id}, which the embedding model rejected: {error}")
+
+        # Stamped after the embed requests, right before the commit
+        indexed_at = datetime.utcnow()
+        rows = []
+        for message in messages:
+            packed = np.asarray(vectors.get(message.id, []), dtype=np.float32)
+            rows.append({
+                "message_id": message.id,
+                "user_id": message.user_id,
+                "message_created_at": message.created_at,
+                "indexed_at": indexed_at,
+                "model": self.llm.embed_model,
+                "dimensions": len(packed),
+                "vector": packed.tobytes(),
+            })
+        async with AsyncSessionLocal() as session:
+            await EmbeddingService.store_embeddings(session, rows)
+            await session.commit()
+        self.batches += 1
+        self.indexed += len(rows) - len(rejected)
+        self.skipped += len(rejected)
+        return len(rows)
+
+    async def _embed(self, messages: List[Any], rejected: List[Tuple[Any, Exception]]) -> Dict[UUID, List[float]]:
+        """Embed messages, bisecting a rejected batch; rejected messages are appended to rejected"""
+        try:
+            vectors = await self.llm.embed([message.content[:MAX_EMBED_CHARS] for message in messages])
+        except ValueError as e:
+            if not _is_input_error(e):
+                raise
+            if len(messages) == 1:
+                rejected.append((messages[0], e))
+                return {}
+            middle = len(messages) // 2
+            vectors = await self._embed(messages[:middle], rejected)
+            vectors.update(await self._embed(messages[middle:], rejected))
+            return vectors
+        return {message.id: vector for message, vector in zip(messages, vectors)}
+
+    def stats(self) -> Dict[str, Any]:
+        """Indexing counters"""
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None,
+            "model": self.llm.embed_model,
+            "indexed_total": self.indexed,
+            "skipped_total": self.skipped,
+            "batches_total": self.batches,
+            "errors_total": self.errors,
+        }
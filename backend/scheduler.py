@@ -0,0 +1,218 @@
+"""
+Admission control and per-model concurrency limits for LLM requests
+"""
+
+import os
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+from metrics import LLM_ADMISSION_ACTIVE, LLM_ADMISSION_QUEUE_DEPTH, LLM_ADMISSION_WAIT_SECONDS
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries the HTTP status and a retry hint"""
+
+    def __init__(self, reason: str, status_code: int, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Slot:
+    """A granted concurrency slot; release() is idempotent"""
+
+    def __init__(self, controller: "AdmissionController", model: str):
+        self._controller = controller
+        self.model = model
+        self.started_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._controller._release(self)
+
+
+class _ModelQueue:
+    """Concurrency state and wait queue for a single model"""
+
+    def __init__(self, model: str, capacity: int):
+        self.model = model
+        self.capacity = capacity
+        self.active = 0
+        # user key -> that user's waiters; iteration order is the round-robin order
+        self.waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self.waiting = 0
+        # Metrics
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.avg_service_time = 0.0
+
+    def estimate_wait(self) -> int:
+        """Seconds until a new request would likely be admitted"""
+        service_time = self.avg_service_time or 10.0
+        return max(1, math.ceil(service_time * (self.waiting + 1) / self.capacity))
+
+    def publish(self):
+        """Export the current concurrency and queue depth to /metrics"""
+        LLM_ADMISSION_ACTIVE.set(self.active, model=self.model)
+        LLM_ADMISSION_QUEUE_DEPTH.set(self.waiting, model=self.model)
+
+
+class AdmissionController:
+    """
+    Limits concurrent LLM generations per model.
+
+    Requests beyond a model's concurrency limit wait in a bounded queue.
+    Waiters are admitted round-robin across users, so one user opening many
+    streams cannot starve everyone else. When the queue is full the request
+    is rejected immediately (429); when a request waits longer than max_wait
+    it is rejected with 503. Both carry a Retry-After estimate based on the
+    observed generation time.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_queue: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        hosts: int = 1,
+    ):
+        """
+        Initialize admission controller.
+
+        Args:
+            max_concurrency: Default concurrent generations per model (LLM_MAX_CONCURRENCY, default 4).
+                Per-model overrides come from LLM_MODEL_CONCURRENCY, e.g. "llama2=2,llava=1".
+            max_queue: Maximum waiting requests per model (LLM_MAX_QUEUE, default 32)
+            max_wait: Maximum seconds a request may wait (LLM_MAX_QUEUE_WAIT, default 30)
+            hosts: Number of upstream hosts serving each model; the concurrency
+                limits apply per host
+        """
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("LLM_MAX_QUEUE", "32"))
+        self.max_wait = max_wait or float(os.getenv("LLM_MAX_QUEUE_WAIT", "30"))
+        self.hosts = hosts
+        self.model_concurrency: Dict[str, int] = {}
+        for entry in os.getenv("LLM_MODEL_CONCURRENCY", "").split(","):
+            if "=" in entry:
+                name, limit = entry.split("=", 1)
+                self.model_concurrency[name.strip()] = int(limit)
+        self._queues: Dict[str, _ModelQueue] = {}
+
+    def _queue(self, model: str) -> _ModelQueue:
+        queue = self._queues.get(model)
+        if queue is None:
+            queue = _ModelQueue(model, self.model_concurrency.get(model, self.max_concurrency) * self.hosts)
+            self._queues[model] = queue
+        return queue
+
+    async def acquire(self, model: str, user_key: str) -> Slot:
+        """
+        Wait for a concurrency slot for a model.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        queue = self._queue(model)
+        if queue.active < queue.capacity and not queue.waiting:
+            queue.active += 1
+            queue.admitted += 1
+            queue.publish()
+            LLM_ADMISSION_WAIT_SECONDS.observe(0, model=model)
+            return Slot(self, model)
+
+        if queue.waiting >= self.max_queue:
+            queue.rejected += 1
+            raise AdmissionRejected("queue_full", 429, queue.estimate_wait())
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.waiters.setdefault(user_key, deque()).append(waiter)
+        queue.waiting += 1
+        queue.publish()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._remove_waiter(queue, user_key, waiter)
+                queue.timed_out += 1
+                raise AdmissionRejected("queue_timeout", 503, queue.estimate_wait())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we were cancelled; hand the slot on
+                queue.active -= 1
+                self._dispatch(queue)
+            else:
+                self._remove_waiter(queue, user_key, waiter)
+            raise
+
+        waited = time.monotonic() - started
+        queue.wait_time_total += waited
+        queue.wait_time_max = max(queue.wait_time_max, waited)
+        queue.admitted += 1
+        LLM_ADMISSION_WAIT_SECONDS.observe(waited, model=model)
+        return Slot(self, model)
+
+    def _remove_waiter(self, queue: _ModelQueue, user_key: str, waiter: asyncio.Future):
+        waiter.cancel()
+        waiters = queue.waiters.get(user_key)
+        if waiters and waiter in waiters:
+            waiters.remove(waiter)
+            queue.waiting -= 1
+            if not waiters:
+                del queue.waiters[user_key]
+            queue.publish()
+
+    def _release(self, slot: Slot):
+        queue = self._queue(slot.model)
+        queue.active -= 1
+        service_time = time.monotonic() - slot.started_at
+        # Exponentially weighted average of generation time, for Retry-After
+        if queue.avg_service_time:
+            queue.avg_service_time = 0.8 * queue.avg_service_time + 0.2 * service_time
+        else:
+            queue.avg_service_time = service_time
+        self._dispatch(queue)
+
+    def _dispatch(self, queue: _ModelQueue):
+        """Grant free slots to waiters, round-robin across users"""
+        while queue.active < queue.capacity and queue.waiting:
+            user_key, waiters = next(iter(queue.waiters.items()))
+            waiter = waiters.popleft()
+            queue.waiting -= 1
+            if waiters:
+                # Next turn goes to the next user in line
+                queue.waiters.move_to_end(user_key)
+            else:
+                del queue.waiters[user_key]
+            if waiter.done():
+                continue
+            queue.active += 1
+            waiter.set_result(None)
+        queue.publish()
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-model queue depth, concurrency and wait-time metrics"""
+        return {
+            model: {
+                "capacity": queue.capacity,
+                "active": queue.active,
+                "queue_depth": queue.waiting,
+                "queued_users": len(queue.waiters),
+                "admitted_total": queue.admitted,
+                "rejected_total": queue.rejected,
+                "timed_out_total": queue.timed_out,
+                "wait_seconds_total": round(queue.wait_time_total, 3),
+                "wait_seconds_max": round(queue.wait_time_max, 3),
+                "avg_generation_seconds": round(queue.avg_service_time, 3),
+            }
+            for model, queue in self._queues.items()
+        }
@@ -0,0 +1,481 @@
+"""
+Database micro-benchmarks and SQL statement counts
+
+Seeds synthetic users, threads and messages at a chosen scale, then:
+
+1. Times each UserService and ChatService method against the seeded data
+   and reports p50/p95/p99 per method.
+2. Calls each API route in-process and counts the SQL statements it
+   issues (including the write-behind message writer), compared against
+   the committed scripts/query_counts.json. A route whose count grew is a
+   failure, which catches N+1 queries: with more threads per user at
+   larger scales, a per-thread query shows up as a larger count.
+
+The database comes from DATABASE_URL, or --database-url: a local Postgres
+container, or SQLite for quick runs. Seeded data is kept and reused by
+later runs at the same scale. Seeding the 10m scale takes a while.
+
+Usage:
+    # Quick run on SQLite
+    python scripts/db_bench.py --database-url sqlite+aiosqlite:///./dbbench.db --scale 1k
+
+    # Postgres, saving timings as a baseline
+    python scripts/db_bench.py --scale 100k --output db-baseline.json
+
+    # Compare timings with a baseline; exits 1 on a regression
+    python scripts/db_bench.py --scale 100k --compare db-baseline.json
+
+    # Only the statement counts; record new counts after an intended change
+    python scripts/db_bench.py --queries-only
+    python scripts/db_bench.py --queries-only --update-query-counts
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERY_COUNTS_PATH = os.path.join(BACKEND_DIR, "scripts", "query_counts.json")
+
+# users, threads per user, messages per thread
+SCALES = {
+    "1k": (10, 10, 10),
+    "100k": (100, 50, 20),
+    "10m": (1000, 100, 100),
+}
+
+WORDS = (
+    "benchmark latency throughput database index query planner cache thread "
+    "message summary context model token stream request response user assistant"
+).split()
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+# ==================== Seeding ====================
+
+async def seed(scale: str) -> List[str]:
+    """
+    Create the users, threads and messages of a scale, resuming a partial seed.
+
+    Each user is written in one transaction with multi-row INSERTs; message
+    counts and timestamps are set directly rather than maintained per insert.
+
+    Returns:
+        The seeded usernames
+    """
+    from sqlalchemy import insert, select
+    from database.base import AsyncSessionLocal
+    from database.models import User, ChatThread, ChatMessage
+
+    users, threads_per_user, messages_per_thread = SCALES[scale]
+    usernames = [f"dbbench-{scale}-{i}" for i in range(users)]
+    async with AsyncSessionLocal() as session:
+        existing = set((await session.execute(
+            select(User.username).where(User.username.in_(usernames))
+        )).scalars())
+    missing = [name for name in usernames if name not in existing]
+    if not missing:
+        return usernames
+
+    print(f"Seeding {len(missing)} users with {threads_per_user} threads of {messages_per_thread} messages...",
+          file=sys.stderr)
+    started = time.perf_counter()
+    # Spread messages over the last 30 days so time-range queries find them
+    origin = datetime.utcnow() - timedelta(days=30)
+    step = timedelta(days=30) / (threads_per_user * messages_per_thread + 1)
+    for n, username in enumerate(missing, 1):
+        rng = random.Random(username)
+        user_id = uuid.uuid4()
+        threads, messages = [], []
+        for t in range(threads_per_user):
+            thread_pk = uuid.uuid4()
+            created = origin + step * t * messages_per_thread
+            for m in range(messages_per_thread):
+                role = "user" if m % 2 == 0 else "assistant"
+                metadata = {}
+                if role == "assistant":
+                    eval_count = rng.randint(20, 400)
+                    metadata = {"generation": {
+                        "model": rng.choice(("llama2", "mistral")),
+                        "total_duration": 0,
+                        "load_duration": rng.choice((2_000_000, 2_000_000, 2_000_000, 3_000_000_000)),
+                        "prompt_eval_count": rng.randint(50, 3000),
+                        "prompt_eval_duration": rng.randint(10_000_000, 900_000_000),
+                        "eval_count": eval_count,
+                        "eval_duration": int(eval_count / rng.uniform(15, 60) * 1e9),
+                    }}
+                messages.append({
+                    "id": uuid.uuid4(),
+                    "thread_id": thread_pk,
+                    "role": role,
+                    "content": _text(rng, rng.randint(5, 60)),
+                    "message_metadata": metadata,
+                    "created_at": created + step * m,
+                })
+            threads.append({
+                "id": thread_pk,
+                "user_id": user_id,
+                "thread_id": f"thread-{t}",
+                "title": _text(rng, 4),
+                "message_count": messages_per_thread,
+                "created_at": created,
+                "updated_at": created + step * (messages_per_thread - 1),
+            })
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(User), [{
+                "id": user_id, "username": username, "email": f"{username}@bench.local",
+                "created_at": origin, "updated_at": origin,
+            }])
+            await session.execute(insert(ChatThread), threads)
+            for i in range(0, len(messages), 5000):
+                await session.execute(insert(ChatMessage), messages[i:i + 5000])
+            await session.commit()
+        if n % 50 == 0 or n == len(missing):
+            print(f"  {n}/{len(missing)} users ({time.perf_counter() - started:.0f}s)", file=sys.stderr)
+    return usernames
+
+
+# ==================== Method timings ====================
+
+class Sample:
+    """One seeded user and thread used as method arguments"""
+
+    def __init__(self, user, thread, last_message):
+        self.user_id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.thread_id = thread.thread_id
+        self.thread_pk = thread.id
+        self.last_message = last_message
+
+
+async def load_samples(usernames: List[str], count: int, rng: random.Random) -> List[Sample]:
+    from database.base import AsyncSessionLocal
+    from database.service import UserService, ChatService
+
+    samples = []
+    async with AsyncSessionLocal() as session:
+        for username in rng.sample(usernames, min(count, len(usernames))):
+            user = await UserService.get_user_by_username(session, username)
+            threads = await ChatService.list_chat_threads(session, user.id)
+            thread = rng.choice(threads)
+            last_message = (await ChatService.get_recent_messages(session, thread.id, limit=1))[0]
+            samples.append(Sample(user, thread, last_message))
+    return samples
+
+
+def _new_rows(sample: Sample) -> List[Dict[str, Any]]:
+    now = datetime.utcnow()
+    return [
+        {"id": uuid.uuid4(), "thread_id": sample.thread_pk, "role": "user", "content": "bulk message",
+         "message_metadata": {}, "created_at": now}
+        for _ in range(10)
+    ]
+
+
+def method_cases() -> List[Tuple[str, str, Callable[[Sample], Tuple[Any, ...]]]]:
+    """(service, method, sample -> positional arguments after the session)"""
+    def new_name(prefix: str) -> str:
+        return f"{prefix}-{uuid.uuid4().hex[:12]}"
+
+    since = datetime.utcnow() - timedelta(days=1)
+    return [
+        ("UserService", "create_user", lambda s: (new_name("dbbench-new"),)),
+        ("UserService", "get_user", lambda s: (s.user_id,)),
+        ("UserService", "get_user_by_username", lambda s: (s.username,)),
+        ("UserService", "get_user_by_email", lambda s: (s.email,)),
+        ("ChatService", "create_chat_thread", lambda s: (s.user_id, new_name("thread"), "New thread")),
+        ("ChatService", "get_chat_thread", lambda s: (s.user_id, s.thread_id)),
+        ("ChatService", "list_chat_threads", lambda s: (s.user_id,)),
+        ("ChatService", "list_chat_thread_summaries", lambda s: (s.user_id,)),
+        ("ChatService", "update_chat_thread_title", lambda s: (s.user_id, s.thread_id, "Renamed")),
+        ("ChatService", "delete_chat_thread", lambda s: (s.user_id, s.thread_id)),
+        ("ChatService", "create_chat_message", lambda s: (s.user_id, s.thread_id, "user", "Hello")),
+        ("ChatService", "create_thread_message", lambda s: (s.thread_pk, "user", "Hello")),
+        ("ChatService", "create_messages_bulk", lambda s: (_new_rows(s),)),
+        ("ChatService", "delete_chat_message", lambda s: (s.user_id, s.thread_id, s.last_message.id)),
+        ("ChatService", "ensure_chat_threads", lambda s: (s.user_id, {new_name("thread"): {}, s.thread_id: {}})),
+        ("ChatService", "get_chat_thread_by_pk", lambda s: (s.thread_pk,)),
+        ("ChatService", "get_recent_messages", lambda s: (s.thread_pk, 50)),
+        ("ChatService", "get_messages_after", lambda s: (s.thread_pk, None, 50)),
+        ("ChatService", "count_messages_after", lambda s: (s.thread_pk, None)),
+        ("ChatService", "update_thread_summary", lambda s: (s.thread_pk, "Summary", s.last_message, None)),
+        ("ChatService", "get_chat_messages", lambda s: (s.user_id, s.thread_id)),
+        ("ChatService", "get_chat_messages_page", lambda s: (s.user_id, s.thread_id, 20, None, None, True)),
+        ("ChatService", "get_thread_messages_page", lambda s: (s.thread_pk, 20, None, None, True)),
+        ("ChatService", "search_messages", lambda s: (s.user_id, "benchmark latency")),
+        ("ChatService", "get_generation_stats", lambda s: (since,)),
+    ]
+
+
+async def time_methods(samples: List[Sample], iterations: int, rng: random.Random) -> Dict[str, Any]:
+    """
+    Run every method case iterations times, each in its own transaction.
+
+    Writes are rolled back, so the seeded data stays the same across runs.
+    """
+    from load_test import summarize
+    from database.base import AsyncSessionLocal
+    from database import service
+
+    results = {}
+    for service_name, method_name, make_args in method_cases():
+        method = getattr(getattr(service, service_name), method_name)
+        durations = []
+        for _ in range(iterations):
+            sample = rng.choice(samples)
+            args = make_args(sample)
+            async with AsyncSessionLocal() as session:
+                started = time.perf_counter()
+                await method(session, *args)
+                durations.append(time.perf_counter() - started)
+                await session.rollback()
+        results[f"{service_name}.{method_name}"] = {"count": len(durations), **summarize(durations)}
+    return results
+
+
+# ==================== Statement counts ====================
+
+class StatementCounter:
+    """Counts statements sent to the database; executemany counts once"""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+async def count_route_statements(usernames: List[str]) -> Dict[str, int]:
+    """
+    Call each API route once through the ASGI app and count its SQL statements.
+
+    The thread cache is cleared before each call, so routes are counted on
+    their database path, and queued message writes are awaited and included.
+    """
+    import httpx
+    from mock_ollama import MockOllama, create_app
+
+    os.environ["CHAT_PROVIDER"] = "ollama"
+    import main
+    from database.base import AsyncSessionLocal, engine
+    from database.service import UserService
+
+    counter = StatementCounter(engine)
+    mock = MockOllama(
+        tokens_per_second=1e6, first_token_ms=0, tokens=8, jitter=0,
+        embedding_dimensions=8, models=["llama2"],
+    )
+    main.ollama_client._http_client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=create_app(mock)), base_url=main.ollama_client.ollama_url
+    )
+    main.ollama_client._owns_http_client = False
+
+    counts: Dict[str, int] = {}
+    async with main.lifespan(main.app):
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+        async with AsyncSessionLocal() as session:
+            seeded = await UserService.get_user_by_username(session, usernames[0])
+        user_id = str(seeded.id)
+        params = {"user_id": user_id}
+        fixture = f"dbbench-fixture-{uuid.uuid4().hex[:12]}"
+        await client.post("/api/chat/threads", params=params, json={"thread_id": fixture, "title": "Fixture"})
+        for i in range(6):
+            await client.post(
+                f"/api/chat/threads/{fixture}/messages",
+                params=params,
+                json={"role": "user" if i % 2 == 0 else "assistant", "content": f"Fixture message {i}"},
+            )
+
+        async def measure(route: str, method: str, url: str, **kwargs) -> httpx.Response:
+            main.thread_cache.clear()
+            counter.count = 0
+            response = await client.request(method, url, **kwargs)
+            await main.message_writer.wait_for(seeded.id, fixture)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{route} failed with {response.status_code}: {response.text}")
+            counts[route] = counter.count
+            return response
+
+        await measure("POST /api/users", "POST", "/api/users", json={"username": f"dbbench-new-{uuid.uuid4().hex[:12]}"})
+        await measure("GET /api/users/{user_id}", "GET", f"/api/users/{user_id}")
+        scratch = f"dbbench-scratch-{uuid.uuid4().hex[:12]}"
+        await measure("POST /api/chat/threads", "POST", "/api/chat/threads", params=params,
+                      json={"thread_id": scratch, "title": "Scratch"})
+        await measure("GET /api/chat/threads", "GET", "/api/chat/threads", params=params)
+        await measure("GET /api/chat/threads/{thread_id}", "GET", f"/api/chat/threads/{fixture}", params=params)
+        await measure("PUT /api/chat/threads/{thread_id}", "PUT", f"/api/chat/threads/{fixture}", params=params,
+                      json={"title": "Renamed fixture"})
+        message = await measure("POST /api/chat/threads/{thread_id}/messages", "POST",
+                                f"/api/chat/threads/{fixture}/messages", params=params,
+                                json={"role": "user", "content": "Counted message"})
+        await measure("GET /api/chat/threads/{thread_id}/messages", "GET", f"/api/chat/threads/{fixture}/messages",
+                      params={**params, "limit": 20, "latest": "true"})
+        await measure("DELETE /api/chat/threads/{thread_id}/messages/{message_id}", "DELETE",
+                      f"/api/chat/threads/{fixture}/messages/{message.json()['id']}", params=params)
+        await measure("POST /api/chat/threads/{thread_id}/stream", "POST", f"/api/chat/threads/{fixture}/stream",
+                      params=params, json={"content": "Counted question"})
+        await measure("GET /api/chat/search", "GET", "/api/chat/search", params={**params, "q": "benchmark"})
+        await measure("GET /api/system/generation-stats", "GET", "/api/system/generation-stats")
+        await measure("DELETE /api/chat/threads/{thread_id}", "DELETE", f"/api/chat/threads/{scratch}", params=params)
+
+        await client.delete(f"/api/chat/threads/{fixture}", params=params)
+        await client.aclose()
+    return counts
+
+
+def check_query_counts(counts: Dict[str, int], dialect: str, update: bool) -> List[str]:
+    """
+    Compare statement counts with scripts/query_counts.json.
+
+    Returns:
+        Routes whose count grew
+    """
+    recorded: Dict[str, Dict[str, int]] = {}
+    if os.path.exists(QUERY_COUNTS_PATH):
+        with open(QUERY_COUNTS_PATH) as f:
+            recorded = json.load(f)
+    expected = recorded.get(dialect)
+
+    print(f"\n== SQL statements per route ({dialect})")
+    grown = []
+    for route, count in counts.items():
+        baseline = (expected or {}).get(route)
+        note = ""
+        if baseline is None:
+            note = "new"
+        elif count > baseline:
+            note = f"GREW from {baseline}"
+            grown.append(f"{route}: {baseline} -> {count} statements")
+        elif count < baseline:
+            note = f"down from {baseline}"
+        print(f"   {route:<62} {count:>3}  {note}")
+
+    if update:
+        recorded[dialect] = counts
+        with open(QUERY_COUNTS_PATH, "w") as f:
+            json.dump(recorded, f, indent=2)
+            f.write("\n")
+        print(f"Saved counts for {dialect} to {QUERY_COUNTS_PATH}")
+        return []
+    if expected is None:
+        print(f"No recorded counts for {dialect}; save them with --update-query-counts")
+    return grown
+
+
+def print_timings(timings: Dict[str, Any]):
+    print(f"   {'method':<44} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in timings.items():
+        print(f"   {name:<44} {stats['count']:>6} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}")
+
+
+def compare_timings(timings: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """Methods whose p95 is more than tolerance and at least min_delta_ms slower"""
+    regressions = []
+    for name, stats in timings.items():
+        base = baseline.get("methods", {}).get(name)
+        if base is None:
+            continue
+        new, old = stats["p95_ms"], base["p95_ms"]
+        if new > old * (1 + tolerance) and new - old >= min_delta_ms:
+            regressions.append(f"{name}: p95 {old:.2f} ms -> {new:.2f} ms")
+    return regressions
+
+
+async def run(args) -> Tuple[Dict[str, Any], List[str]]:
+    from load_test import _git_commit
+    from database.base import engine, init_db
+
+    await init_db()
+    dialect = engine.dialect.name
+    usernames = await seed(args.scale)
+    users, threads_per_user, messages_per_thread = SCALES[args.scale]
+    results: Dict[str, Any] = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "database": dialect,
+        "scale": {
+            "name": args.scale,
+            "users": users,
+            "threads_per_user": threads_per_user,
+            "messages": users * threads_per_user * messages_per_thread,
+        },
+    }
+    if not args.queries_only:
+        rng = random.Random(args.seed)
+        samples = await load_samples(usernames, 20, rng)
+        print(f"Timing methods, {args.iterations} iterations each...", file=sys.stderr)
+        results["methods"] = await time_methods(samples, args.iterations, rng)
+        print(f"\n== Method timings ({dialect}, {results['scale']['messages']} messages)")
+        print_timings(results["methods"])
+    counts = await count_route_statements(usernames)
+    results["query_counts"] = counts
+    grown = check_query_counts(counts, dialect, args.update_query_counts)
+    return results, grown
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", help="Overrides DATABASE_URL")
+    parser.add_argument("--scale", choices=SCALES, default="1k", help="Seeded data size (default 1k)")
+    parser.add_argument("--iterations", type=int, default=50, help="Calls per method")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for picking samples")
+    parser.add_argument("--queries-only", action="store_true", help="Skip method timings")
+    parser.add_argument("--update-query-counts", action="store_true", help="Record the counts of this run")
+    parser.add_argument("--output", help="Save results as JSON")
+    parser.add_argument("--compare", help="Baseline JSON to compare method timings against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (default 0.2)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="Ignore p95 changes smaller than this")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    # Route counts must not include the background embedding indexer
+    os.environ["EMBEDDINGS_ENABLED"] = "false"
+    sys.path.insert(0, BACKEND_DIR)
+
+    results, grown = asyncio.run(run(args))
+
+    failed = False
+    if grown:
+        failed = True
+        print("\nStatement counts grew (possible N+1 queries):")
+        for route in grown:
+            print(f"  REGRESSION {route}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+    if args.compare and "methods" in results:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("database") != results["database"] or baseline.get("scale", {}).get("name") != args.scale:
+            print(f"\nWarning: {args.compare} was recorded on {baseline.get('database')} "
+                  f"at scale {baseline.get('scale', {}).get('name')}")
+        regressions = compare_timings(results["methods"], baseline, args.tolerance, args.min_delta_ms)
+        print(f"\nCompared with {args.compare} ({baseline.get('git_commit') or 'unknown commit'}):")
+        for regression in regressions:
+            print(f"  REGRESSION {regression}")
+        if regressions:
+            failed = True
+        else:
+            print("  no regressions")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+"""
+Load test and benchmark driver for the chat backend
+
+Runs concurrent workload scenarios against the API and reports p50/p95/p99
+latency per operation, time-to-first-token of streamed responses, requests
+per second and the backend's CPU and memory use. Results can be saved as a
+JSON baseline and later runs compared against it.
+
+Scenarios:
+    stream: each worker sends chat turns to /api/chat/threads/{id}/stream
+    crud:   each worker cycles through thread and message CRUD endpoints
+
+Usage:
+    # Start a mock Ollama and a backend, run both scenarios, save a baseline
+    python scripts/load_test.py --spawn --output baseline.json
+
+    # Same run, compared against the baseline; exits 1 on a regression
+    python scripts/load_test.py --spawn --compare baseline.json
+
+    # Against a backend that is already running
+    python scripts/load_test.py --base-url http://localhost:8000 --backend-pid 1234
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ("stream", "crud")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linearly interpolated percentile of sorted values"""
+    if not values:
+        return None
+    position = (len(values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(samples: List[float]) -> Dict[str, Optional[float]]:
+    """Latency summary in milliseconds"""
+    values = sorted(samples)
+    summary = {"mean_ms": sum(values) / len(values) * 1000 if values else None}
+    for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99), ("max_ms", 1.0)):
+        value = percentile(values, q)
+        summary[name] = value * 1000 if value is not None else None
+    return summary
+
+
+class Recorder:
+    """Latencies and errors per operation for one scenario"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.ttft: List[float] = []
+
+    def record(self, operation: str, seconds: float):
+        self.latencies[operation].append(seconds)
+
+    def error(self, operation: str, kind: str):
+        self.errors[operation][kind] += 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        operations = {}
+        for operation in sorted(set(self.latencies) | set(self.errors)):
+            samples = self.latencies.get(operation, [])
+            errors = dict(self.errors.get(operation, {}))
+            operations[operation] = {
+                "count": len(samples),
+                "errors": sum(errors.values()),
+                "errors_by_type": errors,
+                "rps": len(samples) / elapsed if elapsed else 0,
+                **summarize(samples),
+            }
+        completed = sum(len(samples) for samples in self.latencies.values())
+        report = {
+            "duration_s": elapsed,
+            "requests": completed,
+            "errors": sum(sum(errors.values()) for errors in self.errors.values()),
+            "rps": completed / elapsed if elapsed else 0,
+            "operations": operations,
+        }
+        if self.ttft:
+            report["ttft"] = {"count": len(self.ttft), **summarize(self.ttft)}
+        return report
+
+
+class ResourceSampler:
+    """
+    Samples CPU and resident memory of a process from /proc.
+
+    Linux only; on other platforms (or without a pid) nothing is reported.
+    """
+
+    def __init__(self, pid: Optional[int], interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self._ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self._cpu: List[float] = []
+        self._rss: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def available(self) -> bool:
+        return self.pid is not None and os.path.exists(f"/proc/{self.pid}/stat")
+
+    def _cpu_seconds(self) -> float:
+        with open(f"/proc/{self.pid}/stat") as f:
+            # Fields after the parenthesized command name; utime and stime are 14 and 15
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def _rss_mb(self) -> float:
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    async def _run(self):
+        last_cpu, last_time = self._cpu_seconds(), time.perf_counter()
+        while True:
+            await asyncio.sleep(self.interval)
+            cpu, now = self._cpu_seconds(), time.perf_counter()
+            self._cpu.append((cpu - last_cpu) / (now - last_time) * 100)
+            self._rss.append(self._rss_mb())
+            last_cpu, last_time = cpu, now
+
+    def start(self):
+        if self.available:
+            self._cpu, self._rss = [], []
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Optional[Dict[str, float]]:
+        if self._task is None:
+            return None
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if not self._cpu:
+            return None
+        return {
+            "cpu_percent_mean": sum(self._cpu) / len(self._cpu),
+            "cpu_percent_max": max(self._cpu),
+            "rss_mb_mean": sum(self._rss) / len(self._rss),
+            "rss_mb_max": max(self._rss),
+        }
+
+
+async def _timed(recorder: Recorder, operation: str, request) -> Optional[httpx.Response]:
+    started = time.perf_counter()
+    try:
+        response = await request
+    except httpx.HTTPError as e:
+        recorder.error(operation, type(e).__name__)
+        return None
+    if response.status_code >= 400:
+        recorder.error(operation, f"http_{response.status_code}")
+        return None
+    recorder.record(operation, time.perf_counter() - started)
+    return response
+
+
+async def _create_user(client: httpx.AsyncClient) -> str:
+    response = await client.post("/api/users", json={"username": f"bench-{uuid.uuid4().hex[:12]}"})
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def _create_thread(client: httpx.AsyncClient, user_id: str) -> str:
+    thread_id = f"bench-{uuid.uuid4().hex[:12]}"
+    response = await client.post(
+        "/api/chat/threads", params={"user_id": user_id}, json={"thread_id": thread_id, "title": "Benchmark"}
+    )
+    response.raise_for_status()
+    return thread_id
+
+
+async def stream_worker(client: httpx.AsyncClient, recorder: Recorder, deadline: float):
+    """Send chat turns on one thread until the deadline"""
+    user_id = await _create_user(client)
+    thread_id = await _create_thread(client, user_id)
+    turn = 0
+    while time.perf_counter() < deadline:
+        turn += 1
+        started = time.perf_counter()
+        first_token = None
+        error = None
+        try:
+            async with client.stream(
+                "POST",
+                f"/api/chat/threads/{thread_id}/stream",
+                params={"user_id": user_id},
+                json={"content": f"Benchmark question {turn}: how fast is this?"},
+            ) as response:
+                if response.status_code >= 400:
+                    error = f"http_{response.status_code}"
+                else:
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data: "):
+                            continue
+                        event = json.loads(line[6:])
+                        if event.get("error"):
+                            error = "stream_error"
+                            break
+                        if first_token is None and event.get("content"):
+                            first_token = time.perf_counter()
+                        if event.get("done"):
+                            break
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        if error is not None:
+            recorder.error("stream", error)
+            if error in ("http_429", "http_503"):
+                # Admission control rejected the turn; back off as a client would
+                await asyncio.sleep(0.5)
+            continue
+        recorder.record("stream", time.perf_counter() - started)
+        if first_token is not None:
+            recorder.ttft.append(first_token - started)
+
+
+async def crud_worker(client: httpx.AsyncClient, recorder: Recorder, deadline: float):
+    """Cycle through thread and message endpoints until the deadline"""
+    user_id = await _create_user(client)
+    params = {"user_id": user_id}
+    while time.perf_counter() < deadline:
+        thread_id = f"bench-{uuid.uuid4().hex[:12]}"
+        if await _timed(recorder, "create_thread", client.post(
+            "/api/chat/threads", params=params, json={"thread_id": thread_id, "title": "Benchmark"}
+        )) is None:
+            continue
+        for i in range(4):
+            await _timed(recorder, "create_message", client.post(
+                f"/api/chat/threads/{thread_id}/messages",
+                params=params,
+                json={"role": "user" if i % 2 == 0 else "assistant", "content": f"Message {i} " * 20},
+            ))
+        await _timed(recorder, "list_threads", client.get("/api/chat/threads", params=params))
+        await _timed(recorder, "get_thread", client.get(f"/api/chat/threads/{thread_id}", params=params))
+        await _timed(recorder, "get_messages_page", client.get(
+            f"/api/chat/threads/{thread_id}/messages", params={**params, "limit": 2, "latest": "true"}
+        ))
+        await _timed(recorder, "delete_thread", client.delete(f"/api/chat/threads/{thread_id}", params=params))
+
+
+WORKERS = {"stream": stream_worker, "crud": crud_worker}
+
+
+async def run_scenario(
+    name: str, base_url: str, concurrency: int, duration: float, sampler: ResourceSampler
+) -> Dict[str, Any]:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=httpx.Timeout(120.0)) as client:
+        sampler.start()
+        started = time.perf_counter()
+        deadline = started + duration
+        results = await asyncio.gather(
+            *(WORKERS[name](client, recorder, deadline) for _ in range(concurrency)), return_exceptions=True
+        )
+        elapsed = time.perf_counter() - started
+        resources = await sampler.stop()
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        print(f"  {len(failed)} {name} workers failed to start: {failed[0]!r}", file=sys.stderr)
+    report = recorder.report(elapsed)
+    report["concurrency"] = concurrency
+    if resources:
+        report["resources"] = resources
+    return report
+
+
+def _wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def spawn(args) -> List[subprocess.Popen]:
+    """Start the mock Ollama servers (one per --mock-hosts) and a backend that talks to them"""
+    processes = []
+    mock_urls = []
+    try:
+        for port in range(args.mock_port, args.mock_port + args.mock_hosts):
+            mock_url = f"http://127.0.0.1:{port}"
+            mock = subprocess.Popen([
+                sys.executable, os.path.join(BACKEND_DIR, "scripts", "mock_ollama.py"),
+                "--port", str(port),
+                "--tokens-per-second", str(args.tokens_per_second),
+                "--first-token-ms", str(args.first_token_ms),
+                "--tokens", str(args.tokens),
+                "--num-parallel", str(args.mock_parallel),
+            ])
+            processes.append(mock)
+            mock_urls.append(mock_url)
+            _wait_until_ready(f"{mock_url}/api/version", mock)
+        env = {
+            **os.environ,
+            "OLLAMA_URL": mock_urls[0],
+            "OLLAMA_URLS": ",".join(mock_urls),
+            "CHAT_PROVIDER": "ollama",
+        }
+        backend = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.backend_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=env,
+        )
+        processes.append(backend)
+        _wait_until_ready(f"{args.base_url}/health", backend)
+    except Exception:
+        stop(processes)
+        raise
+    return processes
+
+
+def stop(processes: List[subprocess.Popen]):
+    for process in reversed(processes):
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: Dict[str, Any]):
+    for name, scenario in results["scenarios"].items():
+        print(f"\n== {name}: concurrency {scenario['concurrency']}, {scenario['duration_s']:.1f}s, "
+              f"{scenario['requests']} requests, {scenario['rps']:.1f} req/s, {scenario['errors']} errors")
+        print(f"   {'operation':<20} {'count':>7} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        rows = list(scenario["operations"].items())
+        if "ttft" in scenario:
+            rows.append(("ttft", {**scenario["ttft"], "errors": 0, "rps": 0}))
+        for operation, stats in rows:
+            def ms(key):
+                return f"{stats[key]:9.1f}" if stats.get(key) is not None else f"{'-':>9}"
+
+            print(f"   {operation:<20} {stats['count']:>7} {stats['errors']:>7} {stats['rps']:>8.1f} "
+                  f"{ms('p50_ms')} {ms('p95_ms')} {ms('p99_ms')}")
+        resources = scenario.get("resources")
+        if resources:
+            print(f"   backend cpu {resources['cpu_percent_mean']:.0f}% mean / {resources['cpu_percent_max']:.0f}% max, "
+                  f"rss {resources['rss_mb_mean']:.0f} MB mean / {resources['rss_mb_max']:.0f} MB max")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """
+    Regressions against a baseline.
+
+    p95 latency (and time-to-first-token) regresses when it is more than
+    tolerance slower and at least min_delta_ms slower; throughput regresses
+    when it drops by more than tolerance; errors regress when a scenario
+    that had none now has some.
+    """
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        pairs = [(operation, stats, base["operations"].get(operation)) for operation, stats in scenario["operations"].items()]
+        if "ttft" in scenario and "ttft" in base:
+            pairs.append(("ttft", scenario["ttft"], base["ttft"]))
+        for operation, stats, base_stats in pairs:
+            if not base_stats or stats.get("p95_ms") is None or base_stats.get("p95_ms") is None:
+                continue
+            new, old = stats["p95_ms"], base_stats["p95_ms"]
+            if new > old * (1 + tolerance) and new - old >= min_delta_ms:
+                regressions.append(f"{name}/{operation}: p95 {old:.1f} ms -> {new:.1f} ms")
+        if scenario["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['rps']:.1f} -> {scenario['rps']:.1f} req/s")
+        if scenario["errors"] and not base["errors"]:
+            regressions.append(f"{name}: {scenario['errors']} errors, baseline had none")
+    return regressions
+
+
+async def run(args) -> Dict[str, Any]:
+    sampler = ResourceSampler(args.backend_pid)
+    if not sampler.available:
+        print("Backend CPU/RSS not sampled (needs --spawn or --backend-pid on Linux)", file=sys.stderr)
+    concurrency = {"stream": args.stream_concurrency, "crud": args.crud_concurrency}
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "config": {
+            "base_url": args.base_url,
+            "duration_s": args.duration,
+            "spawned": args.spawn,
+            "mock": {
+                "tokens_per_second": args.tokens_per_second,
+                "first_token_ms": args.first_token_ms,
+                "tokens": args.tokens,
+                "hosts": args.mock_hosts,
+                "num_parallel": args.mock_parallel,
+            } if args.spawn else None,
+        },
+        "scenarios": {},
+    }
+    for name in args.scenarios.split(","):
+        print(f"Running {name} with {concurrency[name]} workers for {args.duration:.0f}s...", file=sys.stderr)
+        results["scenarios"][name] = await run_scenario(name, args.base_url, concurrency[name], args.duration, sampler)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default=None, help="Backend URL (default http://127.0.0.1:<backend-port>)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated: stream,crud")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per scenario")
+    parser.add_argument("--stream-concurrency", type=int, default=16, help="Concurrent SSE sessions")
+    parser.add_argument("--crud-concurrency", type=int, default=32, help="Concurrent CRUD workers")
+    parser.add_argument("--backend-pid", type=int, help="Backend process to sample CPU/RSS from")
+    parser.add_argument("--spawn", action="store_true", help="Start a mock Ollama and a backend for the run")
+    parser.add_argument("--backend-port", type=int, default=8001)
+    parser.add_argument("--mock-port", type=int, default=11435, help="Port of the first mock Ollama")
+    parser.add_argument("--mock-hosts", type=int, default=1, help="Mock Ollama hosts, on consecutive ports")
+    parser.add_argument("--mock-parallel", type=int, default=0, help="Concurrent generations per mock host; 0 for unlimited")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="Mock generation speed")
+    parser.add_argument("--first-token-ms", type=float, default=200, help="Mock time to first token")
+    parser.add_argument("--tokens", type=int, default=64, help="Mock tokens per response")
+    parser.add_argument("--output", help="Save results as JSON")
+    parser.add_argument("--compare", help="Baseline JSON to compare against; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown (default 0.2)")
+    parser.add_argument("--min-delta-ms", type=float, default=5, help="Ignore p95 changes smaller than this")
+    args = parser.parse_args()
+
+    for name in args.scenarios.split(","):
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r}")
+    args.base_url = args.base_url or f"http://127.0.0.1:{args.backend_port}"
+
+    processes = []
+    if args.spawn:
+        processes = spawn(args)
+        args.backend_pid = processes[-1].pid
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        stop(processes)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        print(f"\nCompared with {args.compare} ({baseline.get('git_commit') or 'unknown commit'}):")
+        for regression in regressions:
+            print(f"  REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("  no regressions")
+
+
+if __name__ == "__main__":
+    main()
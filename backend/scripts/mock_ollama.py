@@ -0,0 +1,242 @@
+"""
+Mock Ollama server for benchmarks
+
+Serves the parts of the Ollama API the backend uses (/api/chat, /api/tags,
+/api/embed, /api/ps, /api/show) with a configurable time-to-first-token and token rate, so the
+backend can be load-tested without a GPU or a real model.
+
+Usage:
+    python scripts/mock_ollama.py --port 11435 --tokens-per-second 50 --first-token-ms 200
+
+With --num-parallel, requests beyond that many queue for a slot, like a
+GPU host running Ollama with OLLAMA_NUM_PARALLEL.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while an assistant explains "
+    "how benchmarks measure latency throughput and tail behaviour under load"
+).split()
+
+
+class MockOllama:
+    """Generates Ollama-shaped responses at a fixed pace"""
+
+    def __init__(
+        self,
+        tokens_per_second: float,
+        first_token_ms: float,
+        tokens: int,
+        jitter: float,
+        embedding_dimensions: int,
+        models: List[str],
+        num_parallel: int = 0,
+    ):
+        self.tokens_per_second = tokens_per_second
+        self.first_token_ms = first_token_ms
+        self.tokens = tokens
+        self.jitter = jitter
+        self.embedding_dimensions = embedding_dimensions
+        self.models = models
+        self.slots = asyncio.Semaphore(num_parallel) if num_parallel > 0 else nullcontext()
+        self.active_streams = 0
+        self.requests = 0
+        self.loaded: Dict[str, float] = {}
+
+    def touch(self, model: str, keep_alive: Any):
+        """Mark a model loaded until keep_alive (seconds, or e.g. "5m") runs out"""
+        if isinstance(keep_alive, str) and keep_alive[-1:] in ("s", "m", "h"):
+            keep_alive = float(keep_alive[:-1]) * {"s": 1, "m": 60, "h": 3600}[keep_alive[-1]]
+        seconds = float(keep_alive if keep_alive is not None else 300)
+        if seconds == 0:
+            self.loaded.pop(model, None)
+        else:
+            self.loaded[model] = time.time() + seconds if seconds > 0 else float("inf")
+
+    def running(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        self.loaded = {model: expires for model, expires in self.loaded.items() if expires > now}
+        return [
+            {
+                "name": model,
+                "model": model,
+                "size_vram": 0,
+                "expires_at": datetime.fromtimestamp(min(expires, 2**32), timezone.utc).isoformat(),
+            }
+            for model, expires in self.loaded.items()
+        ]
+
+    def _delay(self, seconds: float) -> float:
+        if self.jitter:
+            seconds *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(seconds, 0)
+
+    def _token_count(self, body: Dict[str, Any]) -> int:
+        limit = body.get("options", {}).get("num_predict")
+        return min(self.tokens, limit) if limit else self.tokens
+
+    def _final_chunk(self, model: str, prompt_tokens: int, tokens: int, started: float, generating: float) -> Dict[str, Any]:
+        now = time.perf_counter()
+        return {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "stop",
+            "total_duration": int((now - started) * 1e9),
+            "load_duration": 1_000_000,
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(self.first_token_ms * 1e6),
+            "eval_count": tokens,
+            "eval_duration": int((now - generating) * 1e9),
+        }
+
+    async def chat_stream(self, body: Dict[str, Any]):
+        model = body.get("model", self.models[0])
+        prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+        tokens = self._token_count(body)
+        started = time.perf_counter()
+        self.active_streams += 1
+        try:
+            async with self.slots:
+                async for chunk in self._generate(model, prompt_tokens, tokens, started):
+                    yield chunk
+        finally:
+            self.active_streams -= 1
+
+    async def _generate(self, model: str, prompt_tokens: int, tokens: int, started: float):
+        await asyncio.sleep(self._delay(self.first_token_ms / 1000))
+        generating = time.perf_counter()
+        interval = 1 / self.tokens_per_second
+        for i in range(tokens):
+            if i:
+                await asyncio.sleep(self._delay(interval))
+            chunk = {
+                "model": model,
+                "message": {"role": "assistant", "content": WORDS[i % len(WORDS)] + " "},
+                "done": False,
+            }
+            yield json.dumps(chunk) + "\n"
+        yield json.dumps(self._final_chunk(model, prompt_tokens, tokens, started, generating)) + "\n"
+
+    async def chat(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        model = body.get("model", self.models[0])
+        tokens = self._token_count(body)
+        started = time.perf_counter()
+        async with self.slots:
+            await asyncio.sleep(self._delay(self.first_token_ms / 1000 + tokens / self.tokens_per_second))
+        response = self._final_chunk(model, 0, tokens, started, started)
+        response["message"]["content"] = " ".join(WORDS[i % len(WORDS)] for i in range(tokens))
+        return response
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Deterministic pseudo-embeddings, so equal texts get equal vectors"""
+        vectors = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+            rng = random.Random(seed)
+            vectors.append([rng.uniform(-1, 1) for _ in range(self.embedding_dimensions)])
+        return vectors
+
+
+def create_app(mock: MockOllama) -> FastAPI:
+    app = FastAPI(title="Mock Ollama")
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        mock.requests += 1
+        model = body.get("model", mock.models[0])
+        mock.touch(model, body.get("keep_alive"))
+        if not body.get("messages"):
+            # Load request: Ollama answers at once without generating
+            return {"model": model, "message": {"role": "assistant", "content": ""}, "done": True, "done_reason": "load"}
+        if body.get("stream", True):
+            return StreamingResponse(mock.chat_stream(body), media_type="application/x-ndjson")
+        return await mock.chat(body)
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        texts = body.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        mock.touch(body.get("model"), body.get("keep_alive"))
+        return {"model": body.get("model"), "embeddings": mock.embed(texts)}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {
+            "models": [
+                {
+                    "name": name,
+                    "model": name,
+                    "size": 0,
+                    "digest": hashlib.sha256(name.encode()).hexdigest(),
+                    "details": {"family": "mock", "parameter_size": "7B", "quantization_level": "Q4_0"},
+                }
+                for name in mock.models
+            ]
+        }
+
+    @app.post("/api/show")
+    async def show(request: Request):
+        body = await request.json()
+        return {"parameters": "", "model_info": {"mock.context_length": 4096}, "details": {"family": "mock"}}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": mock.running()}
+
+    @app.get("/api/version")
+    async def version():
+        return {"version": "mock"}
+
+    @app.get("/mock/stats")
+    async def stats():
+        return {"requests": mock.requests, "active_streams": mock.active_streams}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="Generation speed per stream")
+    parser.add_argument("--first-token-ms", type=float, default=200, help="Delay before the first token")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens per response")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Relative random variation of delays")
+    parser.add_argument("--embedding-dimensions", type=int, default=768)
+    parser.add_argument("--models", default="llama2,nomic-embed-text", help="Comma-separated model names")
+    parser.add_argument("--num-parallel", type=int, default=0, help="Concurrent generations; 0 for unlimited")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    mock = MockOllama(
+        tokens_per_second=args.tokens_per_second,
+        first_token_ms=args.first_token_ms,
+        tokens=args.tokens,
+        jitter=args.jitter,
+        embedding_dimensions=args.embedding_dimensions,
+        models=args.models.split(","),
+        num_parallel=args.num_parallel,
+    )
+    uvicorn.run(create_app(mock), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
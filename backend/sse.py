@@ -0,0 +1,110 @@
+"""
+Server-Sent Events encoding and token coalescing for chat streams
+"""
+
+import os
+import json
+import asyncio
+import time
+from typing import AsyncIterator, Any, Dict, Optional
+
+# Frames are built from pre-encoded pieces; only the token text is serialized
+_CONTENT_PREFIX = b'data: {"content": '
+_CONTENT_SUFFIX = b', "done": false}\n\n'
+
+DONE_FRAME = b'data: {"content": "", "done": true}\n\n'
+
+
+def encode_content_frame(content: str) -> bytes:
+    """Encode a content frame; equivalent to encode_event({'content': content, 'done': False})"""
+    return _CONTENT_PREFIX + json.dumps(content).encode() + _CONTENT_SUFFIX
+
+
+def encode_event(payload: Dict[str, Any]) -> bytes:
+    """Encode an arbitrary JSON payload as an SSE data frame"""
+    return b"data: " + json.dumps(payload).encode() + b"\n\n"
+
+
+async def run_detached(coro):
+    """
+    Await a coroutine that must run to completion even if the caller is cancelled.
+
+    Used for cleanup after a client disconnects: the server cancels the
+    streaming task, and any plain await in its finally block would be
+    cancelled too.
+    """
+    task = asyncio.ensure_future(coro)
+    _detached_tasks.add(task)
+    task.add_done_callback(_detached_tasks.discard)
+    await asyncio.shield(task)
+
+
+# Strong references keep detached tasks from being garbage collected mid-run
+_detached_tasks = set()
+
+
+async def _close_stream(iterator, pending: Optional[asyncio.Future]):
+    if pending is not None:
+        pending.cancel()
+        await asyncio.gather(pending, return_exceptions=True)
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def coalesce_chunks(
+    chunks: AsyncIterator[str],
+    window_ms: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+) -> AsyncIterator[str]:
+    """
+    Merge a token stream into fewer, larger chunks.
+
+    The first chunk is passed through immediately so time-to-first-token is
+    unchanged. After that, chunks are buffered until window_ms has passed
+    since the last flush or the buffer reaches max_bytes. A stall in the
+    upstream stream still flushes at the end of the window.
+
+    Closing this generator (or cancelling the task consuming it) closes the
+    source stream, which aborts the upstream request.
+
+    Args:
+        chunks: Source token stream
+        window_ms: Flush interval (SSE_COALESCE_WINDOW_MS, default 20)
+        max_bytes: Flush threshold (SSE_COALESCE_MAX_BYTES, default 512)
+    """
+    window = (window_ms if window_ms is not None else float(os.getenv("SSE_COALESCE_WINDOW_MS", "20"))) / 1000
+    max_bytes = max_bytes or int(os.getenv("SSE_COALESCE_MAX_BYTES", "512"))
+
+    iterator = chunks.__aiter__()
+    buffer = []
+    size = 0
+    # Already expired, so the first chunk is flushed as soon as it arrives
+    deadline = time.monotonic()
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                # Reads run in their own task so a timeout never cancels them
+                pending = asyncio.ensure_future(iterator.__anext__())
+            # Only time out while holding buffered text
+            timeout = max(deadline - time.monotonic(), 0) if buffer else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if done:
+                task, pending = pending, None
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    break
+                buffer.append(chunk)
+                size += len(chunk)
+                if size < max_bytes and time.monotonic() < deadline:
+                    continue
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+            deadline = time.monotonic() + window
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        await run_detached(_close_stream(iterator, pending))
@@ -0,0 +1,130 @@
+"""
+Rolling conversation summaries for long chat threads
+"""
+
+import os
+import logging
+from typing import Optional, Set
+from uuid import UUID
+
+from database.base import AsyncSessionLocal
+from database.service import ChatService
+from llm_client import OllamaClient
+from thread_cache import ThreadCache
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Update the summary with the new messages. Keep facts, decisions, names and open "
+    "questions; drop pleasantries. Reply with the updated summary only."
+)
+
+
+class ConversationSummarizer:
+    """
+    Folds older messages of a thread into ChatThread.summary.
+
+    After a turn completes, messages beyond the most recent keep_recent are
+    summarized in the background once at least batch_size of them have
+    accumulated. Later turns send the summary plus the recent tail instead of
+    the full transcript.
+    """
+
+    def __init__(
+        self,
+        llm: OllamaClient,
+        keep_recent: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        max_batch: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        cache: Optional[ThreadCache] = None,
+    ):
+        """
+        Initialize summarizer.
+
+        Args:
+            llm: Client used for the summarization completions
+            keep_recent: Messages always left verbatim (CHAT_SUMMARY_KEEP_RECENT, default 10)
+            batch_size: Minimum unsummarized messages before summarizing (CHAT_SUMMARY_BATCH, default 10)
+            max_batch: Maximum messages folded per completion (CHAT_SUMMARY_MAX_BATCH, default 50)
+            max_tokens: Maximum summary length in tokens (CHAT_SUMMARY_MAX_TOKENS, default 512)
+            cache: Thread cache to invalidate when a summary changes (optional)
+        """
+        self.llm = llm
+        self.enabled = os.getenv("CHAT_SUMMARY_ENABLED", "true").lower() == "true"
+        self.keep_recent = keep_recent or int(os.getenv("CHAT_SUMMARY_KEEP_RECENT", "10"))
+        self.batch_size = batch_size or int(os.getenv("CHAT_SUMMARY_BATCH", "10"))
+        self.max_batch = max_batch or int(os.getenv("CHAT_SUMMARY_MAX_BATCH", "50"))
+        self.max_tokens = max_tokens or int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "512"))
+        self.cache = cache
+        self._in_progress: Set[UUID] = set()
+
+    async def maybe_summarize(self, thread_pk: UUID):
+        """
+        Fold older messages of a thread into its summary if enough have accumulated.
+
+        Meant to run as a background task; errors are logged, not raised.
+        """
+        if not self.enabled or thread_pk in self._in_progress:
+            return
+        self._in_progress.add(thread_pk)
+        try:
+            await self._summarize(thread_pk)
+        except Exception as e:
+            logger.error(f"Error summarizing thread {thread_pk}: {e}")
+        finally:
+            self._in_progress.discard(thread_pk)
+
+    async def _summarize(self, thread_pk: UUID):
+        async with AsyncSessionLocal() as session:
+            thread = await ChatService.get_chat_thread_by_pk(session, thread_pk)
+            if not thread:
+                return
+
+            boundary = None
+            if thread.summary_message_id:
+                boundary = (thread.summary_message_created_at, thread.summary_message_id)
+
+            pending = await ChatService.count_messages_after(session, thread_pk, boundary)
+            foldable = pending - self.keep_recent
+            if foldable < self.batch_size:
+                return
+
+            messages = await ChatService.get_messages_after(
+                session, thread_pk, boundary, limit=min(foldable, self.max_batch)
+            )
+            if not messages:
+                return
+
+        # The completion can take seconds; don't hold a DB connection meanwhile
+        transcript = "\n".join(f"{msg.role.capitalize()}: {msg.content}" for msg in messages)
+        prompt = (
+            f"Current summary:\n{thread.summary or '(none)'}\n\n"
+            f"New messages:\n{transcript}"
+        )
+        summary = await self.llm.chat_completion(
+            messages=[
+                {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.2,
+            max_tokens=self.max_tokens,
+        )
+        if not summary:
+            return
+
+        async with AsyncSessionLocal() as session:
+            updated = await ChatService.update_thread_summary(
+                session,
+                thread_pk,
+                summary=summary,
+                last_message=messages[-1],
+                previous_message_id=thread.summary_message_id,
+            )
+            await session.commit()
+        if updated:
+            if self.cache is not None:
+                # Cached context still holds the messages now covered by the summary
+                self.cache.invalidate_pk(thread_pk)
+            logger.info(f"Summarized {len(messages)} messages of thread {thread_pk}")
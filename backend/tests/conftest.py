@@ -0,0 +1,16 @@
+"""
+Test configuration: the app runs against a throwaway SQLite database
+"""
+
+import os
+import sys
+import tempfile
+
+# Set before main is imported, which reads the configuration at import time
+_db_dir = tempfile.mkdtemp(prefix="sigmachain-tests-")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["SSE_COALESCE_WINDOW_MS"] = "0"
+os.environ["MODEL_PING_INTERVAL"] = "3600"
+os.environ["OLLAMA_PRELOAD_MODELS"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
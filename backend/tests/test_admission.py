@@ -0,0 +1,145 @@
+"""
+Per-model admission control: concurrency limits, fair queueing and rejections
+"""
+
+import asyncio
+
+import pytest
+
+from metrics import registry
+from scheduler import AdmissionController, AdmissionRejected
+
+
+async def _admission_order():
+    admission = AdmissionController(max_concurrency=1, max_queue=10, max_wait=5)
+    holder = await admission.acquire("m", "alice")
+    order = []
+
+    async def request(user: str, name: str):
+        slot = await admission.acquire("m", user)
+        order.append(name)
+        await asyncio.sleep(0)
+        slot.release()
+
+    # Alice queues three requests before Bob queues one
+    tasks = [asyncio.create_task(request("alice", f"alice{i}")) for i in range(3)]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(request("bob", "bob0")))
+    await asyncio.sleep(0)
+    stats = admission.stats()["m"]
+    holder.release()
+    await asyncio.gather(*tasks)
+    return order, stats, admission.stats()["m"]
+
+
+def test_waiters_are_admitted_round_robin_across_users():
+    order, queued, done = asyncio.run(_admission_order())
+
+    assert order == ["alice0", "bob0", "alice1", "alice2"]
+    assert queued["active"] == 1
+    assert queued["queue_depth"] == 4
+    assert queued["queued_users"] == 2
+    assert done["active"] == 0
+    assert done["queue_depth"] == 0
+    assert done["admitted_total"] == 5
+
+
+async def _reject_when_full():
+    admission = AdmissionController(max_concurrency=1, max_queue=1, max_wait=5)
+    holder = await admission.acquire("m", "alice")
+    waiter = asyncio.create_task(admission.acquire("m", "bob"))
+    await asyncio.sleep(0)
+    try:
+        with pytest.raises(AdmissionRejected) as rejected:
+            await admission.acquire("m", "carol")
+    finally:
+        holder.release()
+        (await waiter).release()
+    return rejected.value, admission.stats()["m"]
+
+
+def test_full_queue_is_rejected_with_429():
+    rejected, stats = asyncio.run(_reject_when_full())
+
+    assert rejected.reason == "queue_full"
+    assert rejected.status_code == 429
+    assert rejected.retry_after >= 1
+    assert stats["rejected_total"] == 1
+
+
+async def _time_out_waiting():
+    admission = AdmissionController(max_concurrency=1, max_queue=10, max_wait=0.05)
+    holder = await admission.acquire("m", "alice")
+    with pytest.raises(AdmissionRejected) as rejected:
+        await admission.acquire("m", "bob")
+    stats = admission.stats()["m"]
+    holder.release()
+    # The slot isn't handed to the timed-out waiter
+    after = admission.stats()["m"]
+    return rejected.value, stats, after
+
+
+def test_queue_timeout_is_rejected_with_503_and_leaves_the_queue():
+    rejected, stats, after = asyncio.run(_time_out_waiting())
+
+    assert rejected.reason == "queue_timeout"
+    assert rejected.status_code == 503
+    assert stats["timed_out_total"] == 1
+    assert stats["queue_depth"] == 0
+    assert after["active"] == 0
+
+
+async def _cancel_waiting():
+    admission = AdmissionController(max_concurrency=1, max_queue=10, max_wait=5)
+    holder = await admission.acquire("m", "alice")
+    waiter = asyncio.create_task(admission.acquire("m", "bob"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    holder.release()
+    slot = await admission.acquire("m", "carol")
+    stats = admission.stats()["m"]
+    slot.release()
+    slot.release()  # Idempotent
+    return stats, admission.stats()["m"]
+
+
+def test_cancelled_waiter_does_not_keep_a_slot():
+    held, released = asyncio.run(_cancel_waiting())
+
+    assert held["active"] == 1
+    assert held["queue_depth"] == 0
+    assert released["active"] == 0
+
+
+def _sample(name: str) -> float:
+    for line in registry.render().splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[-1])
+    raise AssertionError(f"{name} not exported")
+
+
+async def _export_metrics():
+    admission = AdmissionController(max_concurrency=1, max_queue=10, max_wait=5)
+    holder = await admission.acquire("metrics-model", "alice")
+    waiter = asyncio.create_task(admission.acquire("metrics-model", "bob"))
+    await asyncio.sleep(0)
+    queued = (
+        _sample('llm_admission_active_requests{model="metrics-model"}'),
+        _sample('llm_admission_queue_depth{model="metrics-model"}'),
+    )
+    holder.release()
+    (await waiter).release()
+    drained = (
+        _sample('llm_admission_active_requests{model="metrics-model"}'),
+        _sample('llm_admission_queue_depth{model="metrics-model"}'),
+    )
+    return queued, drained, _sample('llm_admission_wait_seconds_count{model="metrics-model"}')
+
+
+def test_queue_depth_concurrency_and_wait_time_are_exported():
+    queued, drained, waits = asyncio.run(_export_metrics())
+
+    assert queued == (1, 1)
+    assert drained == (0, 0)
+    assert waits == 2
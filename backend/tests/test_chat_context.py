@@ -0,0 +1,22 @@
+"""
+Token budget of the prompt built for a chat turn
+"""
+
+from types import SimpleNamespace
+
+from chat_context import ContextBuilder
+
+
+def _history(count: int):
+    return [SimpleNamespace(role="user", content="x" * 400) for _ in range(count)]
+
+
+def test_budget_is_capped_by_the_model_context_window():
+    builder = ContextBuilder(max_messages=50, max_tokens=8192, system_prompt="", response_tokens=1024)
+
+    unbounded = builder.build(_history(40), "hi")
+    bounded = builder.build(_history(40), "hi", context_length=2048)
+
+    # Each history message costs 104 tokens; 1024 tokens are left for the reply
+    assert len(unbounded) == 41
+    assert len(bounded) == 1 + (2048 - 1024 - 4) // 104
@@ -0,0 +1,105 @@
+"""
+ChatService write paths resolve the thread inside the statement that changes it
+"""
+
+import asyncio
+import uuid
+from typing import Any, List
+
+from sqlalchemy.dialects import postgresql
+
+from database.models import ChatMessage
+from database.service import ChatService
+
+
+class _Result:
+    def __init__(self, value: Any):
+        self.value = value
+
+    def scalar_one_or_none(self) -> Any:
+        return self.value
+
+
+class _Session:
+    """Records statements; each returns the next queued RETURNING value"""
+
+    def __init__(self, *returning: Any):
+        self.returning = list(returning)
+        self.statements: List[Any] = []
+        self.added: List[Any] = []
+        self.info = {}
+
+    async def execute(self, statement, *args, **kwargs) -> _Result:
+        self.statements.append(statement)
+        return _Result(self.returning.pop(0) if self.returning else None)
+
+    def add(self, instance: Any):
+        self.added.append(instance)
+
+    async def flush(self):
+        pass
+
+
+def _describe(statement) -> str:
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    return f"{sql.split()[0]} {statement.table.name}{' RETURNING' if 'RETURNING' in sql else ''}"
+
+
+def test_create_message_bumps_the_counter_and_resolves_the_thread_in_one_update():
+    thread_pk = uuid.uuid4()
+    session = _Session(thread_pk)
+
+    message = asyncio.run(ChatService.create_chat_message(session, uuid.uuid4(), "t1", "user", "hi"))
+
+    assert [_describe(s) for s in session.statements] == ["UPDATE chat_threads RETURNING"]
+    assert session.added == [message]
+    assert message.thread_id == thread_pk
+
+
+def test_create_message_in_a_missing_thread_adds_nothing():
+    session = _Session(None)
+
+    message = asyncio.run(ChatService.create_chat_message(session, uuid.uuid4(), "nope", "user", "hi"))
+
+    assert message is None
+    assert len(session.statements) == 1
+    assert session.added == []
+
+
+def test_delete_message_checks_ownership_in_the_delete():
+    thread_pk = uuid.uuid4()
+    session = _Session(thread_pk, thread_pk)
+
+    deleted = asyncio.run(ChatService.delete_chat_message(session, uuid.uuid4(), "t1", uuid.uuid4()))
+
+    assert deleted is True
+    assert [_describe(s) for s in session.statements] == [
+        "DELETE chat_messages RETURNING",
+        "UPDATE chat_threads RETURNING",
+    ]
+    # The owning thread is a subquery of the DELETE, not a separate SELECT
+    assert "chat_threads" in str(session.statements[0].compile(dialect=postgresql.dialect()))
+
+
+def test_delete_message_of_another_users_thread_changes_no_counter():
+    session = _Session(None)
+
+    deleted = asyncio.run(ChatService.delete_chat_message(session, uuid.uuid4(), "t1", uuid.uuid4()))
+
+    assert deleted is False
+    assert len(session.statements) == 1
+
+
+def test_rename_and_delete_thread_are_single_statements():
+    rename = _Session(None)
+    delete = _Session(uuid.uuid4())
+
+    renamed = asyncio.run(ChatService.update_chat_thread_title(rename, uuid.uuid4(), "t1", "T"))
+    deleted = asyncio.run(ChatService.delete_chat_thread(delete, uuid.uuid4(), "t1"))
+
+    assert renamed is None
+    assert [_describe(s) for s in rename.statements] == ["UPDATE chat_threads RETURNING"]
+    assert deleted is True
+    assert [_describe(s) for s in delete.statements] == ["DELETE chat_threads RETURNING"]
+    # The thread's messages go with it through the foreign key
+    assert [fk.ondelete for fk in ChatMessage.__table__.c.thread_id.foreign_keys] == ["CASCADE"]
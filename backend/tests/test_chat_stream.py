@@ -0,0 +1,87 @@
+"""
+Streaming chat responses over the ASGI interface
+"""
+
+import asyncio
+import json
+from uuid import UUID
+
+import httpx
+
+import main
+
+
+class EndlessOllamaStream(httpx.AsyncByteStream):
+    """An Ollama /api/chat stream that never finishes on its own"""
+
+    def __init__(self):
+        self.closed = False
+
+    async def __aiter__(self):
+        try:
+            for i in range(100000):
+                await asyncio.sleep(0.005)
+                yield (json.dumps({"message": {"content": f"w{i} "}, "done": False}) + "\n").encode()
+        finally:
+            self.closed = True
+
+
+async def _disconnect_mid_stream():
+    upstream = EndlessOllamaStream()
+    main.ollama_client._http_client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(200, stream=upstream))
+    )
+    async with main.app.router.lifespan_context(main.app):
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+        user_id = (await client.post("/api/users", json={"username": "disconnect"})).json()["id"]
+        await client.post(f"/api/chat/threads?user_id={user_id}", json={"thread_id": "t1", "title": "T"})
+
+        # Drive the ASGI app directly: httpx's ASGI transport can't disconnect mid-response
+        frames = []
+        enough_frames = asyncio.Event()
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {"type": "http.request", "body": json.dumps({"content": "hi"}).encode(), "more_body": False}
+            await enough_frames.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.body" and message.get("body"):
+                frames.append(message["body"])
+                if len(frames) >= 4:
+                    enough_frames.set()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/api/chat/threads/t1/stream",
+            "raw_path": b"/api/chat/threads/t1/stream",
+            "query_string": f"user_id={user_id}".encode(),
+            "headers": [(b"content-type", b"application/json"), (b"host", b"test")],
+            "client": ("127.0.0.1", 1234),
+            "server": ("test", 80),
+        }
+        await asyncio.wait_for(main.app(scope, receive, send), timeout=10)
+
+        await main.message_writer.wait_for(UUID(user_id), "t1")
+        thread = (await client.get(f"/api/chat/threads/t1?user_id={user_id}")).json()
+        await client.aclose()
+    return frames, upstream, thread["messages"]
+
+
+def test_client_disconnect_saves_truncated_response():
+    frames, upstream, messages = asyncio.run(_disconnect_mid_stream())
+
+    assert len(frames) >= 4
+    assert upstream.closed
+    assert [message["role"] for message in messages] == ["user", "assistant"]
+    reply = messages[1]
+    assert reply["content"].startswith("w0 w1 w2")
+    assert reply["metadata"] == {"truncated": True, "finish_reason": "client_disconnected"}
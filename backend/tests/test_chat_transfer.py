@@ -0,0 +1,109 @@
+"""
+JSON Lines import of threads and messages
+"""
+
+import asyncio
+import json
+import uuid
+
+import httpx
+
+import main
+from chat_transfer import JsonlImporter
+
+
+def _jsonl(*records) -> bytes:
+    return "".join(json.dumps(record) + "\n" for record in records).encode()
+
+
+async def _import(username: str, *bodies: bytes):
+    async with main.app.router.lifespan_context(main.app):
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+        user_id = (await client.post("/api/users", json={"username": username})).json()["id"]
+        before = None
+        for body in bodies:
+            response = await client.post(f"/api/chat/import?user_id={user_id}", content=body)
+            assert response.status_code == 200
+            if before is None:
+                before = (await client.get(f"/api/chat/threads/t1?user_id={user_id}")).json()
+        after = (await client.get(f"/api/chat/threads/t1?user_id={user_id}")).json()
+        await client.aclose()
+    return before, after
+
+
+def test_importing_older_messages_keeps_thread_updated_at():
+    before, after = asyncio.run(_import(
+        "import-older",
+        _jsonl(
+            {"type": "thread", "thread_id": "t1", "title": "T", "created_at": "2024-01-01T00:00:00"},
+            {"type": "message", "thread_id": "t1", "role": "user", "content": "new",
+             "created_at": "2024-06-01T00:00:00"},
+        ),
+        _jsonl(
+            {"type": "message", "thread_id": "t1", "role": "user", "content": "old",
+             "created_at": "2023-01-01T00:00:00"},
+        ),
+    ))
+
+    assert before["updated_at"] == "2024-06-01T00:00:00"
+    assert after["updated_at"] == "2024-06-01T00:00:00"
+    assert [message["content"] for message in after["messages"]] == ["old", "new"]
+
+
+def test_thread_line_after_its_messages_sets_the_title(monkeypatch):
+    # A batch of one message flushes the placeholder thread before its thread line is read
+    monkeypatch.setenv("IMPORT_BATCH_SIZE", "1")
+    _, after = asyncio.run(_import(
+        "import-late-thread",
+        _jsonl(
+            {"type": "message", "thread_id": "t1", "role": "user", "content": "hi",
+             "created_at": "2024-06-01T00:00:00"},
+            {"type": "thread", "thread_id": "t1", "title": "Late title",
+             "created_at": "2024-01-01T00:00:00", "updated_at": "2024-07-01T00:00:00"},
+        ),
+    ))
+
+    assert after["title"] == "Late title"
+    assert after["created_at"] == "2024-01-01T00:00:00"
+    assert after["updated_at"] == "2024-07-01T00:00:00"
+    assert [message["content"] for message in after["messages"]] == ["hi"]
+
+
+async def _import_chunks(username: str, chunks, **kwargs):
+    async def body():
+        for chunk in chunks:
+            yield chunk
+
+    async with main.app.router.lifespan_context(main.app):
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+        user_id = (await client.post("/api/users", json={"username": username})).json()["id"]
+        report = await JsonlImporter(uuid.UUID(user_id), **kwargs).import_stream(body())
+        threads = (await client.get(f"/api/chat/threads?user_id={user_id}")).json()["threads"]
+        await client.aclose()
+    return report, threads
+
+
+def test_records_that_do_not_fit_the_schema_are_skipped_and_reported():
+    report, threads = asyncio.run(_import_chunks("import-invalid", [_jsonl(
+        {"type": "thread", "thread_id": "t1", "title": "x" * 501},
+        {"type": "thread", "thread_id": "t" * 256, "title": "Long id"},
+        {"type": "thread", "thread_id": "t2", "title": ["not", "a", "string"]},
+        {"type": "message", "thread_id": "t3", "role": "user", "content": "hi", "metadata": "oops"},
+        {"type": "thread", "thread_id": "t4", "title": "Valid"},
+    )]))
+
+    assert [error["line"] for error in report["errors"]] == [1, 2, 3, 4]
+    assert report["threads"] == 1
+    assert [thread["thread_id"] for thread in threads] == ["t4"]
+
+
+def test_over_long_lines_are_dropped_without_buffering_them():
+    valid = _jsonl({"type": "message", "thread_id": "t1", "role": "user", "content": "kept"})
+    chunks = [valid, b'{"type": "message", "content": "' + b"x" * 80, b"x" * 80, b'"}\n' + valid]
+
+    report, threads = asyncio.run(_import_chunks("import-long-line", chunks, max_line_bytes=100))
+
+    assert report["lines"] == 3
+    assert report["messages_imported"] == 2
+    assert report["errors"] == [{"line": 2, "error": "line exceeds 100 bytes"}]
+    assert [thread["message_count"] for thread in threads] == [2]
@@ -0,0 +1,45 @@
+"""
+Purging of expired entries from the persistent completion cache backend
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from completion_cache import CacheBackend, CompletionCache
+
+
+class MemoryBackend(CacheBackend):
+    def __init__(self):
+        self.entries: Dict[str, Tuple[str, float]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        value, expires_at = self.entries.get(key, (None, 0.0))
+        return value if expires_at > time.monotonic() else None
+
+    async def set(self, key: str, value: str, ttl: float, provider: str, model: str):
+        self.entries[key] = (value, time.monotonic() + ttl)
+
+    async def purge_expired(self) -> int:
+        expired = [key for key, (_, expires_at) in self.entries.items() if expires_at <= time.monotonic()]
+        for key in expired:
+            del self.entries[key]
+        return len(expired)
+
+
+async def _purge_in_background():
+    backend = MemoryBackend()
+    cache = CompletionCache(ttl=0.01, backend=backend, purge_interval=0.05)
+    await cache.set("a", "1")
+    await cache.set("b", "2")
+    cache.start()
+    await asyncio.sleep(0.2)
+    await cache.aclose()
+    return backend, cache
+
+
+def test_expired_backend_entries_are_purged_periodically():
+    backend, cache = asyncio.run(_purge_in_background())
+
+    assert backend.entries == {}
+    assert cache.stats()["purged"] == 2
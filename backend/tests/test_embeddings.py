@@ -0,0 +1,141 @@
+"""
+Background embedding of messages and incremental loading by the retriever
+"""
+
+import asyncio
+import hashlib
+import uuid
+from datetime import datetime
+
+import httpx
+
+import main
+from database.base import AsyncSessionLocal
+from database.service import ChatService
+from llm_client import OllamaClient
+from retrieval import EmbeddingIndexer, SemanticRetriever
+
+
+def _fake_embed(request: httpx.Request) -> httpx.Response:
+    texts = httpx.Response(200, content=request.content).json()["input"]
+    vectors = [[b / 255 for b in hashlib.sha256(text.encode()).digest()[:8]] for text in texts]
+    return httpx.Response(200, json={"embeddings": vectors})
+
+
+async def _index_imported_history(monkeypatch):
+    monkeypatch.setenv("EMBEDDINGS_ENABLED", "true")
+    llm = OllamaClient(http_client=httpx.AsyncClient(transport=httpx.MockTransport(_fake_embed)))
+    indexer = EmbeddingIndexer(llm, batch_size=100)
+    retriever = SemanticRetriever(llm, top_k=100, min_score=-1)
+
+    async with main.app.router.lifespan_context(main.app):
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+        user_id = (await client.post("/api/users", json={"username": "embeddings"})).json()["id"]
+        thread = (await client.post(
+            f"/api/chat/threads?user_id={user_id}", json={"thread_id": "e1", "title": "E"}
+        )).json()
+        for content in ("first", "second"):
+            await client.post(
+                f"/api/chat/threads/e1/messages?user_id={user_id}", json={"role": "user", "content": content}
+            )
+        await client.aclose()
+
+        first_pass = await indexer.index_batch()
+        loaded = await retriever.retrieve(uuid.UUID(user_id), "query", exclude=set())
+
+        # Imported history keeps its original, older timestamp
+        async with AsyncSessionLocal() as session:
+            await ChatService.create_messages_bulk(session, [{
+                "id": uuid.uuid4(),
+                "thread_id": uuid.UUID(thread["id"]),
+                "role": "user",
+                "content": "imported",
+                "message_metadata": {},
+                "created_at": datetime(2020, 1, 1),
+            }])
+            await session.commit()
+
+        second_pass = await indexer.index_batch()
+        reloaded = await retriever.retrieve(uuid.UUID(user_id), "query", exclude=set())
+    return first_pass, loaded, second_pass, reloaded
+
+
+def test_messages_imported_with_old_timestamps_are_embedded_and_retrieved(monkeypatch):
+    first_pass, loaded, second_pass, reloaded = asyncio.run(_index_imported_history(monkeypatch))
+
+    # Includes messages written by other tests sharing the database
+    assert first_pass >= 2
+    assert sorted(message.content for message in loaded) == ["first", "second"]
+    assert second_pass == 1
+    assert sorted(message.content for message in reloaded) == ["first", "imported", "second"]
+
+
+async def _reindex_after_model_change(monkeypatch):
+    monkeypatch.setenv("EMBEDDINGS_ENABLED", "true")
+    http_client = httpx.AsyncClient(transport=httpx.MockTransport(_fake_embed))
+    old = OllamaClient(http_client=http_client)
+    old.embed_model = "old-embed"
+    new = OllamaClient(http_client=http_client)
+    new.embed_model = "new-embed"
+
+    async with main.app.router.lifespan_context(main.app):
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+        user_id = (await client.post("/api/users", json={"username": "embeddings-model"})).json()["id"]
+        await client.post(f"/api/chat/threads?user_id={user_id}", json={"thread_id": "m1", "title": "M"})
+        await client.post(
+            f"/api/chat/threads/m1/messages?user_id={user_id}", json={"role": "user", "content": "remember me"}
+        )
+        await client.aclose()
+
+        for llm in (old, new):
+            indexer = EmbeddingIndexer(llm, batch_size=100)
+            while await indexer.index_batch():
+                pass
+        retriever = SemanticRetriever(new, top_k=100, min_score=-1)
+        retrieved = await retriever.retrieve(uuid.UUID(user_id), "query", exclude=set())
+    return retrieved
+
+
+def test_changing_the_embedding_model_reindexes_messages(monkeypatch):
+    retrieved = asyncio.run(_reindex_after_model_change(monkeypatch))
+
+    assert [message.content for message in retrieved] == ["remember me"]
+
+
+def _reject_poison(request: httpx.Request) -> httpx.Response:
+    texts = httpx.Response(200, content=request.content).json()["input"]
+    if any("poison" in text for text in texts):
+        return httpx.Response(400, json={"error": "input cannot be embedded"})
+    return _fake_embed(request)
+
+
+async def _index_around_a_rejected_message(monkeypatch):
+    monkeypatch.setenv("EMBEDDINGS_ENABLED", "true")
+    llm = OllamaClient(http_client=httpx.AsyncClient(transport=httpx.MockTransport(_reject_poison)))
+    llm.embed_model = "strict-embed"
+    indexer = EmbeddingIndexer(llm, batch_size=100)
+
+    async with main.app.router.lifespan_context(main.app):
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+        user_id = (await client.post("/api/users", json={"username": "embeddings-poison"})).json()["id"]
+        await client.post(f"/api/chat/threads?user_id={user_id}", json={"thread_id": "p1", "title": "P"})
+        for content in ("before", "poison", "after"):
+            await client.post(
+                f"/api/chat/threads/p1/messages?user_id={user_id}", json={"role": "user", "content": content}
+            )
+        await client.aclose()
+
+        while await indexer.index_batch():
+            pass
+        retriever = SemanticRetriever(llm, top_k=100, min_score=-1)
+        retrieved = await retriever.retrieve(uuid.UUID(user_id), "query", exclude=set())
+    return retrieved, indexer.stats()
+
+
+def test_rejected_message_is_skipped_and_the_rest_of_the_batch_indexed(monkeypatch):
+    retrieved, stats = asyncio.run(_index_around_a_rejected_message(monkeypatch))
+
+    assert sorted(message.content for message in retrieved) == ["after", "before"]
+    # Skipped once, not selected again on later passes
+    assert stats["skipped_total"] == 1
+    assert stats["errors_total"] == 0
@@ -0,0 +1,40 @@
+"""
+Keyset pagination of thread messages and its page size bounds
+"""
+
+import asyncio
+
+import httpx
+
+import main
+
+
+async def _pages():
+    async with main.app.router.lifespan_context(main.app):
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test")
+        user_id = (await client.post("/api/users", json={"username": "message-pages"})).json()["id"]
+        await client.post(f"/api/chat/threads?user_id={user_id}", json={"thread_id": "t1", "title": "T"})
+        for i in range(3):
+            await client.post(
+                f"/api/chat/threads/t1/messages?user_id={user_id}", json={"role": "user", "content": f"m{i}"}
+            )
+        url = f"/api/chat/threads/t1/messages?user_id={user_id}"
+        statuses = [(await client.get(f"{url}&limit={limit}")).status_code for limit in (0, -1, 501)]
+        thread_status = (await client.get(f"/api/chat/threads/t1?user_id={user_id}&message_limit=0")).status_code
+        first = (await client.get(f"{url}&limit=2")).json()
+        second = (await client.get(f"{url}&limit=2&after={first['after_cursor']}")).json()
+        default = (await client.get(url)).json()
+        await client.aclose()
+    return statuses, thread_status, first, second, default
+
+
+def test_pages_follow_the_cursor_and_limits_out_of_range_are_rejected():
+    statuses, thread_status, first, second, default = asyncio.run(_pages())
+
+    assert statuses == [422, 422, 422]
+    assert thread_status == 422
+    assert [message["content"] for message in first["messages"]] == ["m0", "m1"]
+    assert first["has_more"] is True
+    assert [message["content"] for message in second["messages"]] == ["m2"]
+    assert second["has_more"] is False
+    assert default["count"] == 3
@@ -0,0 +1,139 @@
+"""
+Write-behind message queue: batching, ordering, wait_for and retries
+"""
+
+import asyncio
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy.exc import OperationalError
+
+import message_writer
+from message_writer import MessageWriter
+
+
+class _Session:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def commit(self):
+        pass
+
+
+class _FakeChatService:
+    """Stands in for ChatService.create_messages_bulk"""
+
+    def __init__(self, failures: Sequence[Exception] = (), release: Optional[asyncio.Event] = None):
+        self.failures = list(failures)
+        self.release = release
+        self.batches: List[List[Dict[str, Any]]] = []
+        self.missing_threads = set()
+
+    async def create_messages_bulk(self, session, rows: List[Dict[str, Any]]) -> int:
+        if self.release is not None:
+            await self.release.wait()
+        if self.failures:
+            raise self.failures.pop(0)
+        self.batches.append(rows)
+        return sum(1 for row in rows if row["thread_id"] not in self.missing_threads)
+
+
+def _install(monkeypatch, service: _FakeChatService):
+    monkeypatch.setattr(message_writer, "AsyncSessionLocal", _Session)
+    monkeypatch.setattr(message_writer, "ChatService", service)
+
+
+async def _write_in_order(service: _FakeChatService):
+    writer = MessageWriter(max_batch=100, retry_delay=0.01)
+    user_id, thread_pk = uuid.uuid4(), uuid.uuid4()
+    ids = [writer.enqueue(user_id, "t1", thread_pk, "user", f"m{i}") for i in range(5)]
+    await writer.wait_for(user_id, "t1")
+    await writer.close()
+    return ids, writer.stats()
+
+
+def test_messages_queued_together_are_written_in_one_batch_in_order(monkeypatch):
+    service = _FakeChatService()
+    _install(monkeypatch, service)
+
+    ids, stats = asyncio.run(_write_in_order(service))
+
+    assert len(service.batches) == 1
+    rows = service.batches[0]
+    assert [row["id"] for row in rows] == ids
+    assert [row["content"] for row in rows] == [f"m{i}" for i in range(5)]
+    assert [row["created_at"] for row in rows] == sorted(row["created_at"] for row in rows)
+    assert stats["written_total"] == 5
+    assert stats["batches_total"] == 1
+    assert stats["threads_pending"] == 0
+
+
+async def _wait_for_pending_write(service: _FakeChatService):
+    writer = MessageWriter()
+    user_id = uuid.uuid4()
+    writer.enqueue(user_id, "t1", uuid.uuid4(), "user", "hi")
+    waiting = asyncio.create_task(writer.wait_for(user_id, "t1"))
+    await asyncio.sleep(0.01)
+    blocked = not waiting.done()
+    # Other threads have nothing queued and don't wait
+    await asyncio.wait_for(writer.wait_for(user_id, "t2"), 0.1)
+    service.release.set()
+    await asyncio.wait_for(waiting, 1)
+    await writer.close()
+    return blocked
+
+
+def test_wait_for_blocks_until_the_threads_messages_are_written(monkeypatch):
+    service = _FakeChatService(release=asyncio.Event())
+    _install(monkeypatch, service)
+
+    assert asyncio.run(_wait_for_pending_write(service)) is True
+    assert len(service.batches) == 1
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    service = _FakeChatService(failures=[OperationalError("INSERT", {}, Exception("connection reset"))])
+    _install(monkeypatch, service)
+
+    _, stats = asyncio.run(_write_in_order(service))
+
+    assert stats["retries_total"] == 1
+    assert stats["written_total"] == 5
+    assert stats["dropped_total"] == 0
+
+
+def test_permanent_errors_drop_the_batch_and_release_waiters(monkeypatch):
+    service = _FakeChatService(failures=[ValueError("bad row")])
+    _install(monkeypatch, service)
+
+    _, stats = asyncio.run(_write_in_order(service))
+
+    assert service.batches == []
+    assert stats["retries_total"] == 0
+    assert stats["dropped_total"] == 5
+    assert stats["threads_pending"] == 0
+
+
+async def _close_flushes(service: _FakeChatService):
+    writer = MessageWriter()
+    thread_pk, deleted_pk = uuid.uuid4(), uuid.uuid4()
+    service.missing_threads.add(deleted_pk)
+    writer.enqueue(uuid.uuid4(), "t1", thread_pk, "user", "kept")
+    writer.enqueue(uuid.uuid4(), "t2", deleted_pk, "user", "thread deleted meanwhile")
+    await writer.close()
+    return writer.stats()
+
+
+def test_close_writes_everything_still_queued(monkeypatch):
+    service = _FakeChatService()
+    _install(monkeypatch, service)
+
+    stats = asyncio.run(_close_flushes(service))
+
+    assert sum(len(batch) for batch in service.batches) == 2
+    assert stats["written_total"] == 1
+    assert stats["dropped_total"] == 1
+    assert stats["queued"] == 0
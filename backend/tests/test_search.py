@@ -0,0 +1,85 @@
+"""
+Full-text message search: ranking, snippets and pagination of the generated SQL
+"""
+
+import asyncio
+import re
+import uuid
+from types import SimpleNamespace
+from typing import Any, List
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database.service import ChatService
+
+
+class _Session:
+    """Records the search statement and returns canned rows"""
+
+    def __init__(self, dialect: str, rows: List[Any]):
+        self.dialect = dialect
+        self.rows = rows
+        self.statements: List[Any] = []
+
+    def get_bind(self):
+        return SimpleNamespace(dialect=SimpleNamespace(name=self.dialect))
+
+    async def execute(self, statement, *args, **kwargs):
+        self.statements.append(statement)
+        return SimpleNamespace(all=lambda: list(self.rows))
+
+
+def _search(dialect: str, rows: List[Any], **kwargs):
+    session = _Session(dialect, rows)
+    result = asyncio.run(ChatService.search_messages(session, uuid.uuid4(), "cats -dogs", **kwargs))
+    return result, session.statements[0]
+
+
+def test_postgres_search_ranks_matches_and_builds_snippets_for_the_page_only():
+    (_, _), statement = _search("postgresql", [], limit=5, offset=10)
+    compiled = statement.compile(dialect=postgresql.dialect())
+    sql = " ".join(str(compiled).split())
+
+    assert "websearch_to_tsquery" in sql
+    assert "chat_messages.content_tsv @@" in sql
+    # Ranked inside the page subquery, best first, ties broken by recency
+    assert "ORDER BY rank DESC, chat_messages.created_at DESC, chat_messages.id" in sql
+    assert sql.count("ts_rank_cd(") == 1
+    # Snippets only for the rows of the page, outside the subquery
+    assert sql.count("ts_headline(") == 1
+    assert sql.index("ts_headline(") < sql.index("FROM (SELECT")
+    # One row beyond the page tells whether there is a next page
+    limit, offset = re.search(r"LIMIT %\((\w+)\)s OFFSET %\((\w+)\)s", sql).groups()
+    assert compiled.params[limit] == 6
+    assert compiled.params[offset] == 10
+
+
+def test_search_can_be_restricted_to_one_thread():
+    _, statement = _search("postgresql", [], thread_id="t1")
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+
+    assert "chat_threads.thread_id = " in sql
+
+
+def test_extra_row_sets_has_more_and_is_not_returned():
+    rows = [SimpleNamespace(message_id=i) for i in range(3)]
+
+    (page, has_more), _ = _search("postgresql", rows, limit=2)
+    (last_page, last_has_more), _ = _search("postgresql", rows[:2], limit=2)
+
+    assert [row.message_id for row in page] == [0, 1]
+    assert has_more is True
+    assert len(last_page) == 2
+    assert last_has_more is False
+
+
+def test_other_databases_fall_back_to_a_substring_match_by_recency():
+    (_, _), statement = _search("sqlite", [], limit=5, offset=10)
+    compiled = statement.compile(dialect=sqlite.dialect())
+    sql = " ".join(str(compiled).split())
+
+    assert "tsquery" not in sql
+    assert "lower(chat_messages.content) LIKE" in sql
+    assert "ORDER BY chat_messages.created_at DESC, chat_messages.id" in sql
+    assert 6 in compiled.params.values()
+    assert 10 in compiled.params.values()
@@ -0,0 +1,136 @@
+"""
+In-process thread context cache: loads, write-through, invalidation and eviction
+"""
+
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+from thread_cache import CachedMessage, ThreadCache
+
+USER = uuid.uuid4()
+
+
+def _thread(summary=None):
+    return SimpleNamespace(id=uuid.uuid4(), summary=summary)
+
+
+def _message(content: str):
+    return SimpleNamespace(id=uuid.uuid4(), role="user", content=content, created_at=datetime.utcnow())
+
+
+def _load(cache: ThreadCache, thread_id: str, thread=None, history=()):
+    token = cache.begin_load(USER, thread_id)
+    return cache.put(USER, thread_id, thread or _thread(), list(history), token)
+
+
+def test_loaded_thread_is_served_from_the_cache():
+    cache = ThreadCache(max_messages=10)
+
+    assert cache.get(USER, "t1") is None
+    loaded = _load(cache, "t1", history=[_message("a"), _message("b")])
+
+    assert cache.get(USER, "t1") is loaded
+    assert [msg.content for msg in loaded.messages] == ["a", "b"]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_load_racing_a_change_is_used_once_but_not_cached():
+    cache = ThreadCache(max_messages=10)
+
+    token = cache.begin_load(USER, "t1")
+    cache.invalidate(USER, "t1")
+    entry = cache.put(USER, "t1", _thread(), [_message("stale")], token)
+
+    assert [msg.content for msg in entry.messages] == ["stale"]
+    assert cache.get(USER, "t1") is None
+
+
+def test_appended_messages_keep_the_newest_max_messages():
+    cache = ThreadCache(max_messages=2)
+    _load(cache, "t1", history=[_message("a"), _message("b")])
+
+    cache.append(USER, "t1", CachedMessage(uuid.uuid4(), "assistant", "c", datetime.utcnow()))
+    # Messages of uncached threads are ignored
+    cache.append(USER, "t2", _message("x"))
+
+    assert [msg.content for msg in cache.get(USER, "t1").messages] == ["b", "c"]
+    assert cache.get(USER, "t2") is None
+    assert cache.stats()["bytes"] == cache.get(USER, "t1").size
+
+
+def test_invalidation_by_key_and_by_primary_key():
+    cache = ThreadCache(max_messages=10)
+    thread = _thread()
+    _load(cache, "t1")
+    _load(cache, "t2", thread=thread)
+
+    cache.invalidate(USER, "t1")
+    cache.invalidate_pk(thread.id)
+
+    assert cache.get(USER, "t1") is None
+    assert cache.get(USER, "t2") is None
+    assert cache.stats()["invalidations"] == 2
+    assert cache.stats()["bytes"] == 0
+
+
+def test_least_recently_used_threads_are_evicted_over_max_bytes():
+    cache = ThreadCache(max_messages=10, max_bytes=1)
+    size = _load(cache, "probe", history=[_message("x" * 100)]).size
+    cache = ThreadCache(max_messages=10, max_bytes=2 * size)
+
+    _load(cache, "t1", history=[_message("x" * 100)])
+    _load(cache, "t2", history=[_message("y" * 100)])
+    cache.get(USER, "t1")
+    _load(cache, "t3", history=[_message("z" * 100)])
+
+    assert cache.get(USER, "t1") is not None
+    assert cache.get(USER, "t2") is None
+    assert cache.get(USER, "t3") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ThreadCache(max_messages=10, enabled=False)
+
+    entry = _load(cache, "t1", history=[_message("a")])
+
+    assert [msg.content for msg in entry.messages] == ["a"]
+    assert cache.get(USER, "t1") is None
+
+
+def test_notification_for_another_thread_does_not_discard_a_load():
+    cache = ThreadCache(max_messages=10)
+    thread, other = _thread(), _thread()
+    token = cache.begin_load(USER, "t1")
+    cache.resolve_load(token, thread.id)
+
+    cache.invalidate_pk(other.id)
+    cache.put(USER, "t1", thread, [_message("a")], token)
+
+    assert cache.get(USER, "t1") is not None
+
+
+def test_notification_for_the_loading_thread_discards_the_load():
+    cache = ThreadCache(max_messages=10)
+    thread = _thread()
+    token = cache.begin_load(USER, "t1")
+    cache.resolve_load(token, thread.id)
+
+    cache.invalidate_pk(thread.id)
+    cache.put(USER, "t1", thread, [_message("a")], token)
+
+    assert cache.get(USER, "t1") is None
+
+
+def test_load_that_has_not_read_its_thread_yet_is_discarded_by_any_notification():
+    cache = ThreadCache(max_messages=10)
+    thread = _thread()
+    token = cache.begin_load(USER, "t1")
+
+    cache.invalidate_pk(uuid.uuid4())
+    cache.resolve_load(token, thread.id)
+    cache.put(USER, "t1", thread, [_message("a")], token)
+
+    assert cache.get(USER, "t1") is None
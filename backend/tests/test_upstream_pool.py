@@ -0,0 +1,163 @@
+"""
+Routing across Ollama hosts and the circuit breaker open/half-open cycle
+"""
+
+import httpx
+import pytest
+
+import upstream_pool
+from upstream_pool import CircuitBreaker, NoUpstreamAvailable, UpstreamPool
+
+URLS = ["http://a:11434", "http://b:11434", "http://c:11434"]
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(upstream_pool.time, "monotonic", clock)
+    return clock
+
+
+def _pool(**kwargs) -> UpstreamPool:
+    options = dict(routing="consistent_hash", failure_threshold=2, reset_timeout=10, load_factor=1.25)
+    options.update(kwargs)
+    return UpstreamPool(URLS, **options)
+
+
+def _connect_error() -> httpx.ConnectError:
+    return httpx.ConnectError("refused", request=httpx.Request("POST", URLS[0]))
+
+
+def test_breaker_opens_after_consecutive_failures_and_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    breaker.on_failure()
+    assert breaker.state == "closed"
+    breaker.on_failure()
+    assert breaker.state == "open"
+    assert not breaker.available()
+
+    clock.now += 10
+    assert breaker.available()
+    breaker.on_request()
+    assert breaker.state == "half_open"
+    # Only one trial request at a time
+    assert not breaker.available()
+
+    # A failed trial reopens the breaker for another reset_timeout
+    breaker.on_failure()
+    assert breaker.state == "open"
+    assert not breaker.available()
+    clock.now += 10
+    breaker.on_request()
+    breaker.on_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert breaker.opened == 1
+
+
+def test_success_resets_the_consecutive_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    breaker.on_failure()
+    breaker.on_success()
+    breaker.on_failure()
+
+    assert breaker.state == "closed"
+
+
+def test_route_keys_stick_to_a_host_and_spread_across_hosts(clock):
+    pool = _pool()
+
+    first = {key: pool.candidates(key)[0].url for key in (f"thread-{i}" for i in range(60))}
+
+    assert first == {key: pool.candidates(key)[0].url for key in first}
+    assert set(first.values()) == set(URLS)
+    # Every host is still a failover candidate
+    assert sorted(host.url for host in pool.candidates("thread-0")) == URLS
+
+
+def test_overloaded_host_is_passed_over(clock):
+    pool = _pool()
+    routed = pool.candidates("thread-0")[0]
+
+    for _ in range(5):
+        pool.begin(routed)
+
+    assert pool.candidates("thread-0")[0] is not routed
+    assert pool.candidates("thread-0")[-1] is routed
+
+
+def test_requests_without_a_key_go_to_the_least_loaded_host(clock):
+    pool = _pool()
+    pool.begin(pool.hosts[0])
+    pool.begin(pool.hosts[1])
+
+    assert pool.candidates()[0] is pool.hosts[2]
+
+
+def test_host_failures_open_the_breaker_and_route_around_the_host(clock):
+    pool = _pool()
+    host = pool.candidates("thread-0")[0]
+
+    for _ in range(2):
+        pool.begin(host)
+        pool.end(host, _connect_error())
+
+    assert host.breaker.state == "open"
+    assert host not in pool.candidates("thread-0")
+    assert pool.stats()["hosts"][pool.hosts.index(host)]["failures_total"] == 2
+
+    # After reset_timeout the host gets one trial request; success closes the breaker
+    clock.now += 10
+    assert host in pool.candidates("thread-0")
+    pool.begin(host)
+    pool.end(host)
+    assert host.breaker.state == "closed"
+    assert host.up
+
+
+def test_request_errors_do_not_count_against_the_host(clock):
+    pool = _pool()
+    host = pool.hosts[0]
+    response = httpx.Response(400, request=httpx.Request("POST", host.url))
+
+    for _ in range(3):
+        pool.begin(host)
+        pool.end(host, httpx.HTTPStatusError("bad request", request=response.request, response=response))
+
+    assert host.breaker.state == "closed"
+    assert host.failures == 0
+    assert host.outstanding == 0
+
+
+def test_no_host_available_when_every_breaker_is_open(clock):
+    pool = _pool()
+    for host in pool.hosts:
+        for _ in range(2):
+            pool.begin(host)
+            pool.end(host, _connect_error())
+
+    with pytest.raises(NoUpstreamAvailable):
+        pool.candidates("thread-0")
+    # Metadata requests still get a host
+    assert pool.preferred() in pool.hosts
+
+
+def test_unhealthy_hosts_are_skipped_unless_all_are_unhealthy(clock):
+    pool = _pool()
+    pool.hosts[0].healthy = False
+
+    assert pool.hosts[0] not in pool.available()
+
+    for host in pool.hosts:
+        host.healthy = False
+    assert pool.available() == pool.hosts
@@ -0,0 +1,229 @@
+"""
+In-process cache of recent conversation context for active threads
+"""
+
+import os
+import sys
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+from uuid import UUID
+
+# (user_id, thread_id) as used in the API routes
+ThreadKey = Tuple[UUID, str]
+
+# Approximate size of a CachedMessage without its content string
+_MESSAGE_OVERHEAD = 120
+_THREAD_OVERHEAD = 400
+
+
+class CachedMessage:
+    """Compact copy of a chat message; has the attributes ContextBuilder reads"""
+
+    __slots__ = ("id", "role", "content", "created_at")
+
+    def __init__(self, id: UUID, role: str, content: str, created_at: datetime):
+        self.id = id
+        self.role = role
+        self.content = content
+        self.created_at = created_at
+
+    @property
+    def size(self) -> int:
+        return _MESSAGE_OVERHEAD + sys.getsizeof(self.content)
+
+
+class CachedThread:
+    """Thread fields needed for a chat turn plus its most recent messages"""
+
+    __slots__ = ("thread_pk", "summary", "messages", "size")
+
+    def __init__(self, thread_pk: UUID, summary: Optional[str], messages: Deque[CachedMessage]):
+        self.thread_pk = thread_pk
+        self.summary = summary
+        # Newest max_messages messages after the summary boundary, oldest first
+        self.messages = messages
+        self.size = _THREAD_OVERHEAD + sys.getsizeof(summary or "") + sum(msg.size for msg in messages)
+
+
+class _Load:
+    """Token of a database load in flight; thread_pk is set once the thread row is read"""
+
+    __slots__ = ("thread_pk",)
+
+    def __init__(self):
+        self.thread_pk: Optional[UUID] = None
+
+
+class ThreadCache:
+    """
+    LRU cache of the context a chat turn needs, keyed by (user_id, thread_id).
+
+    Each entry holds the thread's summary and its last max_messages messages
+    after the summary boundary: exactly what the stream route would load
+    from the database. New messages are appended write-through; deleting a
+    thread or message, renaming a thread or updating its summary drops the
+    entry so the next turn reloads it. Entries are evicted least recently
+    used first once the total size exceeds max_bytes.
+    """
+
+    def __init__(
+        self,
+        max_messages: int,
+        max_bytes: Optional[int] = None,
+        enabled: Optional[bool] = None,
+    ):
+        """
+        Initialize thread cache.
+
+        Args:
+            max_messages: Messages kept per thread; should match the context builder's limit
+            max_bytes: Approximate memory cap (THREAD_CACHE_MAX_BYTES, default 32 MiB)
+            enabled: Whether to cache at all (THREAD_CACHE_ENABLED, default true)
+        """
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes or int(os.getenv("THREAD_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        if enabled is None:
+            enabled = os.getenv("THREAD_CACHE_ENABLED", "true").lower() == "true"
+        self.enabled = enabled
+        self._entries: "OrderedDict[ThreadKey, CachedThread]" = OrderedDict()
+        self._keys_by_pk: Dict[UUID, ThreadKey] = {}
+        # Loads in flight; any change to the key meanwhile discards the load
+        self._loading: Dict[ThreadKey, _Load] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: UUID, thread_id: str) -> Optional[CachedThread]:
+        """Return the cached context of a thread, if present"""
+        key = (user_id, thread_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def begin_load(self, user_id: UUID, thread_id: str) -> _Load:
+        """Mark the start of a database load; pass the returned token to resolve_load() and put()"""
+        token = _Load()
+        self._loading[(user_id, thread_id)] = token
+        return token
+
+    def resolve_load(self, token: _Load, thread_pk: UUID):
+        """Record the primary key of the thread being loaded, once its row has been read"""
+        token.thread_pk = thread_pk
+
+    def put(
+        self,
+        user_id: UUID,
+        thread_id: str,
+        thread: Any,
+        history: Iterable[Any],
+        token: _Load,
+    ) -> CachedThread:
+        """
+        Cache a thread loaded from the database.
+
+        The entry is only stored if nothing touched the thread since
+        begin_load(); either way it is returned for the current turn.
+
+        Args:
+            thread: ChatThread
+            history: Its most recent messages after the summary boundary, oldest first
+            token: Value returned by begin_load()
+        """
+        key = (user_id, thread_id)
+        messages = deque(
+            (CachedMessage(msg.id, msg.role, msg.content, msg.created_at) for msg in history),
+            maxlen=self.max_messages,
+        )
+        entry = CachedThread(thread.id, thread.summary, messages)
+        if self._loading.get(key) is token:
+            del self._loading[key]
+            if self.enabled and entry.size <= self.max_bytes:
+                self._remove(key)
+                self._entries[key] = entry
+                self._keys_by_pk[entry.thread_pk] = key
+                self._bytes += entry.size
+                self._evict()
+        return entry
+
+    def append(self, user_id: UUID, thread_id: str, message: Any):
+        """Write-through of a newly created message"""
+        key = (user_id, thread_id)
+        self._loading.pop(key, None)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        cached = message
+        if not isinstance(message, CachedMessage):
+            cached = CachedMessage(message.id, message.role, message.content, message.created_at)
+        if len(entry.messages) == entry.messages.maxlen:
+            dropped = entry.messages[0].size
+            entry.size -= dropped
+            self._bytes -= dropped
+        entry.messages.append(cached)
+        entry.size += cached.size
+        self._bytes += cached.size
+        self._evict()
+
+    def invalidate(self, user_id: UUID, thread_id: str):
+        """Drop a thread's entry after it was deleted, renamed or had messages removed"""
+        key = (user_id, thread_id)
+        self._loading.pop(key, None)
+        if key in self._entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_pk(self, thread_pk: UUID):
+        """
+        Drop a thread's entry by its primary key.
+
+        Loads of that thread in flight are discarded too. A load that hasn't
+        read its thread row yet can't be matched by primary key and is
+        discarded as well; that window is a single primary-key lookup.
+        """
+        key = self._keys_by_pk.get(thread_pk)
+        if key is not None:
+            self.invalidate(*key)
+        stale = [
+            key for key, load in self._loading.items()
+            if load.thread_pk is None or load.thread_pk == thread_pk
+        ]
+        for key in stale:
+            del self._loading[key]
+
+    def clear(self):
+        """Drop every entry, e.g. after invalidations may have been missed"""
+        self._entries.clear()
+        self._keys_by_pk.clear()
+        self._loading.clear()
+        self._bytes = 0
+
+    def _remove(self, key: ThreadKey):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            self._keys_by_pk.pop(entry.thread_pk, None)
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters and current size"""
+        return {
+            "enabled": self.enabled,
+            "threads": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,312 @@
+"""
+Routing, health checks and circuit breakers across several Ollama hosts
+"""
+
+import os
+import math
+import time
+import asyncio
+import bisect
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from metrics import (
+    LLM_UPSTREAM_ERRORS,
+    OLLAMA_HOST_ERRORS,
+    OLLAMA_HOST_OUTSTANDING,
+    OLLAMA_HOST_UP,
+    upstream_error_type,
+)
+
+logger = logging.getLogger(__name__)
+
+ROUTING_STRATEGIES = ("consistent_hash", "least_outstanding")
+
+
+class NoUpstreamAvailable(ValueError):
+    """Every Ollama host has an open circuit breaker"""
+
+
+def is_host_failure(error: BaseException) -> bool:
+    """Errors that say something about the host (unreachable, timing out, 5xx) rather than the request"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.RequestError)
+
+
+def is_retriable(error: BaseException) -> bool:
+    """Errors worth retrying on another host; a 404 means the model isn't pulled there"""
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 404:
+        return True
+    return is_host_failure(error)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a host after consecutive failures.
+
+    After failure_threshold consecutive host failures the breaker opens and
+    the host gets no requests for reset_timeout seconds. Then one trial
+    request is let through (half-open): success closes the breaker, failure
+    opens it again.
+    """
+
+    __slots__ = ("failure_threshold", "reset_timeout", "state", "failures", "opened_at", "trial_in_flight", "opened")
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.opened = 0
+
+    def available(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.trial_in_flight:
+            return False
+        return time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def on_request(self):
+        if self.state != "closed":
+            self.state = "half_open"
+            self.trial_in_flight = True
+
+    def on_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.trial_in_flight = False
+
+    def on_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state == "closed":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class UpstreamHost:
+    """One Ollama host with its load, health and breaker state"""
+
+    def __init__(self, url: str, breaker: CircuitBreaker):
+        self.url = url
+        self.breaker = breaker
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.check_seconds: Optional[float] = None
+
+    @property
+    def up(self) -> bool:
+        return self.healthy and self.breaker.state == "closed"
+
+
+class UpstreamPool:
+    """
+    Spreads Ollama requests across several hosts.
+
+    Requests with a route key (the chat thread) are placed on a consistent
+    hash ring, so each thread keeps hitting the host that has its prompt
+    prefix in the KV cache, and adding or removing a host only moves the
+    threads of that host. A host already carrying more than load_factor
+    times the average load is passed over (consistent hashing with bounded
+    loads), so one busy thread can't pile work onto a single host. Requests
+    without a key, and all requests with least_outstanding routing, go to
+    the host with the fewest requests in flight.
+
+    Hosts failing the active health check are skipped, unless all of them
+    fail it, in which case health is ignored rather than refusing every
+    request. Hosts with an open circuit breaker are always skipped.
+    """
+
+    def __init__(
+        self,
+        urls: Optional[List[str]] = None,
+        routing: Optional[str] = None,
+        health_interval: Optional[float] = None,
+        failure_threshold: Optional[int] = None,
+        reset_timeout: Optional[float] = None,
+        load_factor: Optional[float] = None,
+        replicas: int = 64,
+    ):
+        """
+        Initialize upstream pool.
+
+        Args:
+            urls: Ollama base URLs (OLLAMA_URLS, comma-separated; default OLLAMA_URL)
+            routing: "consistent_hash" or "least_outstanding" (OLLAMA_ROUTING, default consistent_hash)
+            health_interval: Seconds between health checks of each host (OLLAMA_HEALTH_INTERVAL, default 10)
+            failure_threshold: Consecutive failures that open a host's breaker (OLLAMA_BREAKER_FAILURES, default 3)
+            reset_timeout: Seconds an open breaker waits before a trial request (OLLAMA_BREAKER_RESET, default 30)
+            load_factor: Load, relative to the average, above which a hashed
+                request moves to the next host on the ring (OLLAMA_HASH_LOAD_FACTOR, default 1.25)
+            replicas: Points per host on the hash ring
+        """
+        if urls is None:
+            configured = os.getenv("OLLAMA_URLS") or os.getenv("OLLAMA_URL", "http://localhost:11434")
+            urls = configured.split(",")
+        urls = list(dict.fromkeys(url.strip().rstrip("/") for url in urls if url.strip()))
+        if not urls:
+            raise ValueError("At least one Ollama URL is required")
+        self.routing = routing or os.getenv("OLLAMA_ROUTING", "consistent_hash")
+        if self.routing not in ROUTING_STRATEGIES:
+            raise ValueError(f"OLLAMA_ROUTING must be one of: {', '.join(ROUTING_STRATEGIES)}")
+        self.health_interval = health_interval or float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+        failure_threshold = failure_threshold or int(os.getenv("OLLAMA_BREAKER_FAILURES", "3"))
+        reset_timeout = reset_timeout or float(os.getenv("OLLAMA_BREAKER_RESET", "30"))
+        self.load_factor = load_factor or float(os.getenv("OLLAMA_HASH_LOAD_FACTOR", "1.25"))
+        self.hosts = [UpstreamHost(url, CircuitBreaker(failure_threshold, reset_timeout)) for url in urls]
+        self._ring: List[tuple] = sorted(
+            (self._hash(f"{host.url}#{i}"), index)
+            for index, host in enumerate(self.hosts)
+            for i in range(replicas)
+        )
+        self._ring_keys = [point for point, _ in self._ring]
+        self._task: Optional[asyncio.Task] = None
+        for host in self.hosts:
+            OLLAMA_HOST_UP.set(1, host=host.url)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def available(self) -> List[UpstreamHost]:
+        """Hosts that may receive requests"""
+        hosts = [host for host in self.hosts if host.breaker.available()]
+        healthy = [host for host in hosts if host.healthy]
+        return healthy or hosts
+
+    def candidates(self, route_key: Optional[str] = None) -> List[UpstreamHost]:
+        """
+        Hosts to try for a request, in order: the routed host first, then failover targets.
+
+        Raises:
+            NoUpstreamAvailable: If every host's circuit breaker is open
+        """
+        hosts = self.available()
+        if not hosts:
+            LLM_UPSTREAM_ERRORS.inc(provider="ollama", type="no_host")
+            raise NoUpstreamAvailable(
+                f"No Ollama host available: circuit breakers open for {', '.join(h.url for h in self.hosts)}"
+            )
+        if route_key is None or self.routing == "least_outstanding" or len(hosts) == 1:
+            return sorted(hosts, key=lambda host: (host.outstanding, host.requests))
+
+        # Walk the ring clockwise from the key, visiting each host once
+        eligible = set(id(host) for host in hosts)
+        start = bisect.bisect(self._ring_keys, self._hash(route_key))
+        ordered = []
+        seen = set()
+        for i in range(len(self._ring)):
+            host = self.hosts[self._ring[(start + i) % len(self._ring)][1]]
+            if id(host) in eligible and id(host) not in seen:
+                seen.add(id(host))
+                ordered.append(host)
+                if len(ordered) == len(hosts):
+                    break
+        # Bounded loads: hosts over capacity keep their ring order but go last
+        total = sum(host.outstanding for host in hosts) + 1
+        capacity = math.ceil(self.load_factor * total / len(hosts))
+        return [host for host in ordered if host.outstanding < capacity] + [
+            host for host in ordered if host.outstanding >= capacity
+        ]
+
+    def preferred(self) -> UpstreamHost:
+        """Host for metadata requests; never raises"""
+        hosts = self.available()
+        return min(hosts, key=lambda host: host.outstanding) if hosts else self.hosts[0]
+
+    def begin(self, host: UpstreamHost):
+        """Record the start of a request to a host"""
+        host.breaker.on_request()
+        host.outstanding += 1
+        host.requests += 1
+        OLLAMA_HOST_OUTSTANDING.set(host.outstanding, host=host.url)
+
+    def end(self, host: UpstreamHost, error: Optional[BaseException] = None):
+        """Record the end of a request; errors that aren't the host's fault count as success"""
+        host.outstanding -= 1
+        OLLAMA_HOST_OUTSTANDING.set(host.outstanding, host=host.url)
+        if error is not None and is_host_failure(error):
+            host.failures += 1
+            host.last_error = f"{upstream_error_type(error)}: {error}"
+            OLLAMA_HOST_ERRORS.inc(host=host.url, type=upstream_error_type(error))
+            was_closed = host.breaker.state == "closed"
+            host.breaker.on_failure()
+            if was_closed and host.breaker.state == "open":
+                logger.warning(f"Circuit breaker opened for Ollama host {host.url}: {host.last_error}")
+        else:
+            if host.breaker.state != "closed":
+                logger.info(f"Circuit breaker closed for Ollama host {host.url}")
+            host.breaker.on_success()
+        OLLAMA_HOST_UP.set(1 if host.up else 0, host=host.url)
+
+    def start(self, check: Callable[[str], Awaitable[Any]]):
+        """
+        Start health checks; check(url) must raise for an unhealthy host.
+
+        With a single host there is nothing to route around, so it isn't checked.
+        """
+        if self._task is None and len(self.hosts) > 1:
+            self._task = asyncio.create_task(self._run(check))
+
+    async def aclose(self):
+        """Stop health checks"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self, check: Callable[[str], Awaitable[Any]]):
+        while True:
+            await asyncio.gather(*(self._check(host, check) for host in self.hosts))
+            await asyncio.sleep(self.health_interval)
+
+    async def _check(self, host: UpstreamHost, check: Callable[[str], Awaitable[Any]]):
+        started = time.perf_counter()
+        try:
+            await check(host.url)
+        except Exception as e:
+            if host.healthy:
+                logger.warning(f"Ollama host {host.url} failed its health check: {e}")
+            host.healthy = False
+            host.last_error = f"health: {e}"
+        else:
+            if not host.healthy:
+                logger.info(f"Ollama host {host.url} is healthy again")
+            host.healthy = True
+        host.checked_at = time.time()
+        host.check_seconds = time.perf_counter() - started
+        OLLAMA_HOST_UP.set(1 if host.up else 0, host=host.url)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-host load, health and breaker state"""
+        return {
+            "routing": self.routing,
+            "health_interval": self.health_interval if len(self.hosts) > 1 else None,
+            "hosts": [
+                {
+                    "url": host.url,
+                    "healthy": host.healthy,
+                    "breaker": host.breaker.state,
+                    "breaker_opened_total": host.breaker.opened,
+                    "outstanding": host.outstanding,
+                    "requests_total": host.requests,
+                    "failures_total": host.failures,
+                    "last_error": host.last_error,
+                    "check_ms": round(host.check_seconds * 1000, 1) if host.check_seconds is not None else None,
+                }
+                for host in self.hosts
+            ],
+        }